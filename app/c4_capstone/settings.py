@@ -91,6 +91,11 @@ DATABASES = {
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
         'PORT': '5432',
+        # Set DB_CONN_MAX_AGE (seconds) to keep connections, and the statements
+        # prepared on them, between requests; by default each request closes its own
+        # and dataset queries are not prepared, as nothing would be left to reuse
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -132,6 +137,56 @@ MEDIA_URL = '/static/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+# ETL jobs
+# Uploads submitted as background jobs are saved here until they are processed.
+
+ETL_UPLOAD_ROOT = os.environ.get('ETL_UPLOAD_ROOT', os.path.join(MEDIA_ROOT, 'etl_uploads'))
+ETL_MAX_CONCURRENT_JOBS = int(os.environ.get('ETL_MAX_CONCURRENT_JOBS', 2))
+
+# 'thread' runs jobs inside the API process; 'queue' leaves them in the database
+# for `manage.py etl_worker` processes, which split each upload into partitions.
+ETL_JOB_BACKEND = os.environ.get('ETL_JOB_BACKEND', 'thread')
+ETL_QUEUE_PARTITIONS = int(os.environ.get('ETL_QUEUE_PARTITIONS', 8))
+ETL_PARTITION_MAX_ATTEMPTS = int(os.environ.get('ETL_PARTITION_MAX_ATTEMPTS', 3))
+# Seconds after which work claimed by a silent worker may be taken over by another
+ETL_CLAIM_TIMEOUT = int(os.environ.get('ETL_CLAIM_TIMEOUT', 600))
+
+# Stage checkpoints of unfinished runs, so a failed run of a file resumes where it stopped
+ETL_CHECKPOINT_ROOT = os.environ.get('ETL_CHECKPOINT_ROOT', os.path.join(MEDIA_ROOT, 'etl_checkpoints'))
+
+# Drop folder watched by `manage.py watch_uploads`. Files are loaded once unchanged
+# for ETL_WATCH_SETTLE_SECONDS, with at most ETL_WATCH_MAX_BATCHES loading at once.
+ETL_WATCH_DIR = os.environ.get('ETL_WATCH_DIR', os.path.join(MEDIA_ROOT, 'etl_inbox'))
+ETL_WATCH_INTERVAL = float(os.environ.get('ETL_WATCH_INTERVAL', 1))
+ETL_WATCH_SETTLE_SECONDS = float(os.environ.get('ETL_WATCH_SETTLE_SECONDS', 2))
+ETL_WATCH_MAX_BATCHES = int(os.environ.get('ETL_WATCH_MAX_BATCHES', 2))
+
+# Dataset downloads fetch this many rows at a time from a server-side cursor; Parquet
+# and Arrow downloads are built from blocks of this many bytes of COPY output
+DATASET_EXPORT_BATCH_SIZE = int(os.environ.get('DATASET_EXPORT_BATCH_SIZE', 5000))
+DATASET_EXPORT_BLOCK_SIZE = int(os.environ.get('DATASET_EXPORT_BLOCK_SIZE', 4 * 1024 * 1024))
+
+# Rendered dataset results are cached until the next ETL load: up to this many bytes
+# per process in memory and, if a directory is set, in files shared by all workers
+DATASET_CACHE_MAX_BYTES = int(os.environ.get('DATASET_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+DATASET_CACHE_DIR = os.environ.get('DATASET_CACHE_DIR', '')
+
+# Every dataset is written here as Parquet and Arrow files after each ETL load, and
+# downloads of those formats are sent straight from the files. Empty to switch off.
+DATASET_SNAPSHOT_ROOT = os.environ.get('DATASET_SNAPSHOT_ROOT', os.path.join(MEDIA_ROOT, 'dataset_snapshots'))
+
+# Batch downloads run their datasets' queries on this many threads at once, shared by
+# every request of a process, each with its own database connection: keep processes
+# x (1 + DATASET_BATCH_WORKERS) below Postgres' max_connections. Each dataset's part is
+# held in memory until it is sent and fails once it is larger than the byte limit
+DATASET_BATCH_WORKERS = int(os.environ.get('DATASET_BATCH_WORKERS', 4))
+DATASET_BATCH_MAX_PART_BYTES = int(os.environ.get('DATASET_BATCH_MAX_PART_BYTES', 32 * 1024 * 1024))
+
+# Step profiles of this many recent runs are kept. Tracing peak memory slows
+# Python-heavy steps such as workbook parsing, so it can be switched off.
+ETL_PROFILE_HISTORY = int(os.environ.get('ETL_PROFILE_HISTORY', 50))
+ETL_PROFILE_MEMORY = bool(int(os.environ.get('ETL_PROFILE_MEMORY', 1)))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_fullprofile'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='motivation',
+            constraint=models.UniqueConstraint(fields=('student', 'aim'), name='unique_motivation_student_aim'),
+        ),
+        migrations.AddConstraint(
+            model_name='outcomes',
+            constraint=models.UniqueConstraint(fields=('student',), name='unique_outcomes_student'),
+        ),
+        migrations.AddConstraint(
+            model_name='registration',
+            constraint=models.UniqueConstraint(fields=('student',), name='unique_registration_student'),
+        ),
+    ]
@@ -98,6 +98,11 @@ class Motivation(models.Model):
     aim = models.ForeignKey(Aim, on_delete=models.CASCADE)
     motivation = models.TextField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'aim'], name='unique_motivation_student_aim')
+        ]
+
 class Registration(models.Model):
     student = models.ForeignKey(
         Student, 
@@ -108,6 +113,11 @@ class Registration(models.Model):
     date = models.DateField()
     time = models.TimeField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student'], name='unique_registration_student')
+        ]
+
 class Outcomes(models.Model):
     student = models.ForeignKey(
         Student, 
@@ -119,6 +129,11 @@ class Outcomes(models.Model):
     aptitude_score = models.FloatField()
     graduated = models.BooleanField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student'], name='unique_outcomes_student')
+        ]
+
 class FullProfile(models.Model):
     student=models.ForeignKey(Student, on_delete=models.CASCADE)
     experience=models.ForeignKey(Experience, on_delete=models.CASCADE)
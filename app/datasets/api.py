@@ -1,14 +1,28 @@
+import json
+import gzip
+import uuid
 import logging
-from ninja import Router
-from typing import List
+import pyarrow as pa
+from concurrent.futures import as_completed
+from ninja import Router, Query
+from typing import List, Literal, Optional
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import DatabaseError
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
 from core.utils import DatabaseConnection
 from sqlalchemy import create_engine
 
 from .models import Dataset
+from .schemas import DatasetBatch
+from . import batch as batch_queries
 
-from .utils import run_query, rows_to_csv
+from .cache import result_cache, result_version, data_version
+from .materialized import refresh_in_progress
+from .snapshots import open_snapshot
+from .pushdown import DatasetQuery, InvalidDatasetQuery
+from .parameters import bind_parameters, bind_query, parameters_key, parameter_schema, run_prepared
+from .utils import (stream_query, csv_stream, json_rows_query, ndjson_stream, query_schema,
+    arrow_batches, parquet_stream, arrow_stream)
 
 
 logger = logging.getLogger(__name__)
@@ -28,7 +42,8 @@ def list_datasets(request):
                 {
                     "dataset_name": obj.name, 
                     "category": obj.category,
-                    "description": obj.description
+                    "description": obj.description,
+                    "parameters": obj.parameters,
                 } 
                 for obj in datasets
             ]
@@ -49,34 +64,318 @@ def list_datasets(request):
             status=500
         )
 
+# Download format -> file extension and content type
+export_formats = {
+    "csv": ("csv", "text/csv"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "arrow": ("arrows", "application/vnd.apache.arrow.stream"),
+    "ndjson": ("ndjson", "application/x-ndjson"),
+    "json": ("json", "application/json"),
+}
+
+def _export_content(dataset, format, compress, pushdown, values):
+    """
+    Return a dataset download as (content, next page cursor). The content is
+    the stored bytes or an open file when a snapshot or cached result of the
+    current version exists, otherwise an iterator of chunks that runs the
+    query as it is consumed, after the query has been checked for SQL errors.
+    """
+    extension = export_formats[format][0]
+    gzipped = compress and format in ("csv", "ndjson", "json")
+    # Compressed Parquet and Arrow keep their file name but differ in content
+    variant = f"{extension}.gz" if gzipped else f"{extension}.zst" if compress else extension
+    variant += parameters_key(values)
+    version = result_version(dataset)
+    cached = None
+    # Uncompressed Parquet and Arrow downloads come from the snapshot written after the last load
+    if not pushdown and not compress:
+        cached = open_snapshot(dataset, format, version)
+    if not pushdown and cached is None:
+        cached = result_cache.get(dataset.name, variant, version)
+    if cached is not None:
+        return cached, None
+
+    query, params = bind_query(dataset, values)
+    json_rows = format == "ndjson"
+    if pushdown:
+        available = query_schema(query, params).names
+        compiled = pushdown.compile(
+            query, available, dataset.unique_key, query_params=params, json_rows=json_rows
+        )
+        if compiled.limit is not None:
+            return _page_content(pushdown, compiled, format, compress)
+        query, params = compiled.sql, compiled.params
+    elif json_rows:
+        query = json_rows_query(query)
+
+    if format == "json":
+        header, rows = run_prepared(query, params)
+        body = json.dumps({"columns": header, "rows": rows}, cls=DjangoJSONEncoder).encode()
+        content = iter([gzip.compress(body) if compress else body])
+    elif format in ("parquet", "arrow"):
+        # Describing the query also reports SQL errors before streaming starts
+        schema = query_schema(query, params)
+        writer = parquet_stream if format == "parquet" else arrow_stream
+        content = writer(schema, arrow_batches(query, schema, params), compress=compress)
+    else:
+        # Describing the query reports SQL errors before streaming starts; the
+        # query itself only runs as the response is sent
+        header = query_schema(query, params).names
+        if json_rows:
+            content = ndjson_stream(stream_query(query, params=params), compress=compress)
+        else:
+            content = csv_stream(header, stream_query(query, params=params), compress=compress)
+
+    if not pushdown:
+        content = result_cache.capture(dataset.name, variant, version, content)
+    return content, None
+
+
+def _page_content(pushdown, compiled, format, compress):
+    """
+    Fetch one page of a paged download and return it as (content, next page
+    cursor). Its query returns the row after the page too, and the order
+    values at the end of every row, so one query gives both; a page holds at
+    most `limit` rows, so it is read in full before it is sent.
+    """
+    keys, limit = compiled.cursor_columns, compiled.limit
+    if format in ("parquet", "arrow"):
+        schema = query_schema(compiled.sql, compiled.params)
+        table = pa.Table.from_batches(list(arrow_batches(compiled.sql, schema, compiled.params)), schema)
+        columns = len(schema) - keys
+        order_values = list(zip(*(table.column(i).to_pylist() for i in range(columns, len(schema)))))
+        page = table.slice(0, limit).select(list(range(columns)))
+        writer = parquet_stream if format == "parquet" else arrow_stream
+        content = writer(page.schema, page.to_batches(), compress=compress)
+        return content, pushdown.next_cursor(compiled, order_values)
+
+    header, rows = run_prepared(compiled.sql, compiled.params)
+    next_cursor = pushdown.next_cursor(compiled, rows)
+    header, rows = header[:-keys], [row[:-keys] for row in rows[:limit]]
+    if format == "json":
+        body = json.dumps({"columns": header, "rows": rows}, cls=DjangoJSONEncoder).encode()
+        content = iter([gzip.compress(body) if compress else body])
+    elif format == "ndjson":
+        content = ndjson_stream([rows], compress=compress)
+    else:
+        content = csv_stream(header, [rows], compress=compress)
+    return content, next_cursor
+
+
 @router.get("/download/{dataset_name}")
-def export_dataset(request, dataset_name: str):
+def export_dataset(
+    request,
+    dataset_name: str,
+    format: Literal["csv", "parquet", "arrow", "ndjson", "json"] = "csv",
+    compress: bool = False,
+    columns: Optional[str] = None,
+    where: List[str] = Query(None),
+    order_by: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+):
     """
-    Expose any predefined dataset as CSV (default) or JSON.
-    Example:
-      GET /datasets/students_by_country?format=json
+    Stream any predefined dataset as CSV (default), Parquet, an Arrow IPC
+    stream or newline-delimited JSON, or return a small one as a JSON object
+    of "columns" and "rows", fetched with a prepared statement that a
+    persistent database connection (DB_CONN_MAX_AGE) keeps between calls.
+    Datasets that declare parameters take them as further query parameters,
+    by name, validated against their declared types (see
+    /datasets/{dataset_name}/parameters); missing ones take their defaults.
+    Rows are read in batches and written to the response as they arrive, so
+    memory use does not grow with the dataset. Parquet and Arrow columns take
+    their types from the Postgres column types and are built from COPY output
+    without converting each row to Python objects.
+    - compress: gzip CSV, NDJSON and JSON downloads (as .csv.gz / .ndjson.gz / .json.gz);
+      compress Parquet and Arrow column data with zstd.
+    Each download is cached until the next ETL load or an edit of the
+    dataset's query, so repeated downloads are served without running it.
+    Uncompressed Parquet and Arrow downloads are sent from the snapshot files
+    written after each load, once the current version's snapshot exists.
+    The following are applied by Postgres around the dataset's query, and
+    such downloads are always run rather than cached:
+    - columns: comma-separated output columns to return.
+    - where: repeatable filter `column:op:value`; op is eq, ne, lt, le, gt,
+      ge, in (comma-separated values) or null (true/false).
+    - order_by: comma-separated columns, prefixed with `-` for descending.
+    - limit: page size. Pages are ordered by `order_by` and then the
+      dataset's unique key; if another page follows, its cursor is sent in
+      the X-Next-Cursor header.
+    - cursor: X-Next-Cursor of the previous page, with the same order_by.
+    Examples:
+      GET /datasets/download/complete_student_profile?format=parquet
+      GET /datasets/download/complete_student_profile?columns=student_id,country&where=track:eq:Data Science&limit=100
     """
-    file_name = f"{dataset_name}.csv"
+    extension, content_type = export_formats[format]
+    gzipped = compress and format in ("csv", "ndjson", "json")
+    file_name = f"{dataset_name}.{extension}.gz" if gzipped else f"{dataset_name}.{extension}"
 
     try:
         logger.info(f"Running dataset query: '{dataset_name}'")
+        pushdown = DatasetQuery(columns, where, order_by, limit, cursor)
         dataset = Dataset.objects.get(name=dataset_name)
-        columns, rows = run_query(dataset.query )
-
-        # Default: CSV
-        csv_data = rows_to_csv(columns, rows)
-        logger.info(f"Export successful: '{file_name}'")
-        response = HttpResponse(csv_data, content_type="text/csv")
+        values = bind_parameters(dataset, request.GET)
+        content_type = "application/gzip" if gzipped else content_type
+        content, next_cursor = _export_content(dataset, format, compress, pushdown, values)
+        if isinstance(content, bytes):
+            response = HttpResponse(content, content_type=content_type)
+            logger.info(f"Serving stored export: '{file_name}'")
+        elif hasattr(content, "read"):
+            # Snapshots and shared cache files are sent with the server's file wrapper, e.g. sendfile under uWSGI
+            response = FileResponse(content, content_type=content_type)
+            logger.info(f"Serving stored export: '{file_name}'")
+        else:
+            response = StreamingHttpResponse(content, content_type=content_type)
+            logger.info(f"Streaming export: '{file_name}'")
         response["Content-Disposition"] = f'attachment; filename="{file_name}"'
+        if next_cursor is not None:
+            response["X-Next-Cursor"] = next_cursor
         return response
     
     except Dataset.DoesNotExist:
             logger.warning(f"Invalid dataset request: '{dataset_name}'")
             return HttpResponse(f"No dataset object of name '{dataset_name}' exists in the database", status=400)
 
+    except InvalidDatasetQuery as e:
+        logger.warning(f"Invalid query options for dataset '{dataset_name}': {e}")
+        return HttpResponse(str(e), status=400)
+
     except Exception as e:
         logger.error(f"Dataset export error for '{file_name}': {e}", exc_info=True)
         return HttpResponse(
             content=f"Failed to export dataset '{dataset_name}'. Details: {e}",
             status=500,
-        )
\ No newline at end of file
+        )
+
+
+def _batch_part(dataset, format, compress, pushdown, values):
+    # Runs on a batch thread, so the whole result is read there on that thread's connection
+    content, next_cursor = _export_content(dataset, format, compress, pushdown, values)
+    return batch_queries.read_part(content), next_cursor
+
+
+def _multipart(boundary, format, compress, names, futures):
+    extension, content_type = export_formats[format]
+    gzipped = compress and format in ("csv", "ndjson", "json")
+    index = {future: i for i, future in enumerate(futures)}
+    # Parts are sent as their queries finish, so a fast dataset does not wait for a slow one
+    for future in as_completed(futures):
+        name = names[index[future]]
+        headers = {"Content-ID": f"<{index[future]}>"}
+        try:
+            body, next_cursor = future.result()
+            headers["Content-Type"] = "application/gzip" if gzipped else content_type
+            file_name = f"{name}.{extension}.gz" if gzipped else f"{name}.{extension}"
+            headers["Content-Disposition"] = f'attachment; name="{name}"; filename="{file_name}"'
+            if next_cursor is not None:
+                headers["X-Next-Cursor"] = next_cursor
+        except InvalidDatasetQuery as e:
+            logger.warning(f"Invalid query options for dataset '{name}' in batch: {e}")
+            headers.update({"Content-Type": "text/plain", "Content-Disposition": f'inline; name="{name}"', "X-Status": "400"})
+            body = str(e).encode()
+        except batch_queries.PartTooLarge as e:
+            logger.warning(f"Dataset '{name}' is too large for a batch: {e}")
+            headers.update({"Content-Type": "text/plain", "Content-Disposition": f'inline; name="{name}"', "X-Status": "413"})
+            body = f"{e}; download it from /datasets/download/{name} or ask for fewer rows.".encode()
+        except Exception as e:
+            logger.error(f"Dataset export error for '{name}' in batch: {e}", exc_info=True)
+            headers.update({"Content-Type": "text/plain", "Content-Disposition": f'inline; name="{name}"', "X-Status": "500"})
+            body = f"Failed to export dataset '{name}'. Details: {e}".encode()
+        head = "".join(f"{key}: {value}\r\n" for key, value in headers.items())
+        yield f"--{boundary}\r\n{head}\r\n".encode() + body + b"\r\n"
+    yield f"--{boundary}--\r\n".encode()
+
+
+@router.post("/batch")
+def export_batch(request, batch: DatasetBatch):
+    """
+    Download several datasets in one request, as a multipart/mixed response
+    with one part per dataset, all in the same format (JSON by default).
+    Every dataset takes the options of /datasets/download/{dataset_name}:
+    columns, where, order_by, limit and cursor, and its own parameters.
+    The datasets' queries run at once on separate database connections, so
+    the batch takes about as long as its slowest dataset, and each part is
+    sent as soon as its query finishes. Parts name their dataset in
+    Content-Disposition and their position in the batch in Content-ID; a
+    part whose query fails has a text/plain body and its status in X-Status.
+    Each part is held in memory until it is sent, so one larger than
+    DATASET_BATCH_MAX_PART_BYTES fails with X-Status 413; page it with limit
+    or download it on its own instead.
+    Example:
+      POST /datasets/batch
+      {"datasets": [{"name": "graduation_rate_by_track"},
+                    {"name": "complete_student_profile", "columns": "student_id,track", "limit": 100}]}
+    """
+    names = [item.name for item in batch.datasets]
+    try:
+        parts = []
+        for item in batch.datasets:
+            pushdown = DatasetQuery(item.columns, item.where, item.order_by, item.limit, item.cursor)
+            dataset = Dataset.objects.get(name=item.name)
+            parts.append((dataset, pushdown, bind_parameters(dataset, item.parameters)))
+    except Dataset.DoesNotExist:
+        logger.warning(f"Invalid dataset in batch: '{item.name}'")
+        return HttpResponse(f"No dataset object of name '{item.name}' exists in the database", status=400)
+    except InvalidDatasetQuery as e:
+        logger.warning(f"Invalid query options for dataset '{item.name}' in batch: {e}")
+        return HttpResponse(str(e), status=400)
+
+    logger.info(f"Running batch of datasets: {', '.join(names)}")
+    futures = [
+        batch_queries.submit(_batch_part, dataset, batch.format, batch.compress, pushdown, values)
+        for dataset, pushdown, values in parts
+    ]
+    boundary = uuid.uuid4().hex
+    return StreamingHttpResponse(
+        _multipart(boundary, batch.format, batch.compress, names, futures),
+        content_type=f'multipart/mixed; boundary="{boundary}"',
+    )
+
+
+@router.get("/cache")
+def dataset_cache_metrics(request):
+    """
+    Return this worker's dataset result cache counts: memory and shared file
+    hits, misses, hit rate, evictions and the bytes held in memory.
+    """
+    return result_cache.metrics()
+
+
+@router.get("/views")
+def materialized_views(request):
+    """
+    Return the refresh state of every materialized dataset: when its view was
+    last refreshed and how long that took, the data version it reflects and
+    how many loads it is behind. "refreshing" is true while this worker has a
+    refresh running or waiting.
+    """
+    current = data_version()
+    refreshing = refresh_in_progress()
+    return [
+        {
+            "dataset_name": obj.name,
+            "view": obj.view_name,
+            "refreshed_at": obj.refreshed_at,
+            "refresh_seconds": obj.refresh_seconds,
+            "refreshed_version": obj.refreshed_version,
+            "data_version": current,
+            "versions_behind": current - (obj.refreshed_version or 0),
+            "stale": (obj.refreshed_version or 0) < current,
+            "refreshing": refreshing,
+            "error": obj.refresh_error or None,
+        }
+        for obj in Dataset.objects.filter(materialized=True).order_by("name")
+    ]
+
+
+@router.get("/{dataset_name}/parameters")
+def dataset_parameters(request, dataset_name: str):
+    """
+    Return the JSON schema of the parameters a dataset takes: their types,
+    defaults and descriptions.
+    """
+    try:
+        dataset = Dataset.objects.get(name=dataset_name)
+    except Dataset.DoesNotExist:
+        return HttpResponse(f"No dataset object of name '{dataset_name}' exists in the database", status=400)
+    return parameter_schema(dataset).model_json_schema()
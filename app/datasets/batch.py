@@ -0,0 +1,100 @@
+"""
+Concurrent dataset queries for batch downloads.
+Each dataset of a batch runs on one of DATASET_BATCH_WORKERS threads, each
+with its own database connection, so a batch takes about as long as its
+slowest query rather than the sum of them all. The threads live for the whole
+process and treat their connections as request threads do: with
+DB_CONN_MAX_AGE set, a connection and the statements prepared on it are kept
+between batches; otherwise each task closes its connection when it ends.
+The threads and their connections are shared by every batch the process
+serves, and each part is read in full on its thread, up to
+DATASET_BATCH_MAX_PART_BYTES.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+
+workers = settings.DATASET_BATCH_WORKERS
+executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dataset-batch")
+# Held by each task from submission until it finishes, so however many batches
+# arrive at once, no more than `workers` tasks and their results are in hand
+slots = threading.BoundedSemaphore(workers)
+
+
+class PartTooLarge(Exception):
+    """Raised when a dataset's part of a batch exceeds DATASET_BATCH_MAX_PART_BYTES."""
+
+
+def _run(func, args):
+    # Drop a connection that has expired or broken since the last batch, as Django does around each request
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+def submit(func, *args):
+    """
+    Run `func(*args)` on a batch thread and return its future. Waits while
+    the process already has `workers` tasks unfinished.
+    """
+    slots.acquire()
+    try:
+        future = executor.submit(_run, func, args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+def read_part(content):
+    """
+    Read a part's content, bytes, an open file or an iterator of chunks, in
+    full. Raises PartTooLarge, without reading further, once it passes
+    DATASET_BATCH_MAX_PART_BYTES.
+    """
+    limit = settings.DATASET_BATCH_MAX_PART_BYTES
+    if isinstance(content, bytes):
+        size = len(content)
+    elif hasattr(content, "read"):
+        with content:
+            size = os.fstat(content.fileno()).st_size
+            if size <= limit:
+                return content.read()
+    else:
+        chunks, size = [], 0
+        try:
+            for chunk in content:
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > limit:
+                    break
+        finally:
+            if hasattr(content, "close"):
+                content.close()
+        content = b"".join(chunks)
+    if size > limit:
+        raise PartTooLarge(f"The part is larger than {limit} bytes")
+    return content
+
+
+def close_connections():
+    """
+    Close the connections held by the batch threads, e.g. before the database
+    is dropped at the end of a test run.
+    """
+    # Every thread has to hold one of the tasks at once, so each closes its own connection
+    barrier = threading.Barrier(workers)
+
+    def close():
+        barrier.wait()
+        connections.close_all()
+
+    for future in [executor.submit(close) for _ in range(workers)]:
+        future.result()
@@ -0,0 +1,232 @@
+"""
+Cache of rendered dataset results.
+A result is the full body of one dataset download (e.g. the gzipped CSV or the
+Parquet file), keyed by dataset name and format. Each entry carries the data
+version it was built at: the DataVersion counter, which every ETL load bumps
+when it commits, and a hash of the dataset's query, so an entry goes stale as
+soon as new data is loaded or the query is edited.
+Results are kept in two tiers:
+- memory: an LRU of at most DATASET_CACHE_MAX_BYTES per process;
+- files: with DATASET_CACHE_DIR set, one file per result in a directory
+  shared by every worker process, served without reading it into Python.
+"""
+import os
+import glob
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection
+
+from .models import DataVersion
+from .parameters import bind_parameters, bind_query, parameters_key
+from .utils import query_schema, arrow_batches, parquet_stream
+
+
+logger = logging.getLogger(__name__)
+
+
+def data_version(using=DEFAULT_DB_ALIAS) -> int:
+    """Return the current data version of database `using`, 0 before the first load."""
+    return DataVersion.objects.using(using).filter(pk=1).values_list("version", flat=True).first() or 0
+
+
+def bump_data_version():
+    """Mark every cached result stale. Call once the loaded rows are committed, or inside their transaction."""
+    table = DataVersion._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (id, version, updated_at) VALUES (1, 1, now()) "
+            f"ON CONFLICT (id) DO UPDATE SET version = {table}.version + 1, updated_at = now()"
+        )
+
+
+def result_version(dataset) -> str:
+    """
+    Version of a dataset's result: the data version it reflects and a hash of
+    the SQL that reads it. A materialized dataset reflects the data version of
+    its view's last refresh rather than the latest load.
+    """
+    digest = hashlib.sha256(dataset.source_query.encode()).hexdigest()[:16]
+    version = dataset.refreshed_version if dataset.materialized else data_version()
+    return f"{version}-{digest}"
+
+
+class ResultCache:
+    """
+    Two-tier cache of dataset results. Limits are read from settings on every
+    call. Hit and miss counts are kept per process and returned by `metrics`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._counts = Counter()
+
+    @property
+    def max_bytes(self):
+        return settings.DATASET_CACHE_MAX_BYTES
+
+    @property
+    def directory(self):
+        return settings.DATASET_CACHE_DIR or None
+
+    def _path(self, name, variant, version):
+        return os.path.join(self.directory, f"{quote(name, safe='')}.{variant}@{version}")
+
+    def get(self, name, variant, version):
+        """
+        Return the cached result as bytes from memory, an open binary file
+        from the shared directory, or None on a miss.
+        """
+        key = (name, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self._counts["memory_hits"] += 1
+                return entry[1]
+            if entry is not None:
+                self._drop(key)
+
+        if self.directory:
+            try:
+                result = open(self._path(name, variant, version), "rb")
+            except FileNotFoundError:
+                pass
+            else:
+                self._count("file_hits")
+                return result
+
+        self._count("misses")
+        return None
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def _drop(self, key):
+        _, data = self._entries.pop(key)
+        self._bytes -= len(data)
+
+    def _remember(self, key, version, data):
+        # Results over a quarter of the budget would push out too much else
+        if len(data) > self.max_bytes // 4:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (version, data)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._counts["evictions"] += 1
+            self._counts["stored"] += 1
+
+    def _publish(self, name, variant, version, temporary):
+        path = self._path(name, variant, version)
+        # Readers only ever see a complete file
+        os.replace(temporary, path)
+        for stale in glob.glob(f"{glob.escape(path.rsplit('@', 1)[0])}@*"):
+            if stale != path:
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+
+    def capture(self, name, variant, version, chunks):
+        """
+        Pass `chunks` through unchanged and cache their concatenation once the
+        last chunk has been produced. A stream that is closed early, e.g. by a
+        client disconnecting, is not cached.
+        """
+        limit = self.max_bytes // 4
+        parts, size = [], 0
+        temporary = None
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            target = os.fdopen(handle, "wb")
+        try:
+            for chunk in chunks:
+                if parts is not None:
+                    parts.append(chunk)
+                    size += len(chunk)
+                    if size > limit:
+                        parts = None
+                if temporary is not None:
+                    target.write(chunk)
+                yield chunk
+
+            if parts is not None:
+                self._remember((name, variant), version, b"".join(parts))
+            if temporary is not None:
+                target.close()
+                self._publish(name, variant, version, temporary)
+                temporary = None
+        finally:
+            if temporary is not None:
+                target.close()
+                os.remove(temporary)
+
+    def clear(self):
+        """Empty the memory tier, the shared directory and the counts."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._counts.clear()
+        if self.directory:
+            for path in glob.glob(os.path.join(self.directory, "*@*")):
+                os.remove(path)
+
+    def metrics(self):
+        """Hit, miss and size counts of this process's cache."""
+        with self._lock:
+            counts = dict(self._counts)
+            entries, size = len(self._entries), self._bytes
+        lookups = sum(counts.get(key, 0) for key in ("memory_hits", "file_hits", "misses"))
+        hits = counts.get("memory_hits", 0) + counts.get("file_hits", 0)
+        return {
+            "memory_hits": counts.get("memory_hits", 0),
+            "file_hits": counts.get("file_hits", 0),
+            "misses": counts.get("misses", 0),
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+            "stored": counts.get("stored", 0),
+            "evictions": counts.get("evictions", 0),
+            "memory_entries": entries,
+            "memory_bytes": size,
+            "memory_max_bytes": self.max_bytes,
+            "shared_directory": self.directory,
+        }
+
+
+result_cache = ResultCache()
+
+
+def dataset_frame(dataset):
+    """
+    Return a dataset's result as a pandas DataFrame, read from its cached
+    Parquet download when there is one and cached for the next caller if not.
+    Datasets that take parameters are run with their defaults.
+    """
+    values = bind_parameters(dataset, {})
+    variant = f"parquet{parameters_key(values)}"
+    version = result_version(dataset)
+    cached = result_cache.get(dataset.name, variant, version)
+    if cached is None:
+        query, params = bind_query(dataset, values)
+        schema = query_schema(query, params)
+        batches = parquet_stream(schema, arrow_batches(query, schema, params))
+        chunks = result_cache.capture(dataset.name, variant, version, batches)
+        cached = b"".join(chunks)
+    if isinstance(cached, bytes):
+        return pq.read_table(pa.BufferReader(cached)).to_pandas()
+    with cached:
+        return pq.read_table(cached).to_pandas()
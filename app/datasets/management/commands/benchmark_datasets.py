@@ -0,0 +1,79 @@
+"""
+Django command to benchmark the per-call latency of small dataset queries run
+as prepared statements.
+"""
+import psycopg
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from datasets.models import Dataset
+from datasets.parameters import bind_parameters, bind_query
+from pipeline.benchmarks import time_call
+
+# Small, frequently requested datasets measured when none are named
+default_datasets = [
+    "avg_aptitude_score_by_track",
+    "graduation_rate_by_track",
+    "graduation_rate_by_track_for_intake",
+    "referral_analysis",
+]
+
+
+class Command(BaseCommand):
+    """Django benchmark_datasets command class."""
+    help = "Compare the per-call latency of dataset queries with and without prepared statements."
+
+    def add_arguments(self, parser):
+        parser.add_argument("datasets", nargs="*", help=f"Datasets to measure (default: {', '.join(default_datasets)}).")
+        parser.add_argument("--calls", type=int, default=1000, help="Calls per measurement.")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the best is reported.")
+        parser.add_argument(
+            "--param", action="append", default=[], metavar="NAME=VALUE",
+            help="Parameter value for parameterised datasets; may be repeated.",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        names = options["datasets"] or default_datasets
+        given = dict(item.split("=", 1) for item in options["param"])
+        datasets = {dataset.name: dataset for dataset in Dataset.objects.filter(name__in=names)}
+        missing = [name for name in names if name not in datasets]
+        if missing:
+            raise CommandError(f"Unknown datasets: {', '.join(missing)}")
+
+        calls = options["calls"]
+        self.stdout.write(f"{'dataset':<38} {'client-bound':>13} {'server-bound':>13} {'prepared':>13} {'saving':>8}")
+        for name in names:
+            dataset = datasets[name]
+            query, params = bind_query(dataset, bind_parameters(dataset, given))
+            # The first call prepares the statement; later ones reuse it
+            self._prepared(query, params)
+
+            timings = [
+                time_call(self._run_calls, method, query, params, calls, repeat=options["repeat"])[0] / calls
+                for method in (self._client_bound, self._server_bound, self._prepared)
+            ]
+            client, server, prepared = (seconds * 1e6 for seconds in timings)
+            self.stdout.write(
+                f"{name:<38} {client:11.1f}us {server:11.1f}us {prepared:11.1f}us {1 - prepared / client:8.1%}"
+            )
+
+    def _run_calls(self, method, query, params, calls):
+        for _ in range(calls):
+            method(query, params)
+
+    def _client_bound(self, query, params):
+        # What a Django cursor does: parameters are merged into the SQL, parsed and planned on every call
+        with connection.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+    def _server_bound(self, query, params, prepare=False):
+        connection.ensure_connection()
+        with psycopg.Cursor(connection.connection) as cursor:
+            cursor.execute(query, params, prepare=prepare)
+            return cursor.fetchall()
+
+    def _prepared(self, query, params):
+        # As run_prepared does on a persistent connection; this command keeps its connection throughout
+        return self._server_bound(query, params, prepare=True)
@@ -4,6 +4,8 @@ from django.core.management.base import BaseCommand, CommandError
 from django.db import connections, DEFAULT_DB_ALIAS
 from django.db.migrations.executor import MigrationExecutor
 from datasets.models import Dataset 
+from datasets.materialized import create_view, drop_view, view_exists
+from datasets.parameters import check_definition
 
 def wait_for_app_migrations(
     apps: Iterable[str],
@@ -77,6 +79,8 @@ DATASETS = {
   'query': 'SELECT r.referral, COUNT(s.student_id) AS student_count\n        FROM core_student s\n        LEFT JOIN core_referral r ON s.referral_id = r.id\n        GROUP BY r.referral\n        ORDER BY student_count DESC;'},
  'complete_student_profile': {'description': 'Full student profile including demographics, registration, outcomes, and motivations.',
   'category': 'Combined',
+  'materialized': True,
+  'unique_key': ['student_id', 'aim'],
   'query': 'SELECT\n            s.student_id,\n            ar.age_range,\n            c.country,\n            e.experience,\n            r.referral,\n            sl.skill_level,\n            sl.skill_description,\n            t.track,\n            ha.hours_available,\n            s.gender,\n            reg.date AS registration_date,\n            reg.time AS registration_time,\n            o.completed_aptitude,\n            o.aptitude_score,\n            o.graduated,\n            m.motivation,\n            a.aim\n        FROM core_student s\n        LEFT JOIN core_agerange ar ON s.age_range_id = ar.id\n        LEFT JOIN core_country c ON s.country_id = c.id\n        LEFT JOIN core_experience e ON s.experience_id = e.id\n        LEFT JOIN core_referral r ON s.referral_id = r.id\n        LEFT JOIN core_skilllevel sl ON s.skill_level_id = sl.id\n        LEFT JOIN core_track t ON s.track_id = t.id\n        LEFT JOIN core_hoursavailable ha ON s.hours_available_id = ha.id\n        LEFT JOIN core_registration reg ON s.student_id = reg.student_id\n        LEFT JOIN core_outcomes o ON s.student_id = o.student_id\n        LEFT JOIN core_motivation m ON s.student_id = m.student_id\n        LEFT JOIN core_aim a ON m.aim_id = a.id;'},
  'students_without_aptitude': {'description': 'List of students who have not completed aptitude tests.',
   'category': 'Analytics',
@@ -87,8 +91,15 @@ DATASETS = {
  'graduation_rate_by_track': {'description': 'Graduation rate per track.',
   'category': 'Analytics',
   'query': 'SELECT t.track,\n               COUNT(CASE WHEN o.graduated THEN 1 END)::float / COUNT(*) * 100 AS graduation_rate\n        FROM core_student s\n        LEFT JOIN core_track t ON s.track_id = t.id\n        LEFT JOIN core_outcomes o ON s.student_id = o.student_id\n        GROUP BY t.track\n        ORDER BY graduation_rate DESC;'},
+ 'graduation_rate_by_track_for_intake': {'description': 'Graduation rate per track for students who registered within a date window.',
+  'category': 'Analytics',
+  'parameters': {'registered_from': {'type': 'date', 'default': None, 'description': 'First registration date to include.'},
+   'registered_before': {'type': 'date', 'default': None, 'description': 'Registration date to stop before.'}},
+  'query': 'SELECT t.track,\n               COUNT(CASE WHEN o.graduated THEN 1 END)::float / COUNT(*) * 100 AS graduation_rate\n        FROM core_student s\n        JOIN core_registration reg ON s.student_id = reg.student_id\n        LEFT JOIN core_track t ON s.track_id = t.id\n        LEFT JOIN core_outcomes o ON s.student_id = o.student_id\n        WHERE (:registered_from IS NULL OR reg.date >= :registered_from)\n          AND (:registered_before IS NULL OR reg.date < :registered_before)\n        GROUP BY t.track\n        ORDER BY t.track;'},
  'aptitude_summary_by_track': {'description': 'Statistical summary of aptitude test scores for each track, including the five-number summary and the mean.',
   'category': 'Analytics',
+  'materialized': True,
+  'unique_key': ['track'],
   'query': 'SELECT \n        t.track,\n        MIN(o.aptitude_score) AS min_score,\n        percentile_cont(0.25) WITHIN GROUP (ORDER BY o.aptitude_score) AS q1,\n        percentile_cont(0.5) WITHIN GROUP (ORDER BY o.aptitude_score) AS median,\n        percentile_cont(0.75) WITHIN GROUP (ORDER BY o.aptitude_score) AS q3,\n        MAX(o.aptitude_score) AS max_score,\n        AVG(o.aptitude_score) AS mean_score\n    FROM core_outcomes o\n    LEFT JOIN core_student s ON o.student_id = s.student_id\n    LEFT JOIN core_track t ON s.track_id = t.id\n    WHERE o.aptitude_score IS NOT NULL\n    GROUP BY t.track\n    ORDER BY t.track;'}
 }
 
@@ -100,12 +111,16 @@ CATEGORY_MAP = {
 }
 
 class Command(BaseCommand):
-    help = "Load or update Dataset rows from the in-file DATASETS mapping."
+    help = (
+        "Load or update Dataset rows from the in-file DATASETS mapping. Datasets marked "
+        "'materialized' get a materialized view, rebuilt when their query or key changes."
+    )
 
     def add_arguments(self, parser):
         parser.add_argument("--wait", type=int, default=120, help="Max seconds to wait for migrations.")
         parser.add_argument("--poll", type=int, default=5, help="Polling interval (seconds).")
         parser.add_argument("--alias", default=DEFAULT_DB_ALIAS, help="Database alias to use.")
+        parser.add_argument("--rebuild-views", action="store_true", help="Rebuild every materialized view.")
 
     def handle(self, *args, **options):
         alias = options["alias"]
@@ -144,23 +159,44 @@ class Command(BaseCommand):
             "Analytics": Dataset.Category.ANALYTICS,
         }
 
-        created, updated = 0, 0
+        created, updated, views = 0, 0, 0
         with transaction.atomic(using=alias):
             for name, meta in DATASETS.items():
                 g = meta.get("category")
                 if g not in CATEGORY_MAP:
                     raise CommandError(f"Unknown category '{g}' for dataset '{name}'")
 
+                try:
+                    check_definition(name, meta.get("query") or "", meta.get("parameters") or {})
+                except ValueError as e:
+                    raise CommandError(str(e))
+
+                previous = Dataset.objects.using(alias).filter(name=name).first()
                 obj, was_created = Dataset.objects.using(alias).update_or_create(
                     name=name,
                     defaults={
                         "category": CATEGORY_MAP[g],
                         "description": (meta.get("description") or "").strip(),
                         "query": (meta.get("query") or "").strip(),
+                        "materialized": bool(meta.get("materialized")),
+                        "unique_key": list(meta.get("unique_key") or []),
+                        "parameters": dict(meta.get("parameters") or {}),
                     },
                 )
                 created += int(was_created)
                 updated += int(not was_created)
 
-        self.stdout.write(self.style.SUCCESS(f"Datasets loaded. created={created}, updated={updated}"))
+                # 4) Build, rebuild or drop the dataset's materialized view
+                if not obj.materialized:
+                    drop_view(obj, using=alias)
+                    continue
+                changed = previous is None or (previous.query, previous.unique_key) != (obj.query, obj.unique_key)
+                if changed or options["rebuild_views"] or not view_exists(obj, using=alias):
+                    self.stdout.write(f"Materializing '{name}'...")
+                    create_view(obj, using=alias)
+                    views += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Datasets loaded. created={created}, updated={updated}, views built={views}"
+        ))
 
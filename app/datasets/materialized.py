@@ -0,0 +1,146 @@
+"""
+Materialized views for heavy datasets.
+A dataset marked `materialized` is read from a Postgres MATERIALIZED VIEW
+built from its query, with a unique index on its `unique_key` columns so the
+view can be refreshed with REFRESH MATERIALIZED VIEW CONCURRENTLY while
+downloads keep reading it. Views are refreshed on a background thread once an
+ETL load commits, and the dataset snapshots are rewritten after them. Each
+dataset records when its view was last refreshed, how long that took and the
+data version it reflects.
+"""
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, connections, transaction
+from django.utils import timezone
+
+from .cache import data_version
+from .models import Dataset
+from .snapshots import write_snapshots
+from .utils import statement
+
+
+logger = logging.getLogger(__name__)
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dataset-refresh")
+
+_state_lock = threading.Lock()
+_refresh_pending = False
+_refresh_running = False
+
+
+def view_exists(dataset, using=DEFAULT_DB_ALIAS) -> bool:
+    """Return True if the dataset's view exists in database `using`."""
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_matviews WHERE matviewname = %s", [dataset.view_name])
+        return cursor.fetchone() is not None
+
+
+def drop_view(dataset, using=DEFAULT_DB_ALIAS):
+    """Drop the dataset's view from database `using`, if it has one."""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP MATERIALIZED VIEW IF EXISTS {connection.ops.quote_name(dataset.view_name)}")
+
+
+def create_view(dataset, using=DEFAULT_DB_ALIAS):
+    """
+    (Re)build the dataset's view and its unique index in database `using`
+    from the stored query and record it as refreshed at that database's
+    current data version.
+    """
+    if not dataset.unique_key:
+        raise ValueError(f"Dataset '{dataset.name}' needs a unique_key to be materialized")
+    if dataset.parameters:
+        raise ValueError(f"Dataset '{dataset.name}' takes parameters and cannot be materialized")
+    connection = connections[using]
+    view = connection.ops.quote_name(dataset.view_name)
+    key = ", ".join(connection.ops.quote_name(col) for col in dataset.unique_key)
+    version = data_version(using)
+    start = time.perf_counter()
+    with transaction.atomic(using=using):
+        drop_view(dataset, using)
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE MATERIALIZED VIEW {view} AS {statement(dataset.query)}")
+            cursor.execute(f"CREATE UNIQUE INDEX {connection.ops.quote_name(f'{dataset.view_name}_key')} ON {view} ({key})")
+        _record(dataset, version, time.perf_counter() - start, using)
+
+
+def refresh_view(dataset):
+    """
+    Refresh one view without blocking its readers and record the duration, or
+    the error if the refresh failed.
+    """
+    # Everything committed up to this version is visible to the refresh
+    version = data_version()
+    start = time.perf_counter()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {connection.ops.quote_name(dataset.view_name)}")
+    except DatabaseError as e:
+        logger.error(f"Could not refresh view of dataset '{dataset.name}': {e}")
+        Dataset.objects.filter(pk=dataset.pk).update(refresh_error=str(e))
+        return
+    seconds = time.perf_counter() - start
+    _record(dataset, version, seconds)
+    logger.info(f"Refreshed view of dataset '{dataset.name}' in {seconds:.2f}s")
+
+
+def _record(dataset, version, seconds, using=DEFAULT_DB_ALIAS):
+    Dataset.objects.using(using).filter(pk=dataset.pk).update(
+        refreshed_version=version, refreshed_at=timezone.now(), refresh_seconds=round(seconds, 6), refresh_error=""
+    )
+
+
+def refresh_views():
+    """Refresh the view of every materialized dataset."""
+    for dataset in Dataset.objects.filter(materialized=True):
+        refresh_view(dataset)
+
+
+def schedule_refresh():
+    """
+    Refresh every view and then rewrite the dataset snapshots (see
+    datasets.snapshots) in the background once the current transaction
+    commits. Loads that commit while a refresh runs are covered by one more
+    refresh after it, not one each.
+    """
+    transaction.on_commit(_request_refresh)
+
+
+def refresh_in_progress() -> bool:
+    """Return True while this process has a refresh running or waiting to run."""
+    with _state_lock:
+        return _refresh_pending or _refresh_running
+
+
+def _request_refresh():
+    global _refresh_pending, _refresh_running
+    with _state_lock:
+        _refresh_pending = True
+        if _refresh_running:
+            return
+        _refresh_running = True
+    executor.submit(_refresh_until_current)
+
+
+def _refresh_until_current():
+    global _refresh_pending, _refresh_running
+    try:
+        while True:
+            with _state_lock:
+                if not _refresh_pending:
+                    # Cleared under the same lock a new request checks, so none is missed
+                    _refresh_running = False
+                    return
+                _refresh_pending = False
+            try:
+                refresh_views()
+                # Snapshots are read from the refreshed views
+                write_snapshots()
+            except Exception as e:
+                logger.error(f"Dataset refresh failed: {e}", exc_info=True)
+    finally:
+        # Executor threads outlive requests, so release their connections here
+        connections.close_all()
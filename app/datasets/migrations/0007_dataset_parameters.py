@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datasets', '0006_dataset_materialized'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='parameters',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -1,6 +1,6 @@
 from django.utils import timezone
 from django.conf import settings
-from django.db import models
+from django.db import connection, models
 
 
 class Dataset(models.Model): 
@@ -14,8 +14,38 @@ class Dataset(models.Model):
     category = models.CharField(choices=Category.choices)
     description = models.TextField()
     query = models.TextField()
+    # Typed parameters the query refers to as :name (see datasets.parameters)
+    parameters = models.JSONField(default=dict, blank=True)
+    # Materialized datasets are read from a view built from `query`, with a unique
+    # index on `unique_key` so it can be refreshed without blocking readers
+    materialized = models.BooleanField(default=False)
+    unique_key = models.JSONField(default=list, blank=True)
+    refreshed_version = models.BigIntegerField(null=True, blank=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+    refresh_seconds = models.FloatField(null=True, blank=True)
+    refresh_error = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return self.name.replace("_", " ")
\ No newline at end of file
+        return self.name.replace("_", " ")
+
+    @property
+    def view_name(self):
+        return f"datasets_mv_{self.name}"
+
+    @property
+    def source_query(self):
+        """The SQL a download runs: the stored query, or a read of its view once materialized."""
+        if not self.materialized:
+            return self.query
+        key = ", ".join(connection.ops.quote_name(col) for col in self.unique_key)
+        return f"SELECT * FROM {connection.ops.quote_name(self.view_name)} ORDER BY {key}"
+
+class DataVersion(models.Model):
+    """Counter bumped by every ETL load that commits; cached dataset results are keyed by it."""
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"v{self.version}"
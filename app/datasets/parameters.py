@@ -0,0 +1,146 @@
+"""
+Typed parameters for dataset queries.
+A dataset declares its parameters as {name: {"type": ..., "default": ...,
+"description": ...}} and refers to them in its query as `:name`. Request
+values are validated through a ninja Schema built from the declaration and
+bound as query parameters, each cast to its declared Postgres type, so one
+dataset with one set of parameters is always the same statement.
+Small results are fetched with `run_prepared`, which runs the statement as a
+server-side prepared statement kept by the connection, so repeated calls skip
+parsing and planning as long as connections persist (DB_CONN_MAX_AGE).
+"""
+import re
+import json
+import hashlib
+from contextlib import nullcontext
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Optional
+
+import psycopg
+from django.db import connection
+from ninja import Schema
+from pydantic import Field, ValidationError, create_model
+
+from .pushdown import InvalidDatasetQuery
+
+
+# Declared type -> Python type for validation and the Postgres type it is cast to
+parameter_types = {
+    "int": (int, "bigint"),
+    "float": (float, "double precision"),
+    "str": (str, "text"),
+    "bool": (bool, "boolean"),
+    "date": (date, "date"),
+    "datetime": (datetime, "timestamptz"),
+}
+
+# Download options that a parameter name would shadow
+reserved_names = {"format", "compress", "columns", "where", "order_by", "limit", "cursor"}
+
+# `:name`, but not a `::type` cast or the minutes of a time literal such as '10:30'
+placeholder_pattern = re.compile(r"(?<![:\w]):([A-Za-z_]\w*)")
+
+
+def check_definition(name, query, parameters):
+    """Raise ValueError if a dataset's parameter declaration does not fit its query."""
+    for param, spec in parameters.items():
+        if param in reserved_names:
+            raise ValueError(f"Parameter '{param}' of dataset '{name}' clashes with a download option")
+        if spec.get("type") not in parameter_types:
+            raise ValueError(
+                f"Parameter '{param}' of dataset '{name}' has type {spec.get('type')!r}; "
+                f"expected one of {', '.join(parameter_types)}"
+            )
+    used = set(placeholder_pattern.findall(query)) & set(parameters)
+    unused = set(parameters) - used
+    if unused:
+        raise ValueError(f"Dataset '{name}' declares parameters its query does not use: {', '.join(sorted(unused))}")
+
+
+@lru_cache(maxsize=256)
+def _schema(name, declaration):
+    fields = {}
+    for param, spec in json.loads(declaration).items():
+        python_type = parameter_types[spec["type"]][0]
+        if "default" in spec:
+            default = spec["default"]
+            python_type = Optional[python_type] if default is None else python_type
+        else:
+            default = ...
+        fields[param] = (python_type, Field(default, description=spec.get("description")))
+    model_name = "".join(part.title() for part in name.split("_")) + "Parameters"
+    return create_model(model_name, __base__=Schema, **fields)
+
+
+def parameter_schema(dataset):
+    """Return the ninja Schema that validates the dataset's parameters."""
+    return _schema(dataset.name, json.dumps(dataset.parameters, sort_keys=True))
+
+
+def bind_parameters(dataset, values):
+    """
+    Validate request `values` (e.g. request.GET) against the dataset's
+    parameters and return every parameter's value, defaults filled in.
+    Raises InvalidDatasetQuery with the validation errors.
+    """
+    if not dataset.parameters:
+        return {}
+    given = {param: values[param] for param in dataset.parameters if param in values}
+    try:
+        return parameter_schema(dataset).model_validate(given).model_dump()
+    except ValidationError as e:
+        problems = "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+        raise InvalidDatasetQuery(f"Invalid parameters for dataset '{dataset.name}': {problems}")
+
+
+def parameters_key(values):
+    """Short hash of bound parameter values, to tell their cached results apart."""
+    if not values:
+        return ""
+    encoded = json.dumps(values, sort_keys=True, default=str).encode()
+    return f"~{hashlib.sha256(encoded).hexdigest()[:16]}"
+
+
+def bind_query(dataset, values):
+    """
+    Return the dataset's SQL and parameter list for bound `values`. Without
+    declared parameters the query is returned as stored with no parameters;
+    otherwise its own % signs are escaped for the driver.
+    """
+    query = dataset.source_query
+    if not dataset.parameters:
+        return query, None
+
+    params = []
+
+    def placeholder(match):
+        param = match.group(1)
+        if param not in dataset.parameters:
+            return match.group(0)
+        params.append(values[param])
+        return f"%s::{parameter_types[dataset.parameters[param]['type']][1]}"
+
+    sql = placeholder_pattern.sub(placeholder, query.replace("%", "%%"))
+    return sql, params
+
+
+def run_prepared(sql, params=None):
+    """
+    Run a statement as a server-side prepared statement and return its column
+    names and rows. The connection keeps the prepared statement, so later
+    calls with the same SQL and parameter types go straight to execution.
+    That only pays off on connections kept between requests (CONN_MAX_AGE);
+    on connections closed after each request the statement is run unprepared.
+    Meant for small results: every row is fetched at once.
+    """
+    prepare = connection.settings_dict["CONN_MAX_AGE"] != 0
+    # Opened through Django, so the connection is (re)established as for any query
+    with connection.cursor() as cursor:
+        # Django's own cursors bind parameters on the client, which cannot be
+        # prepared, so the statement runs on a server-binding cursor beside it
+        with psycopg.Cursor(cursor.cursor.connection) as server_cursor, connection.wrap_database_errors:
+            logged = cursor.debug_sql(sql, params) if connection.queries_logged else nullcontext()
+            with logged:
+                server_cursor.execute(sql, params, prepare=prepare)
+            return [col.name for col in server_cursor.description], server_cursor.fetchall()
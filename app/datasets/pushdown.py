@@ -0,0 +1,219 @@
+"""
+Projection, filters, ordering and keyset pagination for dataset downloads.
+A DatasetQuery is built from the download's query parameters and compiled
+into a parameterised SELECT around the stored query, so Postgres can push the
+filters into it. Column names are checked against the query's output columns
+and quoted; values are only ever passed as parameters.
+Pages are ordered by the requested columns followed by the dataset's unique
+key (or every column when it has none), with NULLs last, and each page hands
+out an opaque cursor holding that order and the key of its last row.
+"""
+import json
+import base64
+import binascii
+
+from django.db import connection
+
+from .utils import statement
+
+
+# Comparison filter name -> SQL operator
+filter_operators = {
+    "eq": "=",
+    "ne": "<>",
+    "lt": "<",
+    "le": "<=",
+    "gt": ">",
+    "ge": ">=",
+}
+
+
+class InvalidDatasetQuery(ValueError):
+    """Raised for a projection, filter, ordering or cursor that cannot be applied."""
+
+
+def _split(value):
+    return [part.strip() for part in (value or "").split(",") if part.strip()]
+
+
+def _cursor_value(value):
+    # Values go back to Postgres as literals, which it casts to the column's type
+    return None if value is None else str(value)
+
+
+class CompiledQuery:
+    """
+    SQL and parameters of a download. A page of at most `limit` rows fetches
+    one row more, and each of its rows ends with the row's order values.
+    """
+
+    def __init__(self, sql, params, order=None, limit=None):
+        self.sql = sql
+        self.params = params
+        self.order = order
+        self.limit = limit
+
+    @property
+    def cursor_columns(self):
+        """Number of order values that end each row of a page."""
+        return len(self.order) if self.limit is not None else 0
+
+
+class DatasetQuery:
+    """
+    Download options over a dataset's query:
+    - columns: comma-separated output columns to return;
+    - where: filters of the form `column:op:value`, where op is one of
+      eq, ne, lt, le, gt, ge, `in` (comma-separated values) or `null`
+      (true or false);
+    - order_by: comma-separated columns, `-` in front for descending;
+    - limit: rows per page;
+    - cursor: the cursor returned with the previous page.
+    """
+
+    def __init__(self, columns=None, where=None, order_by=None, limit=None, cursor=None):
+        self.columns = _split(columns)
+        self.filters = [self._parse_filter(item) for item in where or []]
+        self.order = [(col.lstrip("-"), col.startswith("-")) for col in _split(order_by)]
+        if limit is not None and limit < 1:
+            raise InvalidDatasetQuery("limit must be at least 1")
+        self.limit = limit
+        self.cursor = cursor
+
+    def __bool__(self):
+        return bool(self.columns or self.filters or self.order or self.limit or self.cursor)
+
+    @property
+    def paged(self):
+        return self.limit is not None or self.cursor is not None
+
+    def _parse_filter(self, item):
+        parts = item.split(":", 2)
+        if len(parts) != 3 or parts[1] not in (*filter_operators, "in", "null"):
+            raise InvalidDatasetQuery(
+                f"Invalid filter '{item}': expected column:op:value with op one of "
+                f"{', '.join((*filter_operators, 'in', 'null'))}"
+            )
+        col, op, value = parts
+        if op == "null" and value.lower() not in ("true", "false"):
+            raise InvalidDatasetQuery(f"Invalid filter '{item}': null takes true or false")
+        return col, op, value
+
+    def _check(self, columns, available):
+        unknown = [col for col in columns if col not in available]
+        if unknown:
+            raise InvalidDatasetQuery(
+                f"Unknown columns: {', '.join(unknown)}. Available columns: {', '.join(available)}"
+            )
+
+    def _page_order(self, available, unique_key):
+        order = list(self.order)
+        ordered = {col for col, _ in order}
+        # A page boundary needs a total order, so ties are broken by the key
+        for col in unique_key or available:
+            if col not in ordered:
+                order.append((col, False))
+                ordered.add(col)
+        return order
+
+    def _decode_cursor(self, order):
+        try:
+            token = json.loads(base64.urlsafe_b64decode(self.cursor.encode()))
+            cursor_order = [(col, bool(desc)) for col, desc in token["order"]]
+            values = token["values"]
+        except (ValueError, KeyError, TypeError, binascii.Error):
+            raise InvalidDatasetQuery("Invalid cursor")
+        if cursor_order != order or len(values) != len(order):
+            raise InvalidDatasetQuery("The cursor was issued for a different ordering")
+        return values
+
+    def encode_cursor(self, order, values):
+        """Return the cursor of the page that starts after the row with these order values."""
+        token = {"order": [[col, desc] for col, desc in order], "values": [_cursor_value(v) for v in values]}
+        return base64.urlsafe_b64encode(json.dumps(token).encode()).decode()
+
+    def _after(self, order, values, params):
+        # Rows after the cursor in ORDER BY ... NULLS LAST, column by column
+        terms = []
+        for i, (col, desc) in enumerate(order):
+            if values[i] is None:
+                # Only NULLs follow a NULL, and those are equal on this column
+                continue
+            parts = []
+            for previous, value in zip(order[:i], values[:i]):
+                parts.append(f"{self._name(previous[0])} IS NOT DISTINCT FROM %s")
+                params.append(value)
+            name = self._name(col)
+            parts.append(f"({name} {'<' if desc else '>'} %s OR {name} IS NULL)")
+            params.append(values[i])
+            terms.append(f"({' AND '.join(parts)})")
+        return f"({' OR '.join(terms)})" if terms else "FALSE"
+
+    def _name(self, col):
+        return f"q.{connection.ops.quote_name(col)}"
+
+    def compile(self, query, available, unique_key=None, query_params=None, json_rows=False):
+        """
+        Compile the options into SQL around `query`, whose output columns are
+        `available`. `query_params` are the parameters `query` is bound with,
+        if any; with `json_rows`, each row's columns come as one JSON object
+        string, as from utils.json_rows_query. Raises InvalidDatasetQuery for
+        unknown columns or a cursor issued for another ordering.
+        """
+        self._check(self.columns, available)
+        self._check([col for col, _, _ in self.filters], available)
+        self._check([col for col, _ in self.order], available)
+
+        order = self._page_order(available, unique_key) if self.paged else self.order
+        conditions, params = [], list(query_params or [])
+        for col, op, value in self.filters:
+            name = self._name(col)
+            if op == "null":
+                conditions.append(f"{name} IS {'' if value.lower() == 'true' else 'NOT '}NULL")
+            elif op == "in":
+                values = _split(value)
+                conditions.append(f"{name} IN ({', '.join(['%s'] * len(values))})" if values else "FALSE")
+                params.extend(values)
+            else:
+                conditions.append(f"{name} {filter_operators[op]} %s")
+                params.append(value)
+        if self.cursor:
+            conditions.append(self._after(order, self._decode_cursor(order), params))
+
+        inner = statement(query)
+        # A query that had no parameters of its own has not had its % signs escaped yet
+        if params and query_params is None:
+            inner = inner.replace('%', '%%')
+        select = ", ".join(self._name(col) for col in self.columns) or "q.*"
+        source = f"FROM ({inner}) AS q"
+        if json_rows:
+            source += f" CROSS JOIN LATERAL (SELECT {select}) AS s"
+            select = "row_to_json(s)::text"
+        if conditions:
+            source += f" WHERE {' AND '.join(conditions)}"
+        order_sql = ""
+        if order:
+            order_sql = " ORDER BY " + ", ".join(
+                f"{self._name(col)} {'DESC' if desc else 'ASC'} NULLS LAST" for col, desc in order
+            )
+
+        if self.limit is None:
+            return CompiledQuery(f"SELECT {select} {source}{order_sql}", params or None, order=order)
+        # The extra row tells whether another page follows, and the order values
+        # of the page's last row make its cursor, all from the one query
+        keys = ", ".join(
+            f"{self._name(col)}::text AS {connection.ops.quote_name(f'_cursor_{i}')}"
+            for i, (col, _) in enumerate(order)
+        )
+        sql = f"SELECT {select}, {keys} {source}{order_sql} LIMIT {int(self.limit) + 1}"
+        return CompiledQuery(sql, params or None, order=order, limit=self.limit)
+
+    def next_cursor(self, compiled, rows):
+        """
+        Return the cursor of the page after `compiled`, given the rows its
+        query returned, or None on the last page. Each row need only hold the
+        order values that end it.
+        """
+        if compiled.limit is None or len(rows) <= compiled.limit:
+            return None
+        return self.encode_cursor(compiled.order, rows[compiled.limit - 1][-compiled.cursor_columns:])
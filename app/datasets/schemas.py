@@ -0,0 +1,17 @@
+from typing import Any, Dict, List, Literal, Optional
+from ninja import Schema
+
+
+class BatchDataset(Schema):
+    name: str
+    columns: Optional[str] = None
+    where: List[str] = []
+    order_by: Optional[str] = None
+    limit: Optional[int] = None
+    cursor: Optional[str] = None
+    parameters: Dict[str, Any] = {}
+
+class DatasetBatch(Schema):
+    datasets: List[BatchDataset]
+    format: Literal["csv", "parquet", "arrow", "ndjson", "json"] = "json"
+    compress: bool = False
@@ -0,0 +1,129 @@
+"""
+On-disk snapshots of every dataset.
+Once an ETL load commits (and any materialized views are refreshed), each
+dataset is written to DATASET_SNAPSHOT_ROOT as a Parquet file and an Arrow IPC
+stream, named after the result version they hold (see cache.result_version).
+Each file is written under a temporary name and moved into place, so readers
+only ever open a complete snapshot, and older versions are removed once the
+new one is in place. A download whose version has a snapshot is served
+straight from the file, which the WSGI server can send with sendfile.
+"""
+import os
+import glob
+import logging
+import tempfile
+from contextlib import ExitStack
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.conf import settings
+
+from .cache import result_version
+from .models import Dataset
+from .utils import query_schema, arrow_batches
+
+
+logger = logging.getLogger(__name__)
+
+# Snapshot format -> file extension, as served by the download endpoint
+snapshot_formats = {
+    "parquet": "parquet",
+    "arrow": "arrows",
+}
+
+
+def snapshot_path(name, format, version):
+    return os.path.join(settings.DATASET_SNAPSHOT_ROOT, f"{quote(name, safe='')}@{version}.{snapshot_formats[format]}")
+
+
+def open_snapshot(dataset, format, version):
+    """Return the dataset's snapshot at `version` as an open binary file, or None if there is none."""
+    if not settings.DATASET_SNAPSHOT_ROOT or format not in snapshot_formats or dataset.parameters:
+        return None
+    try:
+        return open(snapshot_path(dataset.name, format, version), "rb")
+    except FileNotFoundError:
+        return None
+
+
+def _open_writer(format, path, schema):
+    if format == "parquet":
+        return pq.ParquetWriter(path, schema, compression="snappy")
+    return pa.ipc.new_stream(path, schema)
+
+
+def write_snapshot(dataset):
+    """
+    Write the dataset's current result in every snapshot format, reading the
+    query once, unless the snapshot of this version already exists.
+    Returns True if new files were written.
+    """
+    version = result_version(dataset)
+    paths = {format: snapshot_path(dataset.name, format, version) for format in snapshot_formats}
+    if all(os.path.exists(path) for path in paths.values()):
+        return False
+
+    os.makedirs(settings.DATASET_SNAPSHOT_ROOT, exist_ok=True)
+    temporaries = {}
+    try:
+        for format in paths:
+            handle, temporaries[format] = tempfile.mkstemp(dir=settings.DATASET_SNAPSHOT_ROOT, suffix=".tmp")
+            os.close(handle)
+
+        query = dataset.source_query
+        schema = query_schema(query)
+        with ExitStack() as stack:
+            writers = [stack.enter_context(_open_writer(format, path, schema)) for format, path in temporaries.items()]
+            for batch in arrow_batches(query, schema):
+                for writer in writers:
+                    writer.write_batch(batch)
+
+        for format, temporary in list(temporaries.items()):
+            # Readers only ever see a complete file
+            os.replace(temporary, paths[format])
+            del temporaries[format]
+    finally:
+        for temporary in temporaries.values():
+            os.remove(temporary)
+
+    _remove_old_versions(dataset.name, set(paths.values()))
+    return True
+
+
+def _remove_old_versions(name, keep):
+    # A download already reading an old file keeps it open until it is sent
+    for path in glob.glob(os.path.join(settings.DATASET_SNAPSHOT_ROOT, f"{glob.escape(quote(name, safe=''))}@*")):
+        if path not in keep:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def collect_garbage():
+    """Remove the snapshots of datasets that no longer exist."""
+    names = {quote(name, safe="") for name in Dataset.objects.values_list("name", flat=True)}
+    for path in glob.glob(os.path.join(settings.DATASET_SNAPSHOT_ROOT, "*@*")):
+        if os.path.basename(path).split("@", 1)[0] not in names:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def write_snapshots():
+    """
+    Snapshot every dataset whose current version has no snapshot yet, then
+    remove old files. Datasets that take parameters have no single result to
+    snapshot and are skipped.
+    """
+    if not settings.DATASET_SNAPSHOT_ROOT:
+        return
+    for dataset in Dataset.objects.filter(parameters={}):
+        try:
+            if write_snapshot(dataset):
+                logger.info(f"Wrote snapshot of dataset '{dataset.name}'")
+        except Exception as e:
+            logger.error(f"Could not snapshot dataset '{dataset.name}': {e}", exc_info=True)
+    collect_garbage()
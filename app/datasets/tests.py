@@ -1,3 +1,445 @@
-from django.test import TestCase
+"""
+Tests for dataset exports.
+"""
+import io
+import os
+import gzip
+import json
+import time
+import tempfile
+from email import policy
+from email.parser import BytesParser
 
-# Create your tests here.
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.db import DatabaseError, connection
+from django.http import FileResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from core.models import Track
+from .batch import close_connections
+from .cache import result_cache, bump_data_version
+from .materialized import create_view, refresh_view
+from .snapshots import write_snapshots
+from .models import Dataset
+from .parameters import run_prepared
+
+
+class DatasetExportTests(TestCase):
+    """Tests for the streaming dataset downloads."""
+
+    def setUp(self):
+        result_cache.clear()
+        Dataset.objects.create(
+            name="numbers",
+            category=Dataset.Category.AGGREGATE,
+            description="Twelve numbers and their doubles.",
+            query="SELECT g AS number, g * 2 AS double FROM generate_series(1, 12) g ORDER BY g;",
+        )
+        self.expected = "number,double\r\n" + "".join(f"{n},{n * 2}\r\n" for n in range(1, 13))
+
+    @override_settings(DATASET_EXPORT_BATCH_SIZE=5)
+    def test_download_streams_csv_in_batches(self):
+        """Test that a dataset is streamed as CSV, one chunk for the header and each batch."""
+        response = self.client.get("/api/datasets/download/numbers")
+
+        self.assertTrue(response.streaming)
+        chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(b"".join(chunks).decode(), self.expected)
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="numbers.csv"')
+
+    def test_download_can_be_gzipped(self):
+        """Test that a compressed download is a gzip stream of the same CSV."""
+        response = self.client.get("/api/datasets/download/numbers?compress=true")
+
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)).decode(), self.expected)
+
+    def test_columnar_formats_keep_postgres_types(self):
+        """Test that Parquet, Arrow and NDJSON downloads hold the same typed rows."""
+        Dataset.objects.create(
+            name="typed",
+            category=Dataset.Category.ANALYTICS,
+            description="One row of each exported type.",
+            query=(
+                "SELECT g AS id, g::float8 / 2 AS half, g % 2 = 0 AS even, "
+                "DATE '2024-12-01' + g AS day, TIME '10:30' AS at, "
+                "CASE WHEN g = 2 THEN NULL ELSE 'line ' || g || E'\\n\"quoted\"' END AS note "
+                "FROM generate_series(1, 3) g ORDER BY g"
+            ),
+        )
+
+        tables = {}
+        for format, read in (("parquet", pq.read_table), ("arrow", lambda f: pa.ipc.open_stream(f).read_all())):
+            response = self.client.get(f"/api/datasets/download/typed?format={format}&compress=true")
+            tables[format] = read(io.BytesIO(b"".join(response.streaming_content)))
+        response = self.client.get("/api/datasets/download/typed?format=ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(tables["parquet"].schema, tables["arrow"].schema)
+        self.assertEqual(
+            [str(field.type) for field in tables["arrow"].schema],
+            ["int32", "double", "bool", "date32[day]", "time64[us]", "string"],
+        )
+        self.assertEqual(tables["parquet"].to_pylist(), tables["arrow"].to_pylist())
+        self.assertEqual(tables["arrow"].column("note").to_pylist(), ['line 1\n"quoted"', None, 'line 3\n"quoted"'])
+        self.assertEqual([json.loads(line)["half"] for line in lines], [0.5, 1.0, 1.5])
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="typed.ndjson"')
+
+    def test_unknown_dataset_is_rejected(self):
+        """Test that a dataset name that does not exist returns 400."""
+        response = self.client.get("/api/datasets/download/missing")
+
+        self.assertEqual(response.status_code, 400)
+
+
+class DatasetStreamingTests(TransactionTestCase):
+    """Tests for downloads streamed outside a transaction, as they are served."""
+
+    def setUp(self):
+        result_cache.clear()
+        Dataset.objects.create(
+            name="reciprocals",
+            category=Dataset.Category.AGGREGATE,
+            description="Integer reciprocals, failing on the tenth row.",
+            query="SELECT g, 1 / (10 - g) AS reciprocal FROM generate_series(1, 12) g;",
+        )
+
+    @override_settings(DATASET_EXPORT_BATCH_SIZE=4)
+    def test_first_rows_arrive_before_the_query_finishes(self):
+        """Test that rows are sent as Postgres produces them, before the rest of the query has run."""
+        response = self.client.get("/api/datasets/download/reciprocals")
+        chunks = iter(response.streaming_content)
+
+        self.assertEqual(next(chunks), b"g,reciprocal\r\n")
+        self.assertEqual(next(chunks), b"1,0\r\n2,0\r\n3,0\r\n4,0\r\n")
+        # Only now does Postgres reach the row that divides by zero
+        with self.assertRaises(DatabaseError):
+            list(chunks)
+        self.assertTrue(connection.get_autocommit())
+
+
+class DatasetCacheTests(TestCase):
+    """Tests for the dataset result cache."""
+
+    def setUp(self):
+        result_cache.clear()
+        self.dataset = Dataset.objects.create(
+            name="numbers",
+            category=Dataset.Category.AGGREGATE,
+            description="Three numbers.",
+            query="SELECT g AS number FROM generate_series(1, 3) g ORDER BY g",
+        )
+
+    def download(self, query=""):
+        response = self.client.get(f"/api/datasets/download/numbers{query}")
+        if response.streaming:
+            return response, b"".join(response.streaming_content)
+        return response, response.content
+
+    def test_repeated_download_is_served_from_memory(self):
+        """Test that a second download is served from the cache without running the query."""
+        first, body = self.download()
+        with self.assertNumQueries(2):
+            second, cached = self.download()
+
+        self.assertTrue(first.streaming)
+        self.assertFalse(second.streaming)
+        self.assertEqual(cached, body)
+        self.assertEqual(second["Content-Disposition"], 'attachment; filename="numbers.csv"')
+        self.assertEqual(result_cache.metrics()["memory_hits"], 1)
+
+    def test_load_and_query_edits_invalidate(self):
+        """Test that bumping the data version or editing the query misses the cache."""
+        self.download()
+        bump_data_version()
+        response, _ = self.download()
+        self.assertTrue(response.streaming)
+
+        self.dataset.query = "SELECT g AS number FROM generate_series(1, 2) g ORDER BY g"
+        self.dataset.save()
+        response, body = self.download()
+        self.assertEqual(body.decode(), "number\r\n1\r\n2\r\n")
+        self.assertEqual(result_cache.metrics()["misses"], 3)
+
+    def test_shared_directory_is_used_by_other_processes(self):
+        """Test that a result written to the shared directory is served as a file."""
+        # With no memory budget, every hit has to come from the shared directory
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(DATASET_CACHE_DIR=directory, DATASET_CACHE_MAX_BYTES=0):
+            _, body = self.download("?format=parquet")
+            response, cached = self.download("?format=parquet")
+
+            self.assertTrue(response.streaming)
+            self.assertEqual(cached, body)
+            self.assertEqual(pq.read_table(io.BytesIO(cached)).column("number").to_pylist(), [1, 2, 3])
+            self.assertEqual(result_cache.metrics()["file_hits"], 1)
+            response.close()
+
+
+class MaterializedDatasetTests(TestCase):
+    """Tests for datasets read from materialized views."""
+
+    def setUp(self):
+        result_cache.clear()
+        Track.objects.create(track="data science")
+        self.dataset = Dataset.objects.create(
+            name="tracks",
+            category=Dataset.Category.AGGREGATE,
+            description="Tracks.",
+            query="SELECT track FROM core_track;",
+            materialized=True,
+            unique_key=["track"],
+        )
+        create_view(self.dataset)
+
+    def download(self):
+        response = self.client.get("/api/datasets/download/tracks")
+        content = b"".join(response.streaming_content) if response.streaming else response.content
+        return content.decode().splitlines()
+
+    def test_download_reads_view_until_refreshed(self):
+        """Test that new rows show up in the download only once the view is refreshed."""
+        self.assertEqual(self.download(), ["track", "data science"])
+
+        Track.objects.create(track="analytics")
+        bump_data_version()
+        self.assertEqual(self.download(), ["track", "data science"])
+        self.assertTrue(self.client.get("/api/datasets/views").json()[0]["stale"])
+
+        refresh_view(self.dataset)
+        self.assertEqual(self.download(), ["track", "analytics", "data science"])
+        state = self.client.get("/api/datasets/views").json()[0]
+        self.assertFalse(state["stale"])
+        self.assertEqual(state["refreshed_version"], 1)
+        self.assertIsNotNone(state["refresh_seconds"])
+
+
+class DatasetSnapshotTests(TestCase):
+    """Tests for the on-disk dataset snapshots."""
+
+    def setUp(self):
+        result_cache.clear()
+        Dataset.objects.create(
+            name="numbers",
+            category=Dataset.Category.AGGREGATE,
+            description="Three numbers.",
+            query="SELECT g AS number FROM generate_series(1, 3) g ORDER BY g",
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        settings = override_settings(DATASET_SNAPSHOT_ROOT=self.root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_download_is_sent_from_current_snapshot(self):
+        """Test that downloads use the snapshot of the current version and old versions are removed."""
+        write_snapshots()
+        self.assertEqual(len(os.listdir(self.root)), 2)
+
+        for format, read in (("parquet", pq.read_table), ("arrow", lambda f: pa.ipc.open_stream(f).read_all())):
+            response = self.client.get(f"/api/datasets/download/numbers?format={format}")
+            self.assertIsInstance(response, FileResponse)
+            # Reading the body to the end closes the response and its file
+            table = read(io.BytesIO(b"".join(response.streaming_content)))
+            self.assertEqual(table.column("number").to_pylist(), [1, 2, 3])
+        self.assertEqual(result_cache.metrics()["misses"], 0)
+
+        bump_data_version()
+        response = self.client.get("/api/datasets/download/numbers?format=parquet")
+        self.assertNotIsInstance(response, FileResponse)
+        b"".join(response.streaming_content)
+
+        write_snapshots()
+        self.assertEqual(len(os.listdir(self.root)), 2)
+        self.assertTrue(all("@1-" in name for name in os.listdir(self.root)))
+
+
+class DatasetPushdownTests(TestCase):
+    """Tests for projection, filters and keyset pages on downloads."""
+
+    def setUp(self):
+        result_cache.clear()
+        Dataset.objects.create(
+            name="numbers",
+            category=Dataset.Category.AGGREGATE,
+            description="Numbers, their parity and a gap.",
+            query=(
+                "SELECT g AS number, g % 2 = 0 AS even, CASE WHEN g = 4 THEN NULL ELSE g % 3 END AS rest "
+                "FROM generate_series(1, 9) g;"
+            ),
+        )
+
+    def rows(self, query):
+        response = self.client.get(f"/api/datasets/download/numbers?{query}")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        return response, [line.split(",") for line in lines[1:]]
+
+    def test_filters_and_projection_are_applied_by_the_query(self):
+        """Test that filters and projection shape the result, alongside % in the stored query."""
+        response, rows = self.rows("columns=number&where=even:eq:true&where=number:in:2,4,5,8&order_by=-number")
+
+        self.assertEqual(rows, [["8"], ["4"], ["2"]])
+        self.assertNotIn("X-Next-Cursor", response)
+
+    def test_pages_follow_cursor_to_the_end(self):
+        """Test that keyset pages cover every row once, NULLs last, and the last page has no cursor."""
+        pages, cursor = [], None
+        while True:
+            query = "order_by=-rest&limit=4" + (f"&cursor={cursor}" if cursor else "")
+            response, rows = self.rows(query)
+            pages.append([int(row[0]) for row in rows])
+            cursor = response.get("X-Next-Cursor")
+            if cursor is None:
+                break
+
+        self.assertEqual(pages, [[2, 5, 8, 1], [7, 3, 6, 9], [4]])
+
+    def test_pages_agree_across_formats(self):
+        """Test that every format sends the same page and cursor, without the columns that build the cursor."""
+        query = "columns=number&order_by=-rest&limit=4"
+        csv_response, rows = self.rows(query)
+        self.assertEqual([int(row[0]) for row in rows], [2, 5, 8, 1])
+
+        for format in ("json", "ndjson", "parquet", "arrow"):
+            response = self.client.get(f"/api/datasets/download/numbers?{query}&format={format}")
+            body = b"".join(response.streaming_content)
+            if format == "json":
+                numbers = [row[0] for row in json.loads(body)["rows"]]
+            elif format == "ndjson":
+                numbers = [json.loads(line)["number"] for line in body.splitlines()]
+            elif format == "parquet":
+                numbers = pq.read_table(io.BytesIO(body)).column("number").to_pylist()
+            else:
+                numbers = pa.ipc.open_stream(body).read_all().column("number").to_pylist()
+            self.assertEqual(numbers, [2, 5, 8, 1], format)
+            self.assertNotIn(b"_cursor", body, format)
+            self.assertEqual(response["X-Next-Cursor"], csv_response["X-Next-Cursor"], format)
+
+    def test_invalid_options_are_rejected(self):
+        """Test that unknown columns, bad filters and foreign cursors return 400."""
+        first_page = self.client.get("/api/datasets/download/numbers?order_by=rest&limit=2")
+        # Read to the end so the response is closed before the next request
+        b"".join(first_page.streaming_content)
+        cursor = first_page["X-Next-Cursor"]
+
+        for query in ("columns=missing", "where=number:like:1", f"order_by=number&cursor={cursor}", "cursor=abc"):
+            response = self.client.get(f"/api/datasets/download/numbers?{query}")
+            self.assertEqual(response.status_code, 400, query)
+
+
+class DatasetParameterTests(TestCase):
+    """Tests for datasets that take typed parameters."""
+
+    def setUp(self):
+        result_cache.clear()
+        Dataset.objects.create(
+            name="numbers_between",
+            category=Dataset.Category.AGGREGATE,
+            description="Numbers in a range, with their remainder by 3.",
+            query=(
+                "SELECT g AS number, g % 3 AS rest FROM generate_series(1, 20) g "
+                "WHERE g >= :low AND (:high IS NULL OR g <= :high) ORDER BY g;"
+            ),
+            parameters={
+                "low": {"type": "int", "default": 1},
+                "high": {"type": "int", "default": None},
+            },
+        )
+
+    def numbers(self, query):
+        response = self.client.get(f"/api/datasets/download/numbers_between?format=json&{query}")
+        self.assertEqual(response.status_code, 200, query)
+        # Cached results come back whole rather than streamed
+        body = json.loads(b"".join(response.streaming_content) if response.streaming else response.content)
+        self.assertEqual(body["columns"], ["number", "rest"])
+        return [row[0] for row in body["rows"]]
+
+    def test_parameters_are_bound_and_defaulted(self):
+        """Test that given parameters are bound, missing ones take their defaults, and each is cached apart."""
+        self.assertEqual(self.numbers("low=5&high=8"), [5, 6, 7, 8])
+        self.assertEqual(self.numbers("low=18"), [18, 19, 20])
+        self.assertEqual(result_cache.metrics()["memory_hits"], 0)
+
+        self.assertEqual(self.numbers("low=5&high=8"), [5, 6, 7, 8])
+        self.assertEqual(result_cache.metrics()["memory_hits"], 1)
+        self.assertEqual(len(self.numbers("")), 20)
+        self.assertEqual(result_cache.metrics()["misses"], 3)
+
+    def test_parameters_combine_with_pushdown(self):
+        """Test that filters apply on top of a parameterised query."""
+        self.assertEqual(self.numbers("low=5&high=12&where=rest:eq:0"), [6, 9, 12])
+
+    def test_invalid_parameters_are_rejected(self):
+        """Test that values of the wrong type return 400 and the schema describes the parameters."""
+        response = self.client.get("/api/datasets/download/numbers_between?low=five")
+        self.assertEqual(response.status_code, 400)
+
+        schema = self.client.get("/api/datasets/numbers_between/parameters").json()
+        self.assertEqual(set(schema["properties"]), {"low", "high"})
+
+    def test_prepared_statements_run_through_django(self):
+        """Test that prepared statements are logged like other queries and raise Django's database errors."""
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(run_prepared("SELECT %s::int AS n", [7]), (["n"], [(7,)]))
+        self.assertEqual(queries[-1]["sql"], "SELECT %s::int AS n")
+
+        with self.assertRaises(DatabaseError):
+            run_prepared("SELECT 1 / 0")
+
+
+class DatasetBatchTests(TransactionTestCase):
+    """Tests for batch downloads, whose queries run on other threads' connections."""
+
+    def setUp(self):
+        result_cache.clear()
+        self.addCleanup(close_connections)
+        for name in ("first_numbers", "second_numbers", "third_numbers"):
+            Dataset.objects.create(
+                name=name,
+                category=Dataset.Category.AGGREGATE,
+                description="Three numbers, after a second.",
+                query="SELECT g AS number FROM generate_series(1, 3) g, pg_sleep(1) ORDER BY g;",
+            )
+
+    def batch(self, datasets):
+        response = self.client.post("/api/datasets/batch", {"datasets": datasets}, content_type="application/json")
+        head = f"Content-Type: {response['Content-Type']}\r\n\r\n".encode()
+        message = BytesParser(policy=policy.HTTP).parsebytes(head + b"".join(response.streaming_content))
+        return {part.get_param("name", header="Content-Disposition"): part for part in message.iter_parts()}
+
+    def test_queries_run_concurrently(self):
+        """Test that a batch takes about as long as its slowest dataset, with every part named and complete."""
+        start = time.perf_counter()
+        parts = self.batch([{"name": "first_numbers"}, {"name": "second_numbers"}, {"name": "third_numbers"}])
+        elapsed = time.perf_counter() - start
+
+        # Run one after another, the three queries would take at least 3s
+        self.assertLess(elapsed, 2.5)
+        self.assertEqual(set(parts), {"first_numbers", "second_numbers", "third_numbers"})
+        self.assertEqual(json.loads(parts["first_numbers"].get_content())["rows"], [[1], [2], [3]])
+        self.assertEqual(parts["second_numbers"]["Content-ID"], "<1>")
+
+    def test_failures_are_reported(self):
+        """Test that unknown datasets reject the batch and bad options fail only their own part."""
+        response = self.client.post(
+            "/api/datasets/batch", {"datasets": [{"name": "missing"}]}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+        parts = self.batch([{"name": "first_numbers", "limit": 2}, {"name": "second_numbers", "columns": "missing"}])
+        self.assertNotIn("X-Status", parts["first_numbers"])
+        self.assertEqual(json.loads(parts["first_numbers"].get_content())["rows"], [[1], [2]])
+        self.assertIn("X-Next-Cursor", parts["first_numbers"])
+        self.assertEqual(parts["second_numbers"]["X-Status"], "400")
+
+    @override_settings(DATASET_BATCH_MAX_PART_BYTES=40)
+    def test_oversized_parts_fail_on_their_own(self):
+        """Test that a part larger than the byte limit fails with 413 while smaller ones are sent."""
+        parts = self.batch([{"name": "first_numbers", "limit": 1}, {"name": "second_numbers"}])
+
+        self.assertEqual(json.loads(parts["first_numbers"].get_content())["rows"], [[1]])
+        self.assertEqual(parts["second_numbers"]["X-Status"], "413")
@@ -1,22 +1,202 @@
+import io
 import csv
+import zlib
 from io import StringIO
-from typing import Dict
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+from psycopg.postgres import types as pg_types
+from django.conf import settings
 from django.db import connection
 
 
+def statement(query: str) -> str:
+    """Strip the terminator so a query can be wrapped by DECLARE, COPY or a subquery."""
+    return query.strip().rstrip(";")
 
-def run_query(query: str):
-    """Run SQL query and return columns + rows."""
-    with connection.cursor() as cursor:
-        cursor.execute(query)
-        columns = [col[0] for col in cursor.description]
-        rows = cursor.fetchall()
-    return columns, rows
+def stream_query(query: str, batch_size: int = None, params=None):
+    """
+    Run SQL query through a named server-side cursor. Yields lists of at most
+    `batch_size` rows as Postgres produces them, so only one batch is ever held
+    in memory and the first is sent before the query has finished. Outside a
+    transaction the cursor gets one of its own, held while the generator runs
+    and ended when it finishes or is closed; nothing runs until the first batch
+    is asked for.
+    """
+    batch_size = batch_size or settings.DATASET_EXPORT_BATCH_SIZE
+    query = statement(query)
+    # In autocommit Django declares the cursor WITH HOLD, which makes Postgres run
+    # the whole query at once; a plain cursor in a transaction fetches as it goes
+    own_transaction = connection.get_autocommit()
+    if own_transaction:
+        connection.set_autocommit(False)
+    try:
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield rows
+    finally:
+        if own_transaction:
+            connection.rollback()
+            connection.set_autocommit(True)
 
-def rows_to_csv(columns, rows) -> str:
-    """Convert query result to CSV string."""
+def csv_stream(columns, batches, compress: bool = False):
+    """
+    Encode a header and batches of rows as CSV, one chunk of bytes per batch,
+    optionally as a gzip stream compressed on the fly.
+    """
     buffer = StringIO()
     writer = csv.writer(buffer)
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) if compress else None
+
+    def take(flush_mode=None):
+        data = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        if compressor is None:
+            return data
+        data = compressor.compress(data)
+        return data + compressor.flush(flush_mode) if flush_mode is not None else data
+
     writer.writerow(columns)
-    writer.writerows(rows)
-    return buffer.getvalue()
\ No newline at end of file
+    # Flush the header at once so the client gets its first bytes without waiting on a batch
+    yield take(zlib.Z_SYNC_FLUSH)
+    for rows in batches:
+        writer.writerows(rows)
+        chunk = take()
+        if chunk:
+            yield chunk
+    if compressor is not None:
+        yield compressor.flush()
+
+# Arrow type for each Postgres type name; anything else is exported as text
+arrow_types = {
+    "bool": pa.bool_(),
+    "int2": pa.int16(),
+    "int4": pa.int32(),
+    "int8": pa.int64(),
+    "float4": pa.float32(),
+    "float8": pa.float64(),
+    "numeric": pa.float64(),
+    "date": pa.date32(),
+    "time": pa.time64("us"),
+    "timestamp": pa.timestamp("us"),
+    "timestamptz": pa.timestamp("us", tz="UTC"),
+}
+
+def query_schema(query: str, params=None) -> pa.Schema:
+    """Arrow schema of a query's result, from the Postgres types of its columns."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT * FROM ({statement(query)}) AS q LIMIT 0", params)
+        fields = []
+        for col in cursor.description:
+            info = pg_types.get(col.type_code)
+            fields.append(pa.field(col.name, arrow_types.get(info.name if info else None, pa.string())))
+    return pa.schema(fields)
+
+class _CopyReader(io.RawIOBase):
+    """File-like view of the data blocks of a COPY ... TO STDOUT."""
+
+    def __init__(self, copy):
+        self._blocks = iter(copy)
+        self._pending = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            block = next(self._blocks, None)
+            if block is None:
+                return 0
+            self._pending = memoryview(block)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+def arrow_batches(query: str, schema: pa.Schema, params=None):
+    """
+    Yield a query's result as Arrow record batches. Postgres writes the rows
+    with COPY and Arrow's CSV reader parses them straight into columns, so no
+    Python object is made per row or value.
+    """
+    read_options = pv.ReadOptions(
+        column_names=schema.names, use_threads=False, block_size=settings.DATASET_EXPORT_BLOCK_SIZE
+    )
+    parse_options = pv.ParseOptions(newlines_in_values=True)
+    convert_options = pv.ConvertOptions(
+        column_types=schema, true_values=["t"], false_values=["f"],
+        strings_can_be_null=True, quoted_strings_can_be_null=False,
+    )
+    # Django runs its connections in UTC under USE_TZ, so timestamptz values match the schema
+    with connection.cursor() as cursor:
+        with cursor.copy(f"COPY ({statement(query)}) TO STDOUT WITH (FORMAT csv)", params) as copy:
+            reader = pv.open_csv(
+                _CopyReader(copy), read_options=read_options,
+                parse_options=parse_options, convert_options=convert_options,
+            )
+            for batch in reader:
+                yield batch
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last `take`."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def parquet_stream(schema: pa.Schema, batches, compress: bool = False):
+    """Write record batches as a Parquet file, one row group per batch, yielding bytes as they are written."""
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression="zstd" if compress else "snappy") as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            yield sink.take()
+    yield sink.take()
+
+def arrow_stream(schema: pa.Schema, batches, compress: bool = False):
+    """Write record batches as an Arrow IPC stream, yielding bytes as they are written."""
+    sink = _ChunkSink()
+    options = pa.ipc.IpcWriteOptions(compression="zstd" if compress else None)
+    with pa.ipc.new_stream(sink, schema, options=options) as writer:
+        yield sink.take()
+        for batch in batches:
+            writer.write_batch(batch)
+            yield sink.take()
+    yield sink.take()
+
+def json_rows_query(query: str) -> str:
+    """Wrap a query so Postgres returns each row as one JSON object string."""
+    return f"SELECT row_to_json(q)::text FROM ({statement(query)}) AS q"
+
+def ndjson_stream(batches, compress: bool = False):
+    """
+    Encode batches of JSON rows from `json_rows_query` as newline-delimited
+    JSON, optionally as a gzip stream compressed on the fly.
+    """
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) if compress else None
+    for rows in batches:
+        data = "".join(f"{row}\n" for (row,) in rows).encode()
+        yield compressor.compress(data) if compressor else data
+    if compressor is not None:
+        yield compressor.flush()
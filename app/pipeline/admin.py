@@ -0,0 +1,52 @@
+from django.contrib import admin
+from .models import Upload, EtlJob, EtlPartition, EtlRun, QuarantinedRow
+
+
+class UploadAdmin(admin.ModelAdmin):
+    list_display = ('file_name', 'sha256', 'created_at',)
+    search_fields = ('file_name', 'sha256',)
+    ordering = ('-created_at',)
+    readonly_fields = ['created_at']
+
+
+admin.site.register(Upload, UploadAdmin)
+
+
+class EtlJobAdmin(admin.ModelAdmin):
+    list_display = ('file_name', 'status', 'backend', 'stage', 'partition_count', 'created_at', 'finished_at',)
+    list_filter = ('status', 'backend',)
+    search_fields = ('file_name',)
+    ordering = ('-created_at',)
+    readonly_fields = ['created_at', 'started_at', 'finished_at']
+
+
+admin.site.register(EtlJob, EtlJobAdmin)
+
+
+class EtlPartitionAdmin(admin.ModelAdmin):
+    list_display = ('job', 'number', 'rows', 'status', 'attempts', 'claimed_by', 'finished_at',)
+    list_filter = ('status',)
+    ordering = ('job', 'number',)
+
+
+admin.site.register(EtlPartition, EtlPartitionAdmin)
+
+
+class EtlRunAdmin(admin.ModelAdmin):
+    list_display = ('file_name', 'seconds', 'created_at',)
+    search_fields = ('file_name',)
+    ordering = ('-created_at',)
+    readonly_fields = ['file_name', 'seconds', 'profile', 'created_at']
+
+
+admin.site.register(EtlRun, EtlRunAdmin)
+
+
+class QuarantinedRowAdmin(admin.ModelAdmin):
+    list_display = ('student_id', 'file_name', 'reasons', 'created_at',)
+    search_fields = ('student_id', 'file_name', 'sha256',)
+    ordering = ('-created_at',)
+    readonly_fields = ['file_name', 'sha256', 'student_id', 'reasons', 'row', 'created_at']
+
+
+admin.site.register(QuarantinedRow, QuarantinedRowAdmin)
@@ -1,46 +1,75 @@
 import logging
+from uuid import UUID
+from typing import List, Optional
 from ninja import Router, File
 from ninja.files import UploadedFile
 from django.core.files.uploadedfile import InMemoryUploadedFile
-from .utils import Extract, Transform, Load, transform_kwargs, category_columns
+from core.schemas import ErrorResponse
+from .jobs import submit_job, resubmit_job, is_abandoned
+from .models import EtlJob, EtlRun
+from .queue import retry_job
+from .schemas import JobSubmitted, JobStatus, JobResult, PartitionStatus, RunProfile
+from .country_codes import UnresolvedCountriesError
+from .utils import run_pipeline, default_chunk_size
 
 # Initialize router with ETL tag
 router = Router(tags=["etl"])
 
-# Instantiate pipeline utilities
-extractor = Extract()
-transformer = Transform(**transform_kwargs)
-loader = Load()
-
 # Set up logger
 logger = logging.getLogger(__name__)
 
 @router.post("")
-def extract_transform_load_pipeline(request, file: UploadedFile):
+def extract_transform_load_pipeline(
+    request,
+    file: UploadedFile,
+    bulk: bool = False,
+    stream: bool = False,
+    chunk_size: int = default_chunk_size,
+    workers: Optional[int] = None,
+    delta: bool = True,
+    resume: bool = True,
+):
     """
     Endpoint to run the full ETL pipeline on an uploaded file.
-    Accepts small files in memory and large files on disk.
+    Accepts small files in memory and large files on disk. Excel workbooks,
+    CSV, Parquet and Arrow IPC files are told apart by their contents.
+    - bulk: stage each table with COPY and merge it in one statement,
+      reporting rows inserted, updated and unchanged per table.
+    - stream: read the workbook in chunks of `chunk_size` rows and transform
+      and bulk load one chunk at a time, keeping memory flat for large files.
+    - workers: parse the workbook's sheets in this many processes.
+    - delta: skip files that were already loaded byte for byte and only write
+      students whose cleaned data changed. Set to false to reload everything.
+    - resume: if an earlier run of the same file failed, continue from the last
+      stage or table it completed (listed under "resumed"). Set to false to
+      start over. Streamed runs always start over.
+    Rows that fail validation (missing values, unknown aims or countries, an
+    aptitude score outside 0-100) are kept in the quarantine table instead of
+    being loaded; "quarantined" counts them per reason.
+    The response's "profile" gives the wall time, rows in and out, peak memory
+    and SQL statement count of every Extract, Transform and Load step.
     """
     file_name = file.name
 
     try:
-        logger.info("Extracting data...")
         if isinstance(file, InMemoryUploadedFile):
             # Read directly from memory
-            raw_data = extractor.merge_frames(file.file)
+            source = file.file
         else:
             # Temporary file on disk (for large uploads)
-            raw_data = extractor.merge_frames(file.temporary_file_path())
-
-        logger.info("Cleaning data...")
-        clean_data = transformer.clean_data(raw_data)
+            source = file.temporary_file_path()
 
-        logger.info("Loading data...")
-        loader.load_data(clean_data, category_columns)
+        return run_pipeline(
+            source, file_name, bulk=bulk, stream=stream, chunk_size=chunk_size, workers=workers, delta=delta,
+            resume=resume,
+        )
 
-        logger.info(f"ETL pipeline completed successfully for file '{file_name}'")
+    except UnresolvedCountriesError as e:
+        logger.error(f"ETL pipeline error for file '{file_name}': {e}")
         return {
-            "message": f"File '{file_name}' has been loaded to the database successfully."
+            "error": f"Failed to process file '{file_name}'.",
+            "details": str(e),
+            "unresolved_countries": e.unresolved,
         }
 
     except Exception as e:
@@ -48,4 +77,111 @@ def extract_transform_load_pipeline(request, file: UploadedFile):
         return {
             "error": f"Failed to process file '{file_name}'.",
             "details": str(e),
-        }
\ No newline at end of file
+        }
+
+
+@router.post("jobs", response={202: JobSubmitted})
+def submit_etl_job(
+    request,
+    file: UploadedFile,
+    bulk: bool = False,
+    stream: bool = False,
+    chunk_size: int = default_chunk_size,
+    workers: Optional[int] = None,
+    delta: bool = True,
+    partitions: Optional[int] = None,
+):
+    """
+    Save the uploaded file and run the ETL pipeline on it in the background.
+    Takes the same options as the synchronous endpoint and returns a job id
+    to poll for status and the result.
+    - partitions: with the queue backend, split the students across this many
+      independently loaded and retried partitions (ETL_QUEUE_PARTITIONS by default).
+      Queued jobs are always bulk loaded from the whole file.
+    """
+    job = submit_job(file, {
+        "bulk": bulk,
+        "stream": stream,
+        "chunk_size": chunk_size,
+        "workers": workers,
+        "delta": delta,
+    }, partitions=partitions)
+    return 202, JobSubmitted(job_id=job.id, status=job.status)
+
+
+@router.get("jobs/{job_id}", response={200: JobStatus, 404: ErrorResponse})
+def etl_job_status(request, job_id: UUID):
+    """
+    Return a job's status, current stage and rows processed per stage and table.
+    """
+    try:
+        job = EtlJob.objects.get(pk=job_id)
+    except EtlJob.DoesNotExist:
+        return 404, ErrorResponse(detail=f"No ETL job with id '{job_id}' exists")
+
+    return JobStatus(
+        job_id=job.id,
+        file_name=job.file_name,
+        status=job.status,
+        stage=job.stage,
+        progress=job.progress,
+        error=job.error or None,
+        partitions=[
+            PartitionStatus(number=p.number, rows=p.rows, status=p.status, attempts=p.attempts, error=p.error or None)
+            for p in job.partitions.all()
+        ],
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+    )
+
+
+@router.post("jobs/{job_id}/retry", response={202: JobSubmitted, 404: ErrorResponse, 409: ErrorResponse})
+def retry_etl_job(request, job_id: UUID):
+    """
+    Run a failed job again. Partitions of a queue-backed job that already
+    loaded are kept and only the failed ones run again; a thread-backed job
+    resumes from the last stage or table its failed run completed. A
+    thread-backed job left running by a process that stopped, and so has not
+    reported progress for ETL_CLAIM_TIMEOUT seconds, can be retried too.
+    """
+    try:
+        job = EtlJob.objects.get(pk=job_id)
+    except EtlJob.DoesNotExist:
+        return 404, ErrorResponse(detail=f"No ETL job with id '{job_id}' exists")
+
+    if job.status != EtlJob.Status.FAILED and not is_abandoned(job):
+        return 409, ErrorResponse(detail=f"ETL job '{job_id}' has not failed")
+
+    if job.backend == EtlJob.Backend.QUEUE:
+        retry_job(job)
+    elif not resubmit_job(job):
+        return 409, ErrorResponse(detail=f"ETL job '{job_id}' is already being retried")
+    job.refresh_from_db()
+    return 202, JobSubmitted(job_id=job.id, status=job.status)
+
+
+@router.get("jobs/{job_id}/result", response={200: JobResult, 202: JobResult, 404: ErrorResponse})
+def etl_job_result(request, job_id: UUID):
+    """
+    Return the summary of a finished job, or 202 while it is still queued or running.
+    """
+    try:
+        job = EtlJob.objects.get(pk=job_id)
+    except EtlJob.DoesNotExist:
+        return 404, ErrorResponse(detail=f"No ETL job with id '{job_id}' exists")
+
+    finished = job.status in (EtlJob.Status.SUCCEEDED, EtlJob.Status.FAILED)
+    result = job.result if job.status == EtlJob.Status.SUCCEEDED else None
+    if job.status == EtlJob.Status.FAILED:
+        result = {"error": f"Failed to process file '{job.file_name}'.", "details": job.error}
+    return (200 if finished else 202), JobResult(job_id=job.id, status=job.status, result=result)
+
+
+@router.get("runs", response=List[RunProfile])
+def list_etl_runs(request, limit: int = 20):
+    """
+    Return the step profiles of the most recent ETL runs, newest first.
+    Only the last ETL_PROFILE_HISTORY runs are kept.
+    """
+    return EtlRun.objects.order_by("-created_at", "-id")[:limit]
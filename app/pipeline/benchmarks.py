@@ -0,0 +1,219 @@
+"""
+Synthetic cohort data and timing helpers for benchmarking the ETL stages.
+"""
+import os
+import time
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from .utils import Transform, source_columns_list
+
+# Answer frequencies observed in the cohort 3 export, keyed by source column index.
+category_weights = {
+    2: {'18-24 years': 62, '25-34 years': 48, '35-44 years': 4, '45-54 years': 1},
+    3: {'Male': 70, 'Female': 45},
+    4: {'Kenya': 114, 'South Africa': 1, 'Nigeria': 1, 'Uganda': 1},
+    5: {
+        'WhatsApp': 53, 'Twitter': 38, 'LinkedIn': 13, 'Word of mouth': 7,
+        'Instagram': 2, 'through a geeks for geeks webinar': 1, 'Friend': 1
+    },
+    6: {'Less than six months': 72, '6 months - 1 year': 30, '1-3 years': 9, '4-6 years': 4},
+    7: {'Data science': 62, 'Data analysis': 53},
+    8: {'7-14 hours': 64, 'more than 14 hours': 35, 'less than 6 hours': 16},
+    9: {
+        'Upskill': 73, 'Learn data afresh': 23, 'Build a project portfolio': 15,
+        'Connect with fellow data professionals': 2,
+        'both upskilling and connecting with fellow data professionals': 1,
+        'Learn more about data analysis and also network with fellow data enthusiasts': 1
+    },
+    11: {
+        'Elementary - I have theoretical understanding of basic data analysis/ data science concepts': 56,
+        'Beginner - I have NO learning or work experience in data analysis/ data science': 42,
+        'Intermediate - I have theoretical knowledge and experience in data analysis/ data science': 16,
+        'Advanced - I have deep knowledge and experience in advanced data analysis/ data science concepts': 1
+    },
+    12: {'Yes': 112, 'No': 3},
+    14: {'No': 84, 'Yes': 31},
+}
+
+motivation_samples = [
+    'Desire to learn',
+    'To enter into the data analysis career',
+    'I want to upskill and connect with industry experts',
+    'Build a portfolio of real world data projects',
+    'Heavy inspiration from the community on the WhatsApp group',
+]
+
+
+def make_cohort_frame(rows, seed=0, id_prefix="ST"):
+    """Build a frame of `rows` synthetic registrations in the source export layout."""
+    rng = np.random.default_rng(seed)
+    data = {}
+
+    for num, col in enumerate(source_columns_list):
+        if num in category_weights:
+            values = list(category_weights[num].keys())
+            weights = np.array(list(category_weights[num].values()), dtype=float)
+            data[col] = rng.choice(values, size=rows, p=weights / weights.sum())
+
+    offsets = pd.to_timedelta(rng.integers(0, 14 * 24 * 3600, size=rows), unit="s")
+    data['Timestamp'] = pd.Timestamp("2024-11-25") + offsets
+    data['Id. No'] = [f"{id_prefix}{num}" for num in range(rows)]
+    data['What is your motivation to join the Everything Data mentorship program?'] = rng.choice(
+        motivation_samples, size=rows
+    )
+    data['Total score'] = rng.normal(69, 6.8, size=rows).clip(0, 100).round(6)
+
+    return pd.DataFrame(data)[source_columns_list]
+
+
+def write_workbook(path, rows, sheets=1, seed=0):
+    """
+    Write `rows` synthetic registrations split evenly across `sheets` worksheets.
+    Rows are streamed to disk, so million-row workbooks do not need the whole
+    workbook in memory.
+    """
+    frame = make_cohort_frame(rows, seed=seed)
+    workbook = Workbook(write_only=True)
+    for num, part in enumerate(np.array_split(np.arange(rows), sheets)):
+        sheet = workbook.create_sheet(f"Intake {num + 1}")
+        sheet.append(source_columns_list)
+        for row in frame.iloc[part].itertuples(index=False, name=None):
+            sheet.append(row)
+    workbook.save(path)
+    return path
+
+
+def write_csv(path, rows, seed=0):
+    """Write `rows` synthetic registrations as one CSV file in the export layout."""
+    make_cohort_frame(rows, seed=seed).to_csv(path, index=False)
+    return path
+
+
+def write_parquet(path, rows, seed=0):
+    """Write `rows` synthetic registrations as a Parquet file in the export layout."""
+    make_cohort_frame(rows, seed=seed).to_parquet(path, index=False)
+    return path
+
+
+def write_arrow(path, rows, seed=0):
+    """Write `rows` synthetic registrations as an Arrow IPC (Feather v2) file."""
+    make_cohort_frame(rows, seed=seed).to_feather(path)
+    return path
+
+
+file_writers = {
+    "xlsx": write_workbook,
+    "csv": write_csv,
+    "parquet": write_parquet,
+    "arrow": write_arrow,
+}
+
+
+class BaselineTransform(Transform):
+    """
+    The Transform steps as they were before they were vectorised: each step
+    copies its input and maps values row by row. Kept only as the baseline
+    the transform benchmark compares Transform against.
+    """
+
+    def _map_short_column_names(self, frame):
+        copy = frame.copy()
+        copy.columns = list(self.standard_cols)
+        return copy
+
+    def _standardise_columns(self, frame):
+        copy = frame.copy()
+        copy['referral'] = copy['referral'].apply(
+            lambda row: row.replace('through a geeks for geeks webinar', 'Geeks for Geeks')
+        )
+        copy['motivation'] = copy['motivation'].str.lower()
+        copy['experience'] = copy['experience'].apply(lambda row: row.replace('six', '6'))
+        copy['age_range'] = copy['age_range'].apply(lambda row: row.replace('years', ''))
+        copy['hours_available'] = copy['hours_available'].apply(lambda row: self.hours_map.get(row, row))
+        copy['track'] = copy['track'].str.lower()
+        copy['registration_date'] = copy['timestamp'].dt.date
+        copy['registration_time'] = copy['timestamp'].dt.time
+        return copy.drop(columns=['timestamp'])
+
+    def _split_skill_level(self, frame):
+        copy = frame.copy()
+        split_skill_level = copy['skill_level'].str.split('-')
+        skill_label = split_skill_level.map(lambda x: x[0].strip())
+        skill_description = split_skill_level.map(lambda x: x[1].lower().strip())
+        copy.drop(columns=['skill_level'], inplace=True)
+        copy['skill_level'] = skill_label.str.lower()
+        copy['skill_description'] = skill_description
+        new_standard_cols = ["registration_date", "registration_time"] + self.standard_cols[1:]
+        new_standard_cols.insert(new_standard_cols.index("skill_level") + 1, "skill_description")
+        return copy[new_standard_cols]
+
+    def _map_aim_categories(self, frame):
+        copy = frame.copy()
+        extract_aim = lambda x: x.split(" ")[1] if x.split(" ")[0] == 'Learn' else x.split(" ")[0]
+        copy['aim'] = copy['aim'].apply(lambda x: self.aims_map[extract_aim(x).lower()])
+        return copy
+
+    def _compact_columns(self, frame):
+        # The row-wise steps kept every column as Python objects
+        return frame
+
+
+def time_call(func, *args, repeat=1, **kwargs):
+    """Return the best wall time in seconds over `repeat` calls, and the last result."""
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def cohort_file(directory, rows, file_format, seed=0):
+    """Return the path of a generated cohort file, writing it on first use."""
+    path = os.path.join(directory, f"cohort-{rows}-{seed}.{file_format}")
+    if not os.path.exists(path):
+        file_writers[file_format](path + ".tmp", rows, seed=seed)
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def stage_results(profile, rows, file_format):
+    """Fold a run profile into one throughput and memory peak per ETL stage."""
+    stages = {}
+    for step in profile:
+        stage = step["step"].split(".")[0]
+        totals = stages.setdefault(stage, {"seconds": 0.0, "peak_memory": None, "queries": 0})
+        totals["seconds"] += step["seconds"]
+        totals["queries"] += step["queries"]
+        if step["peak_memory"] is not None:
+            totals["peak_memory"] = max(totals["peak_memory"] or 0, step["peak_memory"])
+    return [
+        {
+            "rows": rows,
+            "format": file_format,
+            "stage": stage,
+            "seconds": round(totals["seconds"], 6),
+            "rows_per_second": round(rows / totals["seconds"], 1) if totals["seconds"] else None,
+            "peak_memory": totals["peak_memory"],
+            "queries": totals["queries"],
+        }
+        for stage, totals in stages.items()
+    ]
+
+
+def find_regressions(results, baseline, threshold):
+    """
+    Compare stage results with a baseline run and return those that took more
+    than `threshold` (a fraction, 0.2 for 20%) longer for the same rows and format.
+    """
+    previous = {(item["rows"], item["format"], item["stage"]): item for item in baseline}
+    regressions = []
+    for item in results:
+        before = previous.get((item["rows"], item["format"], item["stage"]))
+        if before and before["seconds"] and item["seconds"] > before["seconds"] * (1 + threshold):
+            regressions.append(dict(item, baseline_seconds=before["seconds"],
+                                    slowdown=round(item["seconds"] / before["seconds"] - 1, 3)))
+    return regressions
@@ -0,0 +1,153 @@
+"""
+On-disk checkpoints that let a failed ETL run resume where it stopped.
+Each upload gets a directory under ETL_CHECKPOINT_ROOT, named after the
+SHA-256 of its bytes and a digest of the run's options, holding the extracted
+and cleaned frames as Parquet and a manifest.json of the stages and
+student-level tables that completed. Running the same file with the same
+options again skips everything the manifest records; the directory is
+removed once the run succeeds. Runs of the same file with other options keep
+their own directories, and a run holds an advisory lock on its directory, so
+a concurrent run with the same options waits for it rather than sharing its
+files.
+"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+
+import pandas as pd
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+manifest_name = "manifest.json"
+
+# First key of the advisory locks held on checkpoint directories
+checkpoint_lock_class = 0x45544C43
+
+
+def checkpoint_key(sha256, options):
+    """Name of the checkpoint directory of a run of the file `sha256` with `options`."""
+    digest = hashlib.sha256(json.dumps(options, sort_keys=True).encode()).hexdigest()[:12]
+    return f"{sha256}-{digest}"
+
+
+class Checkpoint:
+    """
+    Manifest and stage files of one upload's run. Holds a session advisory
+    lock on its directory until `release` is called or its `with` block exits.
+    """
+
+    def __init__(self, sha256, options, root=None):
+        self.key = checkpoint_key(sha256, options)
+        self.directory = os.path.join(root or settings.ETL_CHECKPOINT_ROOT, self.key)
+        self.path = os.path.join(self.directory, manifest_name)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s, hashtext(%s))", [checkpoint_lock_class, self.key])
+        self.manifest = self._read()
+        if self.manifest.get("options") != options:
+            # A run with other options would select or load different rows
+            if self.manifest:
+                logger.info(f"Discarding checkpoint {self.directory} made with other options")
+            self.reset(sha256, options)
+
+    def _read(self):
+        try:
+            with open(self.path) as manifest:
+                return json.load(manifest)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.manifest["updated_at"] = timezone.now().isoformat()
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as manifest:
+            json.dump(self.manifest, manifest, indent=2)
+        # Readers only ever see a complete manifest
+        os.replace(temporary, self.path)
+
+    @property
+    def completed(self):
+        """Names of the completed stages and tables, in the order they finished."""
+        return list(self.manifest["stages"]) + list(self.manifest["tables"])
+
+    def has_frame(self, stage):
+        """Return True if `stage` finished and its frame is on disk."""
+        info = self.manifest["stages"].get(stage)
+        return bool(info) and os.path.exists(os.path.join(self.directory, info["file"]))
+
+    def save_frame(self, stage, frame):
+        """
+        Write the output frame of `stage` as Parquet and record it. A frame
+        Parquet cannot hold, e.g. a column of mixed types, is not checkpointed.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        file_name = f"{stage}.parquet"
+        temporary = os.path.join(self.directory, f"{file_name}.tmp")
+        try:
+            frame.to_parquet(temporary, index=False)
+        except (ValueError, TypeError, ImportError) as e:
+            logger.warning(f"Could not checkpoint the '{stage}' stage: {e}")
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            return
+        os.replace(temporary, os.path.join(self.directory, file_name))
+        categorical = [col for col, dtype in frame.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+        self.manifest["stages"][stage] = {"file": file_name, "rows": len(frame.index), "categorical": categorical}
+        self._write()
+
+    def load_frame(self, stage):
+        """Read the checkpointed output frame of `stage`."""
+        info = self.manifest["stages"][stage]
+        frame = pd.read_parquet(os.path.join(self.directory, info["file"]))
+        # Parquet gives dates and times back as plain objects; keep them categorical
+        restore = [col for col in info["categorical"] if not isinstance(frame[col].dtype, pd.CategoricalDtype)]
+        return frame.astype({col: "category" for col in restore}) if restore else frame
+
+    def tables(self):
+        """Per-table results of the tables already loaded, keyed by table name."""
+        return dict(self.manifest["tables"])
+
+    def record_table(self, name, result=None):
+        """Record that table `name` committed, with its row counts if known."""
+        self.manifest["tables"][name] = result
+        self._write()
+
+    def remember(self, key, value):
+        """
+        Keep `value` under `key` the first time it is given and return the kept
+        value, so a resumed run reports what the first attempt saw.
+        """
+        if key not in self.manifest:
+            self.manifest[key] = value
+            self._write()
+        return self.manifest[key]
+
+    def reset(self, sha256, options):
+        """Drop everything checkpointed so far and start an empty manifest."""
+        self.clear()
+        self.manifest = {"sha256": sha256, "options": options, "stages": {}, "tables": {}}
+
+    def clear(self):
+        """Remove the checkpoint directory."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def release(self):
+        """Release the lock on the checkpoint directory."""
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s, hashtext(%s))", [checkpoint_lock_class, self.key])
+        except DatabaseError as e:
+            # A session lock goes with its connection, so a broken one has already released it
+            logger.warning(f"Could not release the lock on checkpoint {self.directory}: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
@@ -0,0 +1,77 @@
+"""
+Resolution of free-text country answers to ISO 3166-1 codes.
+`countries.by_name` scans every country name for each value it is given and
+returns an empty code when nothing matches exactly. Here the names, official
+names, ISO codes and a few common aliases are indexed once per process, and a
+whole column is resolved with a single vectorised lookup that ignores case
+and surrounding or repeated whitespace.
+"""
+from functools import lru_cache
+
+from django.utils import translation
+from django_countries import countries
+
+
+# Everyday names that are not among the ISO or common names django-countries knows
+country_aliases = {
+    "uk": "GB",
+    "great britain": "GB",
+    "england": "GB",
+    "usa": "US",
+    "us": "US",
+    "united states of america": "US",
+    "america": "US",
+    "drc": "CD",
+    "dr congo": "CD",
+    "democratic republic of congo": "CD",
+    "congo brazzaville": "CG",
+    "ivory coast": "CI",
+    "swaziland": "SZ",
+    "tanzania": "TZ",
+    "uae": "AE",
+}
+
+
+class UnresolvedCountriesError(ValueError):
+    """Raised with every country answer in an upload that matched no country."""
+
+    def __init__(self, unresolved):
+        self.unresolved = unresolved
+        listed = ", ".join(f"'{value}' ({count} rows)" for value, count in unresolved.items())
+        super().__init__(f"Could not match {len(unresolved)} country values to a country: {listed}")
+
+
+def normalise_names(values):
+    """Case-fold a Series of names and collapse its whitespace."""
+    return values.astype("string").str.strip().str.replace(r"\s+", " ", regex=True).str.casefold()
+
+
+@lru_cache(maxsize=None)
+def country_index():
+    """Map every normalised country name, alias and code to its two-letter code."""
+    index = {}
+    with translation.override("en"):
+        for code, name in countries:
+            index[str(name).casefold()] = code
+            index[code.casefold()] = code
+        for code, (alpha3, _) in countries.alt_codes.items():
+            if alpha3:
+                index[alpha3.casefold()] = code
+        for code, names in countries.shadowed_names.items():
+            for name in names:
+                index.setdefault(str(name).casefold(), code)
+    for alias, code in country_aliases.items():
+        index.setdefault(alias, code)
+    return index
+
+
+def resolve_countries(values):
+    """
+    Resolve a Series of country answers to ISO codes in one pass.
+    Returns the codes (missing where nothing matched) and a count of rows per
+    unresolved value, with blank answers counted under "".
+    """
+    codes = normalise_names(values).map(country_index()).astype("string")
+    missing = codes.isna()
+    unresolved = values[missing].fillna("").value_counts(sort=False).to_dict()
+    return codes, unresolved
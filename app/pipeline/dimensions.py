@@ -0,0 +1,155 @@
+"""
+Registry of the dimension tables the student-level tables point at.
+Each dimension row is identified by its natural key (the cleaned value, or the
+country code for Country), so its id stays the same across uploads. The
+registry keeps every key->id map in memory between loads, reads them all in
+one query when they go stale, and only inserts values the database has not
+seen before.
+"""
+import logging
+import threading
+
+import pandas as pd
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+
+from core.models import AgeRange, Country, Experience, Track, Referral, SkillLevel, Aim, HoursAvailable
+from .country_codes import resolve_countries, UnresolvedCountriesError
+from .models import DimensionVersion
+
+
+logger = logging.getLogger(__name__)
+
+# Cleaned column -> dimension model; the model's key field has the column's name
+dimension_models = {
+    'age_range': AgeRange,
+    'country': Country,
+    'experience': Experience,
+    'track': Track,
+    'referral': Referral,
+    'skill_level': SkillLevel,
+    'aim': Aim,
+    'hours_available': HoursAvailable,
+}
+
+# Serialises inserts of new dimension values across processes and hosts
+merge_lock_id = 0x45544C44
+
+
+class DimensionRegistry:
+    """In-process cache of natural key -> id for every dimension table."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._maps = None
+        self._signature = None
+
+    def invalidate(self):
+        """Drop the cached maps; the next lookup reads them again."""
+        with self._lock:
+            self._maps = None
+            self._signature = None
+
+    def _table_signature(self):
+        # A trigger on every dimension table moves the version on, whichever process wrote
+        return DimensionVersion.objects.values_list('version', flat=True).first()
+
+    def _read_maps(self):
+        parts = " UNION ALL ".join(
+            f"SELECT '{col}', id, {col}::text FROM {Model._meta.db_table}"
+            for col, Model in dimension_models.items()
+        )
+        maps = {col: {} for col in dimension_models}
+        with connection.cursor() as cursor:
+            cursor.execute(f"{parts} ORDER BY 2")
+            for col, pk, key in cursor.fetchall():
+                # Keep the first row if a value was stored more than once
+                maps[col].setdefault(key, pk)
+        return maps
+
+    def maps(self):
+        """Return the natural key -> id map of every dimension, refreshed if a table changed."""
+        signature = self._table_signature()
+        with self._lock:
+            if self._maps is None or signature != self._signature:
+                self._maps = self._read_maps()
+                self._signature = signature
+            return self._maps
+
+    def _natural_keys(self, frame, col):
+        column = frame[col]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            values = column.cat.categories
+        else:
+            values = pd.unique(column)
+        if col == 'country':
+            values = pd.Series(values, dtype=object)
+            codes, unresolved = resolve_countries(values)
+            if unresolved:
+                # Report how many rows carry each bad value, not just the distinct values
+                raise UnresolvedCountriesError(resolve_countries(column.astype(object))[1])
+            return dict(zip(values, codes))
+        return {value: value for value in values}
+
+    def _merge(self, missing, descriptions):
+        """Insert the missing natural keys, re-checking under a lock shared with other loaders."""
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", [merge_lock_id])
+            current = self._read_maps()
+            for col, keys in missing.items():
+                Model = dimension_models[col]
+                new_keys = [key for key in keys if key not in current[col]]
+                if not new_keys:
+                    continue
+                # Rows written with explicit ids leave the id sequence behind; move it past them
+                table = Model._meta.db_table
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1), "
+                        f"MAX(id) IS NOT NULL) FROM {table}"
+                    )
+                if col == 'skill_level':
+                    objects = [Model(skill_level=key, skill_description=descriptions[key]) for key in new_keys]
+                else:
+                    objects = [Model(**{col: key}) for key in new_keys]
+                Model.objects.bulk_create(objects)
+                logger.info(f"Added {len(objects)} new values to '{Model._meta.db_table}'")
+        self.invalidate()
+
+    def resolve(self, frame, columns):
+        """
+        Return a value -> id map for each of `columns`, covering the distinct
+        values in `frame`. Values not yet in their dimension table are inserted.
+        Raises UnresolvedCountriesError, before anything is written, if any
+        country answer matches no country.
+        """
+        keys = {col: self._natural_keys(frame, col) for col in columns}
+        maps = self.maps()
+        missing = {
+            col: [key for key in dict.fromkeys(keys[col].values()) if key not in maps[col]]
+            for col in columns
+        }
+        if any(missing.values()):
+            descriptions = {}
+            if missing.get('skill_level'):
+                skills = frame.drop_duplicates(subset=['skill_level'])
+                descriptions = dict(zip(skills['skill_level'], skills['skill_description']))
+            self._merge(missing, descriptions)
+            maps = self.maps()
+
+        return {col: {value: maps[col][key] for value, key in keys[col].items()} for col in columns}
+
+
+registry = DimensionRegistry()
+
+
+def _invalidate_registry(sender, **kwargs):
+    if sender in dimension_models.values():
+        registry.invalidate()
+
+
+# Edits made through the ORM (e.g. the admin) clear the cache at once; changes made
+# by other processes, including in-place updates, are picked up by the version check
+post_save.connect(_invalidate_registry, dispatch_uid="dimension_registry_save")
+post_delete.connect(_invalidate_registry, dispatch_uid="dimension_registry_delete")
@@ -0,0 +1,120 @@
+"""
+Background execution of ETL jobs.
+Uploads are saved to disk and run on a thread pool so the API worker that
+received them returns at once; job state lives in the database so any worker
+can answer status requests. With ETL_JOB_BACKEND set to 'queue' jobs are only
+recorded here and are run by `etl_worker` processes (see pipeline.queue).
+"""
+import os
+import socket
+import logging
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .models import EtlJob
+from .utils import run_pipeline
+
+
+logger = logging.getLogger(__name__)
+executor = ThreadPoolExecutor(max_workers=settings.ETL_MAX_CONCURRENT_JOBS, thread_name_prefix="etl-job")
+
+
+def save_upload(job, file):
+    """Write an uploaded file under ETL_UPLOAD_ROOT and return its path."""
+    os.makedirs(settings.ETL_UPLOAD_ROOT, exist_ok=True)
+    path = os.path.join(settings.ETL_UPLOAD_ROOT, f"{job.id}-{os.path.basename(file.name)}")
+    with open(path, "wb") as destination:
+        for chunk in file.chunks():
+            destination.write(chunk)
+    return path
+
+
+def submit_job(file, options, partitions=None):
+    """
+    Save the upload and record a queued job. The thread backend hands it to the
+    executor; the queue backend leaves it for a worker to split into `partitions`.
+    """
+    job = EtlJob(file_name=file.name, options=options, backend=settings.ETL_JOB_BACKEND)
+    if job.backend == EtlJob.Backend.QUEUE:
+        job.options = dict(options, partitions=partitions)
+    job.file_path = save_upload(job, file)
+    job.save()
+    if job.backend == EtlJob.Backend.THREAD:
+        executor.submit(_run_in_thread, job.id)
+    logger.info(f"Queued ETL job {job.id} for file '{job.file_name}'")
+    return job
+
+
+def is_abandoned(job):
+    """
+    Whether a running thread-backed job has stopped renewing its claim, e.g.
+    because the process running it was restarted. Queue-backed jobs are
+    reclaimed by workers on their own.
+    """
+    return (
+        job.backend == EtlJob.Backend.THREAD
+        and job.status == EtlJob.Status.RUNNING
+        and job.claimed_at is not None
+        and job.claimed_at < timezone.now() - timedelta(seconds=settings.ETL_CLAIM_TIMEOUT)
+    )
+
+
+def resubmit_job(job):
+    """
+    Run a failed or abandoned thread-backed job again. Its upload is kept until
+    it succeeds, and the run resumes from the stages and tables checkpointed by
+    the last one. Returns False if the job changed since it was read.
+    """
+    resubmitted = EtlJob.objects.filter(pk=job.pk, status=job.status, claimed_at=job.claimed_at).update(
+        status=EtlJob.Status.QUEUED, error="", progress={}, claimed_by="", claimed_at=None, finished_at=None
+    )
+    if not resubmitted:
+        return False
+    executor.submit(_run_in_thread, job.id)
+    logger.info(f"Resubmitted ETL job {job.id}")
+    return True
+
+
+def run_job(job_id):
+    """Run a queued job to completion, recording progress and the final result."""
+    job = EtlJob.objects.get(pk=job_id)
+    started_at = timezone.now()
+    # The claim is renewed with every progress report; a job whose claim goes stale can be retried
+    EtlJob.objects.filter(pk=job.pk).update(
+        status=EtlJob.Status.RUNNING,
+        started_at=started_at,
+        claimed_by=f"{socket.gethostname()}:{os.getpid()}",
+        claimed_at=started_at,
+    )
+
+    def progress(stage, key, rows):
+        stage_progress = job.progress.setdefault(stage, {})
+        stage_progress[key] = stage_progress.get(key, 0) + rows
+        EtlJob.objects.filter(pk=job.pk).update(stage=stage, progress=job.progress, claimed_at=timezone.now())
+
+    try:
+        result = run_pipeline(job.file_path, job.file_name, progress=progress, **job.options)
+    except Exception as e:
+        logger.error(f"ETL job {job.id} failed: {e}", exc_info=True)
+        EtlJob.objects.filter(pk=job.pk).update(
+            status=EtlJob.Status.FAILED, error=str(e), finished_at=timezone.now()
+        )
+        return
+
+    EtlJob.objects.filter(pk=job.pk).update(
+        status=EtlJob.Status.SUCCEEDED, result=result, finished_at=timezone.now()
+    )
+    os.remove(job.file_path)
+    logger.info(f"ETL job {job.id} completed for file '{job.file_name}'")
+
+
+def _run_in_thread(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        # Executor threads outlive requests, so release their connections here
+        connections.close_all()
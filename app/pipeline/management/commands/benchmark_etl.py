@@ -0,0 +1,218 @@
+"""
+Django command to benchmark the ETL stages on synthetic cohort workbooks.
+"""
+import os
+import json
+import platform
+import tempfile
+
+import numpy as np
+import pandas as pd
+from django_countries import countries
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from pipeline.utils import Extract, Transform, transform_kwargs, run_pipeline
+from pipeline.country_codes import country_index, resolve_countries
+from pipeline.benchmarks import (BaselineTransform, make_cohort_frame, write_workbook, time_call, cohort_file,
+    stage_results, find_regressions)
+
+# Row counts for the scaling benchmarks when --rows is not given
+scaling_rows = [1000, 10000, 100000, 1000000]
+
+
+class Command(BaseCommand):
+    """Django benchmark_etl command class."""
+    help = "Benchmark ETL stages on generated cohort workbooks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "benchmark", choices=["extract", "transform", "countries", "generate", "pipeline"],
+            help="Benchmark to run. 'generate' only writes the cohort files the pipeline benchmark reads."
+        )
+        parser.add_argument(
+            "--rows", type=int, nargs="+",
+            help=f"Row counts to generate (default 50000, or {scaling_rows} for generate and pipeline)."
+        )
+        parser.add_argument("--sheets", type=int, default=24, help="Number of worksheets to spread rows across.")
+        parser.add_argument(
+            "--workers", type=int, nargs="+", default=[1, 2, 4, 8],
+            help="Worker counts to compare for the parallel extract."
+        )
+        parser.add_argument("--repeat", type=int, default=1, help="Runs per measurement; the best is reported.")
+        parser.add_argument(
+            "--formats", nargs="+", default=["xlsx"], choices=["xlsx", "csv", "parquet", "arrow"],
+            help="File formats to generate and load."
+        )
+        parser.add_argument(
+            "--data-dir", default=os.path.join(tempfile.gettempdir(), "etl-benchmark"),
+            help="Directory where generated cohort files are cached between runs."
+        )
+        parser.add_argument("--output", default="etl-benchmark.json", help="Results file for the pipeline benchmark.")
+        parser.add_argument("--baseline", help="Earlier results file to compare against.")
+        parser.add_argument(
+            "--threshold", type=float, default=0.2,
+            help="Slowdown of a stage, as a fraction of the baseline, reported as a regression."
+        )
+        parser.add_argument("--stream", action="store_true", help="Load in streaming mode.")
+        parser.add_argument(
+            "--no-memory", action="store_true",
+            help="Skip the second, memory-traced run of each file (no peak memory in the results)."
+        )
+        parser.add_argument("--keepdb", action="store_true", help="Keep the benchmark database between runs.")
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        if not options["rows"]:
+            options["rows"] = scaling_rows if options["benchmark"] in ("generate", "pipeline") else [50000]
+        getattr(self, f"_benchmark_{options['benchmark']}")(options)
+
+    def _benchmark_extract(self, options):
+        extractor = Extract()
+        rows = options["rows"][0]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cohort.xlsx")
+            self.stdout.write(f"Writing {rows} rows across {options['sheets']} sheets...")
+            write_workbook(path, rows, sheets=options["sheets"])
+
+            baseline = None
+            for workers in options["workers"]:
+                seconds, frame = time_call(
+                    extractor.merge_frames, path, workers=workers, repeat=options["repeat"]
+                )
+                baseline = baseline or seconds
+                self.stdout.write(
+                    f"workers={workers:<3} {seconds:8.2f}s  {len(frame) / seconds:10.0f} rows/s  "
+                    f"speedup={baseline / seconds:5.2f}x"
+                )
+
+    def _benchmark_transform(self, options):
+        variants = [
+            ("baseline", BaselineTransform(**transform_kwargs)),
+            ("vectorised", Transform(**transform_kwargs)),
+        ]
+        steps = [
+            "_map_short_column_names",
+            "_standardise_columns",
+            "_split_skill_level",
+            "_map_aim_categories",
+            "_compact_columns",
+        ]
+        for rows in options["rows"]:
+            source = make_cohort_frame(rows)
+            source.columns = [col.lower() for col in source.columns]
+            totals = {}
+            for variant, transformer in variants:
+                self.stdout.write(f"Transform steps at {rows} rows ({variant}):")
+                frame, total = source, 0
+                # As in clean_data, the steps run under copy-on-write
+                with pd.option_context("mode.copy_on_write", variant == "vectorised"):
+                    for step in steps:
+                        seconds, frame = time_call(getattr(transformer, step), frame, repeat=options["repeat"])
+                        total += seconds
+                        self.stdout.write(f"  {step:<26} {seconds:8.3f}s  {rows / seconds:12.0f} rows/s")
+                totals[variant] = total
+                self.stdout.write(f"  {'clean_data':<26} {total:8.3f}s  {rows / total:12.0f} rows/s")
+            self.stdout.write(f"  speedup={totals['baseline'] / totals['vectorised']:5.2f}x")
+
+    def _benchmark_countries(self, options):
+        # Free-text answers: real names with the case and spacing people type
+        names = [str(name) for _, name in countries]
+        spellings = [str.lower, str.upper, lambda name: f"  {name} ", lambda name: name.replace(" ", "  ")]
+        country_index()
+
+        for rows in options["rows"]:
+            rng = np.random.default_rng(0)
+            picks = rng.integers(len(names), size=rows)
+            styles = rng.integers(len(spellings), size=rows)
+            values = pd.Series([spellings[style](names[pick]) for pick, style in zip(picks, styles)])
+
+            per_row, codes = time_call(lambda: [countries.by_name(value) for value in values], repeat=options["repeat"])
+            vectorised, (resolved, unresolved) = time_call(resolve_countries, values, repeat=options["repeat"])
+            self.stdout.write(f"Country resolution at {rows} rows:")
+            self.stdout.write(
+                f"  {'by_name per row':<18} {per_row:8.3f}s  {rows / per_row:12.0f} rows/s  "
+                f"unmatched={sum(code == '' for code in codes)}"
+            )
+            self.stdout.write(
+                f"  {'resolve_countries':<18} {vectorised:8.3f}s  {rows / vectorised:12.0f} rows/s  "
+                f"unmatched={sum(unresolved.values())}  speedup={per_row / vectorised:5.1f}x"
+            )
+
+    def _benchmark_generate(self, options):
+        os.makedirs(options["data_dir"], exist_ok=True)
+        for rows in options["rows"]:
+            for file_format in options["formats"]:
+                seconds, path = time_call(cohort_file, options["data_dir"], rows, file_format)
+                self.stdout.write(f"{path}  ({seconds:.1f}s)")
+
+    def _benchmark_pipeline(self, options):
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as file:
+                baseline = json.load(file)["results"]
+
+        os.makedirs(options["data_dir"], exist_ok=True)
+        files = [
+            (rows, file_format, cohort_file(options["data_dir"], rows, file_format))
+            for rows in options["rows"] for file_format in options["formats"]
+        ]
+
+        # Load into a throwaway database so benchmark students never reach real data
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        results = []
+        try:
+            for rows, file_format, path in files:
+                # tracemalloc slows Python-heavy stages several times over, so
+                # timings come from an untraced run and peaks from a traced one
+                timed = self._run_pipeline(path, rows, file_format, options["stream"], trace_memory=False)
+                if not options["no_memory"]:
+                    traced = self._run_pipeline(path, rows, file_format, options["stream"], trace_memory=True)
+                    for item, traced_item in zip(timed, traced):
+                        item["peak_memory"] = traced_item["peak_memory"]
+
+                for item in timed:
+                    results.append(item)
+                    memory = f"{item['peak_memory'] / 2**20:9.1f} MiB" if item["peak_memory"] is not None else ""
+                    self.stdout.write(
+                        f"{rows:>8} {file_format:<7} {item['stage']:<10} {item['seconds']:9.3f}s "
+                        f"{item['rows_per_second'] or 0:12.0f} rows/s {memory}"
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+
+        regressions = find_regressions(results, baseline, options["threshold"]) if baseline else []
+        with open(options["output"], "w") as file:
+            json.dump({
+                "created_at": timezone.now().isoformat(),
+                "environment": {
+                    "python": platform.python_version(),
+                    "pandas": pd.__version__,
+                    "cpus": os.cpu_count(),
+                    "stream": options["stream"],
+                    "trace_memory": not options["no_memory"],
+                },
+                "threshold": options["threshold"],
+                "results": results,
+                "regressions": regressions,
+            }, file, indent=2)
+        self.stdout.write(f"Results written to {options['output']}")
+
+        for item in regressions:
+            self.stderr.write(
+                f"Regression: {item['stage']} at {item['rows']} {item['format']} rows took "
+                f"{item['seconds']:.3f}s vs {item['baseline_seconds']:.3f}s (+{item['slowdown']:.0%})"
+            )
+        if regressions:
+            raise CommandError(f"{len(regressions)} stages regressed by more than {options['threshold']:.0%}")
+
+    def _run_pipeline(self, path, rows, file_format, stream, trace_memory):
+        with connection.cursor() as cursor:
+            cursor.execute("TRUNCATE core_student CASCADE")
+        with override_settings(ETL_PROFILE_MEMORY=trace_memory):
+            summary = run_pipeline(path, os.path.basename(path), bulk=True, stream=stream, delta=False)
+        return stage_results(summary["profile"], rows, file_format)
@@ -0,0 +1,55 @@
+"""
+Django command to run ETL workers against the database-backed job queue.
+"""
+import os
+import time
+import socket
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from pipeline.queue import run_next
+
+
+def work(poll, once):
+    """Run queued work until the queue is empty (with `once`) or forever."""
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    try:
+        while True:
+            if run_next(worker):
+                continue
+            if once:
+                return
+            time.sleep(poll)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    """Django etl_worker command class."""
+    help = "Claim and run queued ETL jobs and partitions. Start as many as needed, on any host."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=1, help="Worker processes to start on this host.")
+        parser.add_argument("--poll", type=float, default=2.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        poll, once = options["poll"], options["once"]
+        if options["processes"] <= 1:
+            work(poll, once)
+            return
+
+        # Forked children must open their own database connections
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        processes = [
+            context.Process(target=work, args=(poll, once)) for _ in range(options["processes"])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Started {len(processes)} ETL workers")
+        for process in processes:
+            process.join()
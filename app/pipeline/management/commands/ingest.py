@@ -0,0 +1,158 @@
+"""
+Django command to load cohort files from disk without going through the API.
+"""
+import os
+import sys
+import glob
+import time
+import logging
+import multiprocessing
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from pipeline.utils import run_pipeline, default_chunk_size
+
+
+logger = logging.getLogger(__name__)
+
+# Files picked up when a directory is given
+upload_extensions = ('.xlsx', '.xlsm', '.csv', '.parquet', '.arrow', '.feather', '.ipc')
+
+
+def find_files(paths):
+    """Expand files, glob patterns and directories (searched recursively) into sorted unique paths."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                found.extend(
+                    os.path.join(root, name) for name in names
+                    if name.lower().endswith(upload_extensions) and not name.startswith('~$')
+                )
+        elif glob.has_magic(path):
+            found.extend(match for match in glob.glob(path, recursive=True) if os.path.isfile(match))
+        else:
+            found.append(path)
+    return sorted(dict.fromkeys(os.path.abspath(path) for path in found))
+
+
+def ingest_file(path, options):
+    """
+    Run the pipeline over one file. Returns its rows, time and summary, or the
+    error it failed with, so one bad file does not stop the others.
+    """
+    name = os.path.basename(path)
+    rows = [0]
+    start = time.perf_counter()
+
+    def progress(stage, key, count):
+        if stage != "extract":
+            return
+        rows[0] += count
+        if options["verbose"]:
+            rate = rows[0] / max(time.perf_counter() - start, 1e-9)
+            sys.stdout.write(f"  {name}: {rows[0]:,} rows extracted ({rate:,.0f} rows/s)\n")
+            sys.stdout.flush()
+
+    try:
+        summary = run_pipeline(
+            path, name, bulk=True, stream=options["chunk_size"] is not None,
+            chunk_size=options["chunk_size"] or default_chunk_size, delta=options["delta"], progress=progress,
+        )
+    except Exception as e:
+        logger.error(f"Could not ingest '{path}': {e}", exc_info=True)
+        return {"path": path, "rows": rows[0], "seconds": time.perf_counter() - start, "error": str(e)}
+    summary.pop("profile", None)
+    return {"path": path, "rows": rows[0], "seconds": time.perf_counter() - start, "summary": summary}
+
+
+def _ingest_star(args):
+    return ingest_file(*args)
+
+
+class Command(BaseCommand):
+    """Django ingest command class."""
+    help = "Load cohort workbooks, CSV, Parquet or Arrow files from disk into the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths", nargs="+",
+            help="Files, glob patterns (quote them; ** is recursive) or directories to load."
+        )
+        parser.add_argument("--workers", type=int, default=1, help="Files to load at the same time.")
+        parser.add_argument(
+            "--chunk-size", type=int,
+            help="Stream each file in chunks of this many rows instead of reading it whole."
+        )
+        parser.add_argument(
+            "--no-delta", action="store_true",
+            help="Reload files that were already loaded and rewrite unchanged students."
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        files = find_files(options["paths"])
+        if not files:
+            raise CommandError("No files to ingest.")
+        missing = [path for path in files if not os.path.isfile(path)]
+        if missing:
+            raise CommandError(f"Not a file: {', '.join(missing)}")
+
+        file_options = {
+            "chunk_size": options["chunk_size"],
+            "delta": not options["no_delta"],
+            "verbose": options["verbosity"] >= 2,
+        }
+        workers = max(1, min(options["workers"], len(files)))
+        self.stdout.write(f"Ingesting {len(files)} files with {workers} workers")
+
+        start = time.perf_counter()
+        tasks = [(path, file_options) for path in files]
+        if workers == 1:
+            results = self._report(map(_ingest_star, tasks), len(files), start)
+        else:
+            # Forked children must open their own database connections
+            connections.close_all()
+            with multiprocessing.get_context("fork").Pool(workers) as pool:
+                results = self._report(pool.imap_unordered(_ingest_star, tasks), len(files), start)
+
+        self._summarise(results, time.perf_counter() - start)
+
+    def _report(self, outcomes, total, start):
+        results = []
+        rows = 0
+        for done, result in enumerate(outcomes, start=1):
+            results.append(result)
+            rows += result["rows"]
+            elapsed = time.perf_counter() - start
+            name = os.path.basename(result["path"])
+            if "error" in result:
+                status = self.style.ERROR(f"failed: {result['error']}")
+            elif result["summary"].get("skipped"):
+                status = "already loaded, skipped"
+            else:
+                rate = result["rows"] / max(result["seconds"], 1e-9)
+                status = f"{result['rows']:,} rows in {result['seconds']:.1f}s ({rate:,.0f} rows/s)"
+            self.stdout.write(
+                f"[{done}/{total}] {name}: {status}; {rows:,} rows so far ({rows / max(elapsed, 1e-9):,.0f} rows/s)"
+            )
+        return results
+
+    def _summarise(self, results, seconds):
+        failed = [result for result in results if "error" in result]
+        skipped = [result for result in results if "summary" in result and result["summary"].get("skipped")]
+        rows = sum(result["rows"] for result in results if "summary" in result)
+        quarantined = sum(
+            result["summary"].get("quarantined", {}).get("rows", 0) for result in results if "summary" in result
+        )
+        loaded = len(results) - len(failed) - len(skipped)
+
+        self.stdout.write(
+            f"Loaded {loaded} files ({rows:,} rows, {quarantined:,} quarantined) in {seconds:.1f}s "
+            f"({rows / max(seconds, 1e-9):,.0f} rows/s); {len(skipped)} skipped, {len(failed)} failed"
+        )
+        if failed:
+            for result in failed:
+                self.stderr.write(f"  {result['path']}: {result['error']}")
+            raise CommandError(f"{len(failed)} of {len(results)} files failed to ingest.")
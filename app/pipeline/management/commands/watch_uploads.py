@@ -0,0 +1,33 @@
+"""
+Django command to load files dropped into a watched folder as they arrive.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from pipeline.watcher import watch
+
+
+class Command(BaseCommand):
+    """Django watch_uploads command class."""
+    help = "Watch a folder and load each file copied into it once it stops changing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--directory", default=settings.ETL_WATCH_DIR, help="Folder to watch.")
+        parser.add_argument(
+            "--interval", type=float, default=settings.ETL_WATCH_INTERVAL, help="Seconds between polls."
+        )
+        parser.add_argument(
+            "--settle", type=float, default=settings.ETL_WATCH_SETTLE_SECONDS,
+            help="Seconds a file must go unmodified before it is loaded."
+        )
+        parser.add_argument(
+            "--max-batches", type=int, default=settings.ETL_WATCH_MAX_BATCHES,
+            help="Files to load at the same time."
+        )
+        parser.add_argument("--once", action="store_true", help="Load the files that are ready, then exit.")
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        self.stdout.write(f"Watching {options['directory']} for uploads")
+        watch(options["directory"], options["interval"], options["max_batches"],
+              settle_seconds=options["settle"], once=options["once"])
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+# Dimension rows used to be written with explicit ids, which never advanced the
+# id sequences; move each sequence past the ids already taken
+dimension_tables = [
+    'core_agerange',
+    'core_country',
+    'core_experience',
+    'core_track',
+    'core_referral',
+    'core_skilllevel',
+    'core_aim',
+    'core_hoursavailable',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_fact_table_unique_constraints'),
+        ('pipeline', '0003_etl_queue'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) "
+                f"FROM {table}"
+                for table in dimension_tables
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,55 @@
+from django.db import migrations, models
+
+
+dimension_tables = [
+    'core_agerange',
+    'core_country',
+    'core_experience',
+    'core_track',
+    'core_referral',
+    'core_skilllevel',
+    'core_aim',
+    'core_hoursavailable',
+]
+
+# Every write to a dimension table, from any process, moves the version on. The
+# values come from a sequence, so a rolled-back write never hands out a number twice
+bump_function = """
+CREATE SEQUENCE pipeline_dimensionversion_seq;
+CREATE FUNCTION pipeline_bump_dimension_version() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO pipeline_dimensionversion (id, version)
+    VALUES (1, nextval('pipeline_dimensionversion_seq'))
+    ON CONFLICT (id) DO UPDATE SET version = EXCLUDED.version;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pipeline', '0004_dimension_sequences'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DimensionVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunSQL(
+            sql=[bump_function] + [
+                f"CREATE TRIGGER bump_dimension_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table} "
+                f"FOR EACH STATEMENT EXECUTE FUNCTION pipeline_bump_dimension_version()"
+                for table in dimension_tables
+            ],
+            reverse_sql=[f"DROP TRIGGER bump_dimension_version ON {table}" for table in dimension_tables] + [
+                "DROP FUNCTION pipeline_bump_dimension_version()",
+                "DROP SEQUENCE pipeline_dimensionversion_seq",
+            ],
+        ),
+    ]
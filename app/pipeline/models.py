@@ -0,0 +1,119 @@
+import uuid
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from core.models import Student
+
+
+class Upload(models.Model):
+    """A workbook that has been loaded, identified by the hash of its bytes."""
+    file_name = models.CharField(max_length=255)
+    sha256 = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.file_name
+
+
+class StudentFingerprint(models.Model):
+    """Hash of a student's cleaned row as of the last load that wrote it."""
+    student = models.OneToOneField(
+        Student,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        to_field='student_id',
+        db_column='student_id'
+    )
+    row_hash = models.BigIntegerField()
+
+
+class EtlJob(models.Model):
+    """An upload queued for processing outside the request that submitted it."""
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        SUCCEEDED = "succeeded", "Succeeded"
+        FAILED = "failed", "Failed"
+
+    class Backend(models.TextChoices):
+        THREAD = "thread", "In-process thread"
+        QUEUE = "queue", "Worker queue"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    file_name = models.CharField(max_length=255)
+    file_path = models.CharField(max_length=1024)
+    options = models.JSONField(default=dict)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.QUEUED)
+    backend = models.CharField(max_length=16, choices=Backend.choices, default=Backend.THREAD)
+    partition_count = models.PositiveIntegerField(default=0)
+    dimension_maps = models.JSONField(null=True, blank=True)
+    claimed_by = models.CharField(max_length=255, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    stage = models.CharField(max_length=32, blank=True)
+    progress = models.JSONField(default=dict)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.file_name} ({self.status})"
+
+
+class EtlRun(models.Model):
+    """Step-by-step profile of a completed ETL run, kept for the last ETL_PROFILE_HISTORY runs."""
+    file_name = models.CharField(max_length=255)
+    seconds = models.FloatField()
+    profile = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.file_name} ({self.seconds:.2f}s)"
+
+
+class EtlPartition(models.Model):
+    """A hash slice of a queued job's students, loaded by one worker in one transaction."""
+    job = models.ForeignKey(EtlJob, on_delete=models.CASCADE, related_name='partitions')
+    number = models.PositiveIntegerField()
+    file_path = models.CharField(max_length=1024)
+    rows = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=16, choices=EtlJob.Status.choices, default=EtlJob.Status.QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    claimed_by = models.CharField(max_length=255, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'number'], name='unique_etl_partition_job_number')
+        ]
+        ordering = ['job', 'number']
+
+    def __str__(self):
+        return f"{self.job.file_name} #{self.number} ({self.status})"
+
+
+class QuarantinedRow(models.Model):
+    """A cleaned row of an upload that failed validation and was not loaded."""
+    file_name = models.CharField(max_length=255)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    student_id = models.CharField(max_length=255, blank=True)
+    reasons = models.JSONField(default=list)
+    row = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.student_id or '?'} in {self.file_name}"
+
+
+class DimensionVersion(models.Model):
+    """
+    Version of the dimension tables as a whole. A trigger on each table moves it
+    on with every write, so caches of the tables can tell when they are stale.
+    """
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.version)
@@ -0,0 +1,11 @@
+"""
+Worksheet parsing run in worker processes by the parallel extract.
+Kept free of Django imports so spawned workers can import it without app setup.
+"""
+import pandas as pd
+
+
+def parse_sheet(source, sheet):
+    """Parse a single worksheet from a workbook path."""
+    with pd.ExcelFile(source) as xls_file:
+        return xls_file.parse(sheet)
@@ -0,0 +1,114 @@
+"""
+Per-step instrumentation for the ETL pipeline.
+A Profiler records, for every named step it wraps, the wall time, rows in and
+out, the peak memory allocated while the step ran (via tracemalloc) and the
+number of SQL statements issued. Steps that run more than once, such as the
+per-chunk steps of a streaming load, are added up under one name.
+"""
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+from .models import EtlRun
+
+
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+
+def _start_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracing_users += 1
+
+
+def _stop_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+class Profiler:
+    """
+    Collects step measurements for one pipeline run. Memory is only traced with
+    `trace_memory`; tracemalloc is process-wide, so runs overlapping in other
+    threads add to each other's peaks.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.steps = {}
+        if trace_memory:
+            _start_tracing()
+
+    def close(self):
+        """Stop memory tracing for this run."""
+        if self.trace_memory:
+            self.trace_memory = False
+            _stop_tracing()
+
+    @contextmanager
+    def step(self, name, rows_in=None):
+        """
+        Measure the enclosed block as step `name`. The yielded dict takes the
+        step's output row count under "rows_out".
+        """
+        record = {"rows_out": None}
+        queries = [0]
+
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        memory = self.trace_memory and tracemalloc.is_tracing()
+        if memory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count_query):
+                yield record
+        finally:
+            seconds = time.perf_counter() - start
+            peak = max(tracemalloc.get_traced_memory()[1] - baseline, 0) if memory else None
+            self._add(name, seconds, rows_in, record["rows_out"], peak, queries[0])
+
+    def _add(self, name, seconds, rows_in, rows_out, peak, queries):
+        totals = self.steps.setdefault(name, {
+            "step": name, "calls": 0, "seconds": 0.0, "rows_in": None,
+            "rows_out": None, "peak_memory": None, "queries": 0,
+        })
+        totals["calls"] += 1
+        totals["seconds"] += seconds
+        totals["queries"] += queries
+        for key, value in (("rows_in", rows_in), ("rows_out", rows_out)):
+            if value is not None:
+                totals[key] = (totals[key] or 0) + int(value)
+        if peak is not None:
+            totals["peak_memory"] = max(totals["peak_memory"] or 0, peak)
+
+    def report(self):
+        """Return the steps in the order they first ran, with rounded timings."""
+        return [dict(step, seconds=round(step["seconds"], 6)) for step in self.steps.values()]
+
+    def merge(self, report):
+        """Add the steps of another run's report, e.g. one partition of a queued job."""
+        for step in report:
+            self._add(step["step"], step["seconds"], step["rows_in"], step["rows_out"],
+                      step["peak_memory"], step["queries"])
+            self.steps[step["step"]]["calls"] += step["calls"] - 1
+
+
+def record_run(file_name, seconds, profile):
+    """Keep the profile of a finished run, dropping runs beyond ETL_PROFILE_HISTORY."""
+    EtlRun.objects.create(file_name=file_name, seconds=round(seconds, 6), profile=profile)
+    stale = EtlRun.objects.order_by("-created_at", "-id").values_list("id", flat=True)[settings.ETL_PROFILE_HISTORY:]
+    EtlRun.objects.filter(id__in=list(stale)).delete()
@@ -0,0 +1,331 @@
+"""
+Durable ETL work queue backed by Postgres.
+Queued jobs and their partitions are rows in the database. Workers claim them
+with SELECT ... FOR UPDATE SKIP LOCKED, so any number of `etl_worker` processes
+on any number of hosts can share the queue without claiming the same work.
+
+A job is first prepared by one worker: the upload is extracted and cleaned,
+the dimension tables are loaded and the students to write are split into
+partitions by a hash of their id. Each partition is then loaded by whichever
+worker claims it, in a single transaction, so a failed partition can be
+retried on its own without redoing the ones that already succeeded.
+"""
+import os
+import shutil
+import logging
+from datetime import timedelta
+
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from datasets.cache import bump_data_version
+from datasets.materialized import schedule_refresh
+from .models import EtlJob, EtlPartition, Upload
+from .profiling import Profiler, record_run
+from .utils import Extract, Transform, Load, category_columns, transform_kwargs
+from .validation import Quarantine
+
+
+logger = logging.getLogger(__name__)
+
+row_hash_column = "_row_hash"
+
+
+def _lease_cutoff():
+    return timezone.now() - timedelta(seconds=settings.ETL_CLAIM_TIMEOUT)
+
+
+def partition_dir(job):
+    """Directory holding the partition files of a job."""
+    return os.path.join(settings.ETL_UPLOAD_ROOT, str(job.id))
+
+
+def claim_partition(worker):
+    """
+    Claim the oldest loadable partition: queued, failed with attempts left, or
+    running under a claim that has outlived its lease. Returns None if there is none.
+    """
+    claimable = (
+        Q(status=EtlJob.Status.QUEUED)
+        | Q(status=EtlJob.Status.FAILED, attempts__lt=settings.ETL_PARTITION_MAX_ATTEMPTS)
+        | Q(status=EtlJob.Status.RUNNING, claimed_at__lt=_lease_cutoff())
+    )
+    with transaction.atomic():
+        partition = (
+            EtlPartition.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(claimable, job__status=EtlJob.Status.RUNNING)
+            .order_by("job__created_at", "number")
+            .first()
+        )
+        if partition is None:
+            return None
+        partition.status = EtlJob.Status.RUNNING
+        partition.attempts = F("attempts") + 1
+        partition.claimed_by = worker
+        partition.claimed_at = timezone.now()
+        partition.save(update_fields=["status", "attempts", "claimed_by", "claimed_at"])
+    partition.refresh_from_db()
+    return partition
+
+
+def claim_job(worker):
+    """
+    Claim the oldest queued job, or one whose preparing worker stopped renewing
+    its claim. Returns None if there is none.
+    """
+    claimable = Q(status=EtlJob.Status.QUEUED) | Q(
+        status=EtlJob.Status.RUNNING, partition_count=0, claimed_at__lt=_lease_cutoff()
+    )
+    with transaction.atomic():
+        job = (
+            EtlJob.objects.select_for_update(skip_locked=True)
+            .filter(claimable, backend=EtlJob.Backend.QUEUE)
+            .order_by("created_at")
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = EtlJob.Status.RUNNING
+        job.claimed_by = worker
+        job.claimed_at = timezone.now()
+        job.started_at = job.started_at or job.claimed_at
+        job.progress = {}
+        job.save(update_fields=["status", "claimed_by", "claimed_at", "started_at", "progress"])
+    return job
+
+
+def run_next(worker):
+    """
+    Claim and run one unit of work, preferring partitions of jobs already in
+    flight over preparing new jobs. Returns False if the queue was empty.
+    """
+    partition = claim_partition(worker)
+    if partition is not None:
+        run_partition(partition)
+        return True
+
+    job = claim_job(worker)
+    if job is not None:
+        prepare_job(job)
+        return True
+    return False
+
+
+class ClaimLost(Exception):
+    """Raised when another worker has taken over a job this one was preparing."""
+
+
+def _renew_claim(job, **fields):
+    """Renew a prepared job's claim, saving `fields` with it, unless another worker has taken it over."""
+    renewed = EtlJob.objects.filter(
+        pk=job.pk, status=EtlJob.Status.RUNNING, claimed_by=job.claimed_by
+    ).update(claimed_at=timezone.now(), **fields)
+    if not renewed:
+        raise ClaimLost(f"ETL job {job.id} is no longer claimed by '{job.claimed_by}'")
+
+
+def _publish_load():
+    # Cached dataset results and materialized views built from the old rows are stale from here on
+    bump_data_version()
+    schedule_refresh()
+
+
+def _fail_job(job, error):
+    logger.error(f"ETL job {job.id} failed: {error}")
+    EtlJob.objects.filter(pk=job.pk).update(
+        status=EtlJob.Status.FAILED, error=error, finished_at=timezone.now()
+    )
+    # Partitions loaded before the failure are kept
+    if job.partitions.filter(status=EtlJob.Status.SUCCEEDED).exists():
+        _publish_load()
+
+
+def prepare_job(job):
+    """
+    Extract and clean a claimed job's upload, load its dimension tables and
+    split the students to write into partition files.
+    """
+    def progress(stage, key, rows):
+        stage_progress = job.progress.setdefault(stage, {})
+        stage_progress[key] = stage_progress.get(key, 0) + rows
+        # Reporting progress also renews the claim
+        _renew_claim(job, stage=stage, progress=job.progress)
+
+    options = job.options
+    delta = options.get("delta", True)
+    extractor = Extract()
+    profiler = Profiler(trace_memory=settings.ETL_PROFILE_MEMORY)
+    try:
+        sha256 = extractor.fingerprint(job.file_path)
+        if delta and Upload.objects.filter(sha256=sha256).exists():
+            _finish_job(job, {
+                "message": f"File '{job.file_name}' is identical to a previous upload and was not reprocessed.",
+                "skipped": True,
+            })
+            return
+
+        with profiler.step("extract") as record:
+            raw_data = extractor.merge_frames(job.file_path, workers=options.get("workers"))
+            record["rows_out"] = None if raw_data is None else len(raw_data.index)
+        if raw_data is None:
+            raise ValueError("Could not extract any sheets from the file.")
+        progress("extract", "rows", len(raw_data.index))
+
+        clean_data = Transform(**transform_kwargs, profiler=profiler).clean_data(raw_data)
+        if clean_data is None:
+            raise ValueError("Could not clean the extracted data.")
+        progress("transform", "rows", len(clean_data.index))
+
+        quarantine = Quarantine(job.file_name, sha256)
+        with profiler.step("validate", len(clean_data.index)) as record:
+            clean_data = quarantine.split(clean_data)
+            record["rows_out"] = len(clean_data.index)
+
+        loader = Load(profiler=profiler)
+        _renew_claim(job)
+        cat_maps = loader.load_dimensions(clean_data, category_columns)
+        rows, hashes, counts = loader.select_rows(clean_data, delta)
+        _renew_claim(job)
+
+        count = options.get("partitions") or settings.ETL_QUEUE_PARTITIONS
+        buckets = pd.util.hash_array(rows["id"].to_numpy(dtype=object)) % count
+        directory = partition_dir(job)
+        os.makedirs(directory, exist_ok=True)
+
+        partitions = []
+        for number in range(count):
+            selected = buckets == number
+            if not selected.any():
+                continue
+            path = os.path.join(directory, f"part-{number}.parquet")
+            rows[selected].assign(**{row_hash_column: hashes.to_numpy()[selected]}).to_parquet(path, index=False)
+            partitions.append(
+                EtlPartition(job=job, number=number, file_path=path, rows=int(selected.sum()))
+            )
+        profiler.close()
+
+        result = {
+            "message": f"File '{job.file_name}' has been loaded to the database successfully.",
+            "profile": profiler.report(),
+            "quarantined": quarantine.summary(),
+        }
+        if counts is not None:
+            result["students"] = counts
+
+        with transaction.atomic():
+            # Another worker may have reclaimed the job while this one was slow; only the owner writes
+            owned = EtlJob.objects.select_for_update().filter(
+                pk=job.pk, status=EtlJob.Status.RUNNING, claimed_by=job.claimed_by
+            )
+            if not owned.exists():
+                raise ClaimLost(f"ETL job {job.id} is no longer claimed by '{job.claimed_by}'")
+            EtlPartition.objects.bulk_create(partitions)
+            quarantine.save()
+            owned.update(
+                stage="load",
+                partition_count=len(partitions),
+                dimension_maps={col: {str(k): int(v) for k, v in m.items()} for col, m in cat_maps.items()},
+                result=result,
+                options=dict(options, sha256=sha256),
+                claimed_by="",
+                claimed_at=None,
+            )
+    except ClaimLost as e:
+        # The new owner prepares the job; its partition files are written over
+        logger.warning(f"Stopped preparing ETL job {job.id}: {e}")
+        return
+    except Exception as e:
+        logger.error(f"ETL job {job.id} could not be prepared: {e}", exc_info=True)
+        _fail_job(job, str(e))
+        return
+    finally:
+        profiler.close()
+    logger.info(f"ETL job {job.id} prepared {len(partitions)} partitions of {len(rows.index)} students")
+
+    if not partitions:
+        job.refresh_from_db()
+        _finish_job(job, dict(result, rows={}), sha256=sha256)
+
+
+def run_partition(partition):
+    """
+    Load one claimed partition. Its student-level rows, fingerprints and its
+    status change commit together; the job finishes with its last partition.
+    """
+    job = partition.job
+    profiler = Profiler(trace_memory=settings.ETL_PROFILE_MEMORY)
+    try:
+        frame = pd.read_parquet(partition.file_path)
+        hashes = pd.Series(frame.pop(row_hash_column).to_numpy(), index=frame["id"].to_numpy())
+        with transaction.atomic():
+            stats = Load(profiler=profiler).load_partition(frame, hashes, category_columns, job.dimension_maps)
+            EtlPartition.objects.filter(pk=partition.pk).update(
+                status=EtlJob.Status.SUCCEEDED, result=stats, error="", finished_at=timezone.now()
+            )
+            # Lock the job only once the partition is written so partitions load in parallel
+            job = EtlJob.objects.select_for_update().get(pk=job.pk)
+            load_progress = job.progress.setdefault("load", {})
+            for name, counts in stats.items():
+                load_progress[name] = load_progress.get(name, 0) + sum(counts.values())
+            job_profile = Profiler()
+            job_profile.merge(job.result["profile"])
+            job_profile.merge(profiler.report())
+            job.result["profile"] = job_profile.report()
+            job.save(update_fields=["progress", "result"])
+            done = not job.partitions.exclude(status=EtlJob.Status.SUCCEEDED).exists()
+    except Exception as e:
+        logger.error(f"ETL job {job.id} partition {partition.number} failed: {e}", exc_info=True)
+        EtlPartition.objects.filter(pk=partition.pk).update(status=EtlJob.Status.FAILED, error=str(e))
+        if partition.attempts >= settings.ETL_PARTITION_MAX_ATTEMPTS:
+            _fail_job(job, f"Partition {partition.number} failed after {partition.attempts} attempts: {e}")
+        return
+    finally:
+        profiler.close()
+
+    logger.info(f"ETL job {job.id} loaded partition {partition.number}: {stats}")
+    if done:
+        _finish_job(job, job.result, sha256=job.options.get("sha256"))
+
+
+def _finish_job(job, result, sha256=None):
+    if sha256 is not None:
+        Upload.objects.get_or_create(sha256=sha256, defaults={"file_name": job.file_name})
+
+    if job.partition_count:
+        rows = {}
+        for partition_result in job.partitions.values_list("result", flat=True):
+            for name, counts in partition_result.items():
+                totals = rows.setdefault(name, {"inserted": 0, "updated": 0, "unchanged": 0})
+                for key, value in counts.items():
+                    totals[key] += value
+        result = dict(result, rows=rows)
+        # Once per job, however many partitions it was loaded in
+        _publish_load()
+
+    finished_at = timezone.now()
+    EtlJob.objects.filter(pk=job.pk).update(
+        status=EtlJob.Status.SUCCEEDED, result=result, finished_at=finished_at
+    )
+    if "profile" in result:
+        record_run(job.file_name, (finished_at - job.started_at).total_seconds(), result["profile"])
+    shutil.rmtree(partition_dir(job), ignore_errors=True)
+    if os.path.exists(job.file_path):
+        os.remove(job.file_path)
+    logger.info(f"ETL job {job.id} completed for file '{job.file_name}'")
+
+
+def retry_job(job):
+    """
+    Requeue the failed partitions of a failed job, keeping the ones that already
+    loaded. A job that failed before it was partitioned is prepared again.
+    """
+    with transaction.atomic():
+        job.partitions.filter(status=EtlJob.Status.FAILED).update(
+            status=EtlJob.Status.QUEUED, attempts=0, error=""
+        )
+        status = EtlJob.Status.RUNNING if job.partition_count else EtlJob.Status.QUEUED
+        EtlJob.objects.filter(pk=job.pk).update(status=status, error="", finished_at=None)
+    logger.info(f"Requeued ETL job {job.id}")
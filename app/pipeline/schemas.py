@@ -0,0 +1,49 @@
+from uuid import UUID
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from ninja import Schema
+
+
+class JobSubmitted(Schema):
+    job_id: UUID
+    status: str
+
+class PartitionStatus(Schema):
+    number: int
+    rows: int
+    status: str
+    attempts: int
+    error: Optional[str] = None
+
+class JobStatus(Schema):
+    job_id: UUID
+    file_name: str
+    status: str
+    stage: str
+    progress: Dict[str, Dict[str, int]]
+    error: Optional[str] = None
+    partitions: List[PartitionStatus] = []
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class JobResult(Schema):
+    job_id: UUID
+    status: str
+    result: Optional[Dict[str, Any]] = None
+
+class StepProfile(Schema):
+    step: str
+    calls: int
+    seconds: float
+    rows_in: Optional[int] = None
+    rows_out: Optional[int] = None
+    peak_memory: Optional[int] = None
+    queries: int
+
+class RunProfile(Schema):
+    id: int
+    file_name: str
+    seconds: float
+    profile: List[StepProfile]
+    created_at: datetime
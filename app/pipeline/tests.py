@@ -1,3 +1,608 @@
-from django.test import TestCase
+"""
+Tests for the ETL pipeline.
+"""
+import io
+import os
+import datetime
+import tempfile
+from unittest import mock
+import pandas as pd
+from openpyxl import Workbook
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from core.models import Student, Motivation, Registration, Outcomes, Country, Track
+from datasets.cache import data_version
+from .checkpoints import Checkpoint
+from .dimensions import registry
+from .country_codes import resolve_countries, UnresolvedCountriesError
+from .jobs import run_job, is_abandoned, resubmit_job
+from .models import EtlJob, EtlPartition, EtlRun, QuarantinedRow
+from .queue import run_next, retry_job
+from .watcher import DropFolder
+from .utils import Extract, Transform, Load, category_columns, transform_kwargs, run_pipeline
+from .benchmarks import (BaselineTransform, make_cohort_frame, write_workbook, write_csv, stage_results,
+                         find_regressions)
+
+
+def make_clean_frame(n=3):
+    """Build a small frame shaped like the output of Transform.clean_data."""
+    return pd.DataFrame({
+        'registration_date': [datetime.date(2024, 12, 1)] * n,
+        'registration_time': [datetime.time(10, 30)] * n,
+        'id': [f"DS{300 + i}" for i in range(n)],
+        'age_range': ['18-24 '] * n,
+        'gender': ['Female'] * n,
+        'country': ['Kenya'] * n,
+        'referral': ['WhatsApp'] * n,
+        'experience': ['Less than 6 months'] * n,
+        'track': ['data science'] * n,
+        'hours_available': ['7-14 hours'] * n,
+        'aim': ['upskill'] * n,
+        'motivation': ['to learn'] * n,
+        'skill_level': ['beginner'] * n,
+        'skill_description': ['i have no learning or work experience in data'] * n,
+        'completed_aptitude': ['Yes'] * n,
+        'aptitude_score': [float(60 + i) for i in range(n)],
+        'graduated': ['No'] * n,
+    })
+
+
+class TransformTests(TestCase):
+    """Tests for the Transform stage."""
+
+    def test_clean_data_standardises_values(self):
+        """Test that raw export rows are mapped to the cleaned column layout."""
+        raw = make_cohort_frame(50)
+        raw.columns = [col.lower() for col in raw.columns]
+        clean = Transform(**transform_kwargs).clean_data(raw)
+
+        self.assertEqual(list(clean.columns), list(make_clean_frame().columns))
+        self.assertTrue(set(clean['aim']) <= set(transform_kwargs['aims_map'].values()))
+        self.assertTrue(set(clean['skill_level']) <= {'beginner', 'elementary', 'intermediate', 'advanced'})
+        self.assertFalse(clean['age_range'].str.contains('years').any())
+        self.assertEqual(clean['registration_date'].iloc[0], raw['timestamp'].iloc[0].date())
+
+    def test_clean_data_uses_compact_dtypes(self):
+        """Test that repeated values become categories and free text Arrow-backed strings."""
+        raw = make_cohort_frame(50)
+        raw.columns = [col.lower() for col in raw.columns]
+        clean = Transform(**transform_kwargs).clean_data(raw)
+
+        for col in category_columns + ['gender', 'graduated', 'registration_date']:
+            self.assertIsInstance(clean[col].dtype, pd.CategoricalDtype, col)
+        self.assertEqual(str(clean['motivation'].dtype), 'string')
+        self.assertEqual(clean['motivation'].dtype.storage, 'pyarrow')
+        # Categories follow first appearance so new dimension rows are added in upload order
+        self.assertEqual(list(clean['track'].cat.categories), list(pd.unique(clean['track'].astype(object))))
+
+    def test_unknown_aim_left_missing(self):
+        """Test that an aim outside the mapping is left missing without failing the frame."""
+        raw = make_cohort_frame(5)
+        raw.columns = [col.lower() for col in raw.columns]
+        raw.loc[2, raw.columns[9]] = 'Something else'
+        clean = Transform(**transform_kwargs).clean_data(raw)
+
+        self.assertEqual(len(clean), 5)
+        self.assertEqual(clean['aim'].isna().tolist(), [False, False, True, False, False])
+
+    def test_vectorised_steps_match_row_wise_baseline(self):
+        """Test that the vectorised steps clean messy answers to the same values as the row-wise baseline."""
+        raw = make_cohort_frame(200, seed=3)
+        raw.columns = [col.lower() for col in raw.columns]
+        raw.loc[::5, raw.columns[7]] = 'DATA SCIENCE'
+        raw.loc[1::5, raw.columns[7]] = ' data Analysis'
+        raw.loc[::3, raw.columns[11]] = '  Beginner -  I have NO learning or work experience in data  '
+        raw.loc[::4, raw.columns[10]] = 'I WANT TO Upskill'
+        raw.loc[::6, raw.columns[6]] = 'Less than six months '
+
+        baseline = BaselineTransform(**transform_kwargs).clean_data(raw)
+        vectorised = Transform(**transform_kwargs).clean_data(raw)
+
+        # The baseline keeps Python objects where Transform compacts columns
+        pd.testing.assert_frame_equal(vectorised.astype(object), baseline.astype(object))
+
+
+class BulkLoadTests(TestCase):
+    """Tests for the set-based bulk load path."""
+
+    def test_bulk_load_inserts_rows(self):
+        """Test that a first bulk load inserts every student-level row."""
+        stats = Load().load_data(make_clean_frame(), category_columns, bulk=True)
+
+        self.assertEqual(stats['tables']['student'], {'inserted': 3, 'updated': 0, 'unchanged': 0})
+        self.assertEqual(Student.objects.count(), 3)
+        self.assertEqual(Motivation.objects.count(), 3)
+        self.assertEqual(Registration.objects.count(), 3)
+        self.assertEqual(Outcomes.objects.count(), 3)
+
+    def test_bulk_reload_reports_changes(self):
+        """Test that reloading reports updated and unchanged rows."""
+        frame = make_clean_frame()
+        Load().load_data(frame, category_columns, bulk=True)
+
+        frame.loc[0, 'aptitude_score'] = 99.0
+        stats = Load().load_data(frame, category_columns, bulk=True)
+
+        self.assertEqual(stats['tables']['outcomes'], {'inserted': 0, 'updated': 1, 'unchanged': 2})
+        self.assertEqual(stats['tables']['student'], {'inserted': 0, 'updated': 0, 'unchanged': 3})
+        self.assertEqual(Outcomes.objects.get(student_id='DS300').aptitude_score, 99.0)
+
+    def test_chunked_load_bumps_data_version_once(self):
+        """Test that a load in several chunks marks cached dataset results stale once, after the last chunk."""
+        before = data_version()
+        frame = make_clean_frame(6)
+        Load().load_chunks([frame.iloc[:2], frame.iloc[2:4], frame.iloc[4:]], category_columns)
+
+        self.assertEqual(data_version(), before + 1)
+        self.assertEqual(Student.objects.count(), 6)
+
+
+class DeltaLoadTests(TestCase):
+    """Tests for loading only new and changed students."""
+
+    def test_delta_load_skips_unchanged_students(self):
+        """Test that a reload only writes students whose cleaned row changed."""
+        frame = make_clean_frame()
+        first = Load().load_data(frame, category_columns, bulk=True, delta=True)
+        self.assertEqual(first['students'], {'new': 3, 'changed': 0, 'unchanged': 0})
+
+        frame.loc[1, 'graduated'] = 'Yes'
+        more = pd.concat([frame, make_clean_frame(4).tail(1)], ignore_index=True)
+        second = Load().load_data(more, category_columns, bulk=True, delta=True)
+
+        self.assertEqual(second['students'], {'new': 1, 'changed': 1, 'unchanged': 2})
+        self.assertEqual(second['tables']['outcomes'], {'inserted': 1, 'updated': 1, 'unchanged': 0})
+        self.assertTrue(Outcomes.objects.get(student_id='DS301').graduated)
+
+
+class DimensionRegistryTests(TestCase):
+    """Tests for the shared dimension key registry."""
+
+    def test_resolve_keeps_ids_and_adds_new_values(self):
+        """Test that existing dimension ids are reused and only new values are inserted."""
+        Track.objects.create(track='software engineering')
+        first = registry.resolve(make_clean_frame(), ['track', 'country'])
+        self.assertEqual(Country.objects.get(pk=first['country']['Kenya']).country, 'KE')
+
+        frame = make_clean_frame(2)
+        frame.loc[1, 'track'] = 'software engineering'
+        second = registry.resolve(frame, ['track', 'country'])
+
+        self.assertEqual(second['track']['data science'], first['track']['data science'])
+        self.assertEqual(Track.objects.get(pk=second['track']['software engineering']).track, 'software engineering')
+        self.assertEqual(Track.objects.count(), 2)
+        self.assertEqual(Country.objects.count(), 1)
+
+    def test_changed_dimension_invalidates_cache(self):
+        """Test that a dimension row deleted after caching is inserted again."""
+        track_id = registry.resolve(make_clean_frame(), ['track'])['track']['data science']
+        Track.objects.filter(pk=track_id).delete()
+
+        new_id = registry.resolve(make_clean_frame(), ['track'])['track']['data science']
+        self.assertNotEqual(new_id, track_id)
+        self.assertTrue(Track.objects.filter(pk=new_id).exists())
+
+    def test_value_renamed_elsewhere_invalidates_cache(self):
+        """Test that a dimension row updated in place by another process is not served from the cache."""
+        track_id = registry.resolve(make_clean_frame(), ['track'])['track']['data science']
+        # A raw update sends no signal, as with a write from another process
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {Track._meta.db_table} SET track = 'data engineering' WHERE id = %s", [track_id]
+            )
+
+        maps = registry.maps()
+        self.assertNotIn('data science', maps['track'])
+        self.assertEqual(maps['track']['data engineering'], track_id)
+
+    def test_new_value_after_rows_with_explicit_ids(self):
+        """Test that a new value gets a fresh id when earlier rows were written with explicit ids."""
+        # Older loads wrote their own ids, leaving the id sequence behind them
+        Track.objects.bulk_create([Track(id=1, track='data science'), Track(id=2, track='web development')])
+
+        frame = make_clean_frame(2)
+        frame.loc[1, 'track'] = 'software engineering'
+        tracks = registry.resolve(frame, ['track'])['track']
+
+        self.assertEqual(tracks['data science'], 1)
+        self.assertGreater(tracks['software engineering'], 2)
+        self.assertEqual(Track.objects.count(), 3)
+
+
+class CountryResolutionTests(TestCase):
+    """Tests for resolving country answers to ISO codes."""
+
+    def test_resolve_ignores_case_and_whitespace(self):
+        """Test that names, codes and aliases resolve regardless of case and spacing."""
+        codes, unresolved = resolve_countries(pd.Series(['Kenya', ' south  AFRICA ', 'NGA', 'usa']))
+
+        self.assertEqual(codes.tolist(), ['KE', 'ZA', 'NG', 'US'])
+        self.assertEqual(unresolved, {})
+
+    def test_unresolved_countries_fail_before_loading(self):
+        """Test that unmatched countries are reported together and nothing is written."""
+        frame = make_clean_frame(4)
+        frame.loc[[1, 2], 'country'] = 'Narnia'
+        frame.loc[3, 'country'] = None
+
+        with self.assertRaises(UnresolvedCountriesError) as raised:
+            Load().load_data(frame, category_columns, bulk=True)
+        self.assertEqual(raised.exception.unresolved, {'Narnia': 2, '': 1})
+        self.assertEqual(Country.objects.count(), 0)
+
+
+class ValidationTests(TestCase):
+    """Tests for row-level validation and the quarantine table."""
+
+    def test_invalid_rows_are_quarantined(self):
+        """Test that rows breaking a rule are quarantined with their reasons and the rest load."""
+        frame = make_cohort_frame(50)
+        frame.loc[3, 'What is your main aim for joining the mentorship program?'] = 'Something else'
+        frame.loc[7, 'Total score'] = 140.0
+        frame.loc[[7, 11], 'Country'] = 'Narnia'
+        frame.loc[20, 'Gender'] = '  '
+        with tempfile.TemporaryDirectory() as tmp, override_settings(ETL_CHECKPOINT_ROOT=tmp):
+            path = os.path.join(tmp, 'cohort.parquet')
+            frame.to_parquet(path, index=False)
+            for stream in (False, True):
+                summary = run_pipeline(path, 'cohort.parquet', bulk=True, stream=stream, delta=False)
+
+                self.assertEqual(summary['quarantined'], {'rows': 4, 'reasons': {
+                    'missing gender': 1,
+                    'missing or unknown aim': 1,
+                    'unknown country': 2,
+                    'aptitude_score outside 0-100': 1,
+                }})
+                self.assertEqual(Student.objects.count(), 46)
+
+        rows = QuarantinedRow.objects.order_by('student_id')
+        self.assertEqual([row.student_id for row in rows], ['ST11', 'ST20', 'ST3', 'ST7'])
+        self.assertEqual(rows.get(student_id='ST7').reasons, ['unknown country', 'aptitude_score outside 0-100'])
+        self.assertEqual(rows.get(student_id='ST7').row['country'], 'Narnia')
+        self.assertFalse(Student.objects.filter(student_id__in=['ST3', 'ST7', 'ST11', 'ST20']).exists())
+
+    def test_failed_rerun_keeps_previous_quarantine(self):
+        """Test that a rerun that fails to load leaves the last run's quarantined rows in place."""
+        frame = make_cohort_frame(20)
+        frame.loc[[4, 9], 'Country'] = 'Narnia'
+        with tempfile.TemporaryDirectory() as tmp, override_settings(ETL_CHECKPOINT_ROOT=tmp):
+            path = os.path.join(tmp, 'cohort.parquet')
+            frame.to_parquet(path, index=False)
+            run_pipeline(path, 'cohort.parquet', bulk=True, delta=False)
+            first = list(QuarantinedRow.objects.order_by('pk').values_list('pk', flat=True))
+
+            with mock.patch.object(Load, 'load_tables', side_effect=RuntimeError('connection lost')):
+                with self.assertRaises(RuntimeError):
+                    run_pipeline(path, 'cohort.parquet', bulk=True, delta=False)
+
+        self.assertEqual(len(first), 2)
+        self.assertEqual(list(QuarantinedRow.objects.order_by('pk').values_list('pk', flat=True)), first)
+
+
+class StreamingExtractTests(TestCase):
+    """Tests for the chunked workbook reader."""
+
+    def setUp(self):
+        workbook = Workbook()
+        first = workbook.active
+        first.append(['Timestamp', 'Id. No', 'Score'])
+        for i in range(5):
+            first.append([datetime.datetime(2024, 12, 1), f"DS{i}", i])
+        second = workbook.create_sheet()
+        second.append(['Timestamp', 'ID No.', 'Score'])
+        for i in range(2):
+            second.append([datetime.datetime(2024, 12, 2), f"DA{i}", i])
+        self.buffer = io.BytesIO()
+        workbook.save(self.buffer)
+
+    def test_iter_chunks_splits_sheets(self):
+        """Test that sheets are streamed in bounded chunks with the first sheet's header."""
+        chunks = list(Extract().iter_chunks(self.buffer, chunk_size=2))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1, 2])
+        for chunk in chunks:
+            self.assertEqual(list(chunk.columns), ['timestamp', 'id. no', 'score'])
+        self.assertEqual(chunks[-1]['id. no'].tolist(), ['DA0', 'DA1'])
+
+
+class ParallelExtractTests(TestCase):
+    """Tests for parsing workbook sheets in worker processes."""
+
+    def test_parallel_parse_matches_serial(self):
+        """Test that sheets parsed by worker processes, from a path or from memory, merge as a serial parse does."""
+        extractor = Extract()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = write_workbook(os.path.join(tmp, 'cohort.xlsx'), 60, sheets=3)
+            serial = extractor.merge_frames(path)
+            with open(path, 'rb') as file:
+                in_memory = io.BytesIO(file.read())
+
+            pd.testing.assert_frame_equal(extractor.merge_frames(path, workers=2), serial)
+            pd.testing.assert_frame_equal(extractor.merge_frames(in_memory, workers=2), serial)
+
+
+class ColumnarExtractTests(TestCase):
+    """Tests for CSV and Parquet uploads."""
+
+    def test_columnar_uploads_match_workbook(self):
+        """Test that CSV and Parquet uploads extract to the same frame as a workbook."""
+        extractor = Extract()
+        with tempfile.TemporaryDirectory() as tmp:
+            workbook = extractor.merge_frames(write_workbook(os.path.join(tmp, 'cohort.xlsx'), 40))
+            frame = make_cohort_frame(40)
+            frame.insert(3, 'Extra column', 'ignored')
+            frame.to_parquet(os.path.join(tmp, 'cohort.parquet'), index=False)
+            for path in (write_csv(os.path.join(tmp, 'cohort.csv'), 40), os.path.join(tmp, 'cohort.parquet')):
+                pd.testing.assert_frame_equal(extractor.merge_frames(path), workbook)
+                chunks = list(extractor.iter_chunks(path, chunk_size=15))
+                self.assertEqual([len(chunk) for chunk in chunks], [15, 15, 10])
+                pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), workbook)
+
+
+class EtlJobTests(TestCase):
+    """Tests for background ETL jobs."""
+
+    def test_run_job_records_progress_and_result(self):
+        """Test that a job loads its file and records per-stage progress."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = write_workbook(os.path.join(tmp, 'cohort.xlsx'), 30, sheets=2)
+            job = EtlJob.objects.create(file_name='cohort.xlsx', file_path=path, options={'bulk': True})
+            run_job(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, EtlJob.Status.SUCCEEDED)
+        self.assertEqual(job.progress['extract']['rows'], 30)
+        self.assertEqual(job.progress['load']['outcomes'], 30)
+        self.assertEqual(job.result['students'], {'new': 30, 'changed': 0, 'unchanged': 0})
+        self.assertEqual(Student.objects.count(), 30)
+
+    def test_run_job_records_failure(self):
+        """Test that a job that cannot read its file is marked as failed."""
+        job = EtlJob.objects.create(file_name='missing.xlsx', file_path='/nonexistent/missing.xlsx')
+        run_job(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, EtlJob.Status.FAILED)
+        self.assertTrue(job.error)
+
+    def test_abandoned_job_is_resubmitted_once(self):
+        """Test that a running job whose claim went stale can be run again, by one retry only."""
+        stale = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1)
+        job = EtlJob.objects.create(
+            file_name='cohort.xlsx', file_path='/tmp/cohort.xlsx', status=EtlJob.Status.RUNNING, claimed_at=stale
+        )
+        self.assertTrue(is_abandoned(job))
+
+        with mock.patch('pipeline.jobs.executor') as executor:
+            self.assertTrue(resubmit_job(job))
+            self.assertFalse(resubmit_job(job))
+        executor.submit.assert_called_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, EtlJob.Status.QUEUED)
+        self.assertFalse(is_abandoned(job))
+
+
+class EtlQueueTests(TestCase):
+    """Tests for the database-backed job queue."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        path = write_workbook(os.path.join(self.tmp.name, 'cohort.xlsx'), 40)
+        self.job = EtlJob.objects.create(
+            file_name='cohort.xlsx', file_path=path, backend=EtlJob.Backend.QUEUE, options={'partitions': 4}
+        )
+
+    def run_queue(self):
+        with override_settings(ETL_UPLOAD_ROOT=self.tmp.name):
+            while run_next('test-worker'):
+                pass
+        self.job.refresh_from_db()
+
+    def test_worker_loads_job_in_partitions(self):
+        """Test that a worker prepares a job, loads every partition and finishes the job."""
+        self.run_queue()
+
+        self.assertEqual(self.job.status, EtlJob.Status.SUCCEEDED)
+        self.assertEqual(self.job.partition_count, 4)
+        self.assertEqual(sum(self.job.partitions.values_list('rows', flat=True)), 40)
+        self.assertEqual(self.job.result['rows']['student']['inserted'], 40)
+        self.assertEqual(self.job.progress['load']['outcomes'], 40)
+        self.assertEqual(Student.objects.count(), 40)
+
+    def test_taken_over_job_is_left_to_its_new_owner(self):
+        """Test that a worker whose claim was taken over stops without writing partitions or failing the job."""
+        merge_frames = Extract.merge_frames
+
+        def taken_over(extractor, *args, **kwargs):
+            EtlJob.objects.filter(pk=self.job.pk).update(claimed_by='other-worker')
+            return merge_frames(extractor, *args, **kwargs)
+
+        with override_settings(ETL_UPLOAD_ROOT=self.tmp.name), mock.patch.object(Extract, 'merge_frames', taken_over):
+            run_next('test-worker')
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, EtlJob.Status.RUNNING)
+        self.assertEqual(self.job.claimed_by, 'other-worker')
+        self.assertFalse(self.job.partitions.exists())
+
+    def test_retry_reruns_failed_partitions_only(self):
+        """Test that retrying a failed job only loads the partitions that failed."""
+        with override_settings(ETL_PARTITION_MAX_ATTEMPTS=1):
+            with override_settings(ETL_UPLOAD_ROOT=self.tmp.name):
+                run_next('test-worker')
+            broken = self.job.partitions.last()
+            path = broken.file_path
+            os.rename(path, path + '.bak')
+            self.run_queue()
+            self.assertEqual(self.job.status, EtlJob.Status.FAILED)
+            self.assertEqual(self.job.partitions.filter(status=EtlJob.Status.SUCCEEDED).count(), 3)
+
+            os.rename(path + '.bak', path)
+            retry_job(self.job)
+            self.run_queue()
+
+        self.assertEqual(self.job.status, EtlJob.Status.SUCCEEDED)
+        self.assertEqual(EtlPartition.objects.get(pk=broken.pk).attempts, 1)
+        self.assertEqual(self.job.partitions.exclude(pk=broken.pk).filter(attempts=1).count(), 3)
+        self.assertEqual(Student.objects.count(), 40)
+
+
+class CheckpointTests(TestCase):
+    """Tests for resuming a failed run from its stage checkpoints."""
+
+    def test_failed_load_resumes_at_failed_table(self):
+        """Test that a rerun skips the stages and tables that completed before a failure."""
+        with tempfile.TemporaryDirectory() as tmp, override_settings(ETL_CHECKPOINT_ROOT=tmp):
+            path = write_workbook(os.path.join(tmp, 'cohort.xlsx'), 20)
+            with mock.patch.object(Load, '_load_outcomes', side_effect=RuntimeError('connection lost')):
+                with self.assertRaises(RuntimeError):
+                    run_pipeline(path, 'cohort.xlsx')
+            self.assertEqual(Student.objects.count(), 20)
+            self.assertEqual(Outcomes.objects.count(), 0)
+
+            with mock.patch.object(Extract, 'merge_frames') as merge_frames:
+                summary = run_pipeline(path, 'cohort.xlsx')
+            merge_frames.assert_not_called()
+            self.assertEqual(os.listdir(tmp), ['cohort.xlsx'])
+
+        self.assertEqual(summary['resumed'], ['extract', 'transform', 'student', 'motivation', 'registration'])
+        self.assertEqual(summary['students'], {'new': 20, 'changed': 0, 'unchanged': 0})
+        steps = [step['step'] for step in summary['profile']]
+        self.assertIn('load.outcomes', steps)
+        self.assertNotIn('load.student', steps)
+        self.assertEqual(Outcomes.objects.count(), 20)
+
+    def test_runs_with_other_options_keep_their_own_checkpoints(self):
+        """Test that a run of the same file with other options neither reads nor resets another's checkpoint."""
+        frame = make_cohort_frame(5)
+        with tempfile.TemporaryDirectory() as tmp:
+            with Checkpoint('abc', {'bulk': True, 'delta': True}, root=tmp) as bulk_run:
+                bulk_run.save_frame('extract', frame)
+            with Checkpoint('abc', {'bulk': False, 'delta': True}, root=tmp) as row_run:
+                self.assertFalse(row_run.has_frame('extract'))
+                row_run.reset('abc', {'bulk': False, 'delta': True})
+
+            with Checkpoint('abc', {'bulk': True, 'delta': True}, root=tmp) as bulk_run:
+                self.assertTrue(bulk_run.has_frame('extract'))
+                self.assertEqual(len(os.listdir(tmp)), 1)
+
+
+class IngestCommandTests(TestCase):
+    """Tests for the offline ingest command."""
+
+    def test_ingest_loads_directory_and_reports_failures(self):
+        """Test that every file in a directory is loaded and a bad file fails the command at the end."""
+        out, err = io.StringIO(), io.StringIO()
+        with tempfile.TemporaryDirectory() as tmp, override_settings(ETL_CHECKPOINT_ROOT=tmp):
+            write_workbook(os.path.join(tmp, 'a.xlsx'), 20, seed=1)
+            os.makedirs(os.path.join(tmp, 'older'))
+            write_csv(os.path.join(tmp, 'older', 'b.csv'), 20, seed=2)
+            with open(os.path.join(tmp, 'c.xlsx'), 'wb') as broken:
+                broken.write(b'PK not a workbook')
+
+            with self.assertRaises(CommandError):
+                call_command('ingest', tmp, '--chunk-size', '8', stdout=out, stderr=err)
+
+        self.assertIn('[3/3]', out.getvalue())
+        self.assertIn('Loaded 2 files (40 rows, 0 quarantined)', out.getvalue())
+        self.assertIn('c.xlsx', err.getvalue())
+        self.assertEqual(Student.objects.count(), 20)
+
+
+class DropFolderTests(TestCase):
+    """Tests for the watched drop folder."""
+
+    def test_settled_files_are_loaded_and_moved(self):
+        """Test that files load once unchanged between polls and end up in processed/ or failed/."""
+        with tempfile.TemporaryDirectory() as tmp, override_settings(ETL_CHECKPOINT_ROOT=tmp):
+            inbox = os.path.join(tmp, 'inbox')
+            os.makedirs(inbox)
+            folder = DropFolder(inbox, settle_seconds=0)
+            good = write_csv(os.path.join(inbox, 'export.csv'), 25)
+            self.assertEqual(folder.poll(), [])
+
+            with open(os.path.join(inbox, 'broken.xlsx'), 'wb') as broken:
+                broken.write(b'PK not a workbook')
+            with open(os.path.join(inbox, 'export.csv.part'), 'w') as partial:
+                partial.write('Timestamp')
+            self.assertEqual(folder.poll(), [good])
+            ready = folder.poll()
+            self.assertEqual(ready, [os.path.join(inbox, 'broken.xlsx')])
+            self.assertEqual(folder.poll(), [])
+
+            self.assertEqual(folder.process(good)['students']['new'], 25)
+            self.assertIsNone(folder.process(ready[0]))
+            processed = os.listdir(os.path.join(inbox, 'processed'))
+            failed = sorted(os.listdir(os.path.join(inbox, 'failed')))
+
+        self.assertTrue(processed[0].endswith('-export.csv'))
+        self.assertTrue(failed[0].endswith('-broken.xlsx'))
+        self.assertTrue(failed[1].endswith('-broken.xlsx.error'))
+        self.assertEqual(Student.objects.count(), 25)
+
+    def test_file_that_cannot_be_moved_is_not_retried(self):
+        """Test that a failed file which could not be moved to failed/ is skipped by later polls."""
+        with tempfile.TemporaryDirectory() as tmp, override_settings(ETL_CHECKPOINT_ROOT=tmp):
+            inbox = os.path.join(tmp, 'inbox')
+            os.makedirs(inbox)
+            folder = DropFolder(inbox, settle_seconds=0)
+            broken = os.path.join(inbox, 'broken.xlsx')
+            with open(broken, 'wb') as file:
+                file.write(b'PK not a workbook')
+            folder.poll()
+            self.assertEqual(folder.poll(), [broken])
+
+            with mock.patch.object(DropFolder, '_move', side_effect=PermissionError('read-only folder')):
+                with self.assertRaises(PermissionError):
+                    folder.process(broken)
+            self.assertEqual(folder.poll(), [])
+            self.assertTrue(os.path.exists(broken))
+
+            os.remove(broken)
+            folder.poll()
+            self.assertEqual(folder.stuck, set())
+
+
+class ProfilingTests(TestCase):
+    """Tests for per-step ETL instrumentation."""
+
+    def test_run_profile_is_returned_and_kept(self):
+        """Test that every step is profiled and only the last runs are kept."""
+        with tempfile.TemporaryDirectory() as tmp, override_settings(ETL_PROFILE_HISTORY=2):
+            for seed in range(3):
+                path = write_workbook(os.path.join(tmp, f'cohort-{seed}.xlsx'), 20, seed=seed)
+                summary = run_pipeline(path, f'cohort-{seed}.xlsx', bulk=True)
+
+        steps = {step['step']: step for step in summary['profile']}
+        self.assertEqual(steps['extract']['rows_out'], 20)
+        self.assertEqual(steps['transform.map_aim_categories']['rows_in'], 20)
+        self.assertEqual(steps['load.student']['rows_in'], 20)
+        self.assertGreater(steps['load.student']['queries'], 0)
+        self.assertGreater(steps['transform.standardise_columns']['peak_memory'], 0)
+        self.assertEqual(list(EtlRun.objects.values_list('file_name', flat=True).order_by('id')),
+                         ['cohort-1.xlsx', 'cohort-2.xlsx'])
+
+
+class BenchmarkTests(TestCase):
+    """Tests for the ETL benchmark helpers."""
+
+    def test_regression_flagged_above_threshold(self):
+        """Test that only stages slower than the baseline by more than the threshold are flagged."""
+        profile = [
+            {'step': 'extract', 'calls': 1, 'seconds': 2.0, 'rows_in': None, 'rows_out': 100, 'peak_memory': 10, 'queries': 0},
+            {'step': 'load.student', 'calls': 1, 'seconds': 0.5, 'rows_in': 100, 'rows_out': 100, 'peak_memory': 5, 'queries': 3},
+            {'step': 'load.outcomes', 'calls': 1, 'seconds': 0.5, 'rows_in': 100, 'rows_out': 100, 'peak_memory': 7, 'queries': 3},
+        ]
+        results = stage_results(profile, 100, 'xlsx')
+        self.assertEqual(results[1], {
+            'rows': 100, 'format': 'xlsx', 'stage': 'load', 'seconds': 1.0,
+            'rows_per_second': 100.0, 'peak_memory': 7, 'queries': 6,
+        })
+
+        baseline = [dict(results[0], seconds=1.5), dict(results[1], seconds=0.9)]
+        regressions = find_regressions(results, baseline, threshold=0.2)
+        self.assertEqual([item['stage'] for item in regressions], ['extract'])
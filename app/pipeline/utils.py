@@ -1,13 +1,31 @@
+import os
+import time
+import shutil
+import hashlib
 import logging
+import tempfile
+import multiprocessing
 import pandas as pd
-from django_countries import countries
-from django.db import transaction
-from core.utils import DatabaseConnection
+import pyarrow.feather as feather
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from openpyxl import load_workbook
+from django.conf import settings
+from django.db import connection, transaction
 from core.models import (AgeRange, Country, Experience, Track, Referral, SkillLevel,
     Aim, Student, Motivation, HoursAvailable, Registration, Outcomes )
+from datasets.cache import bump_data_version
+from datasets.materialized import schedule_refresh
+from .models import Upload, StudentFingerprint
+from .parsing import parse_sheet
+from .dimensions import registry
+from .profiling import Profiler, record_run
+from .checkpoints import Checkpoint
+from .validation import Quarantine
  
 
-connector = DatabaseConnection() 
 logger =  logging.getLogger(__file__)
 
 hours_mapping_dict = {
@@ -31,6 +49,21 @@ standard_columns_list = [
     'completed_aptitude', 'aptitude_score', 'graduated'
 ]
 
+# Column headers as they appear in the registration form export, in the order
+# of `standard_columns_list`.
+source_columns_list = [
+    'Timestamp', 'Id. No', 'Age range', 'Gender', 'Country',
+    'Where did you hear about Everything Data?',
+    'How many years of learning experience do you have in the field of data?',
+    'Which track are you applying for?',
+    'How many hours per week can you commit to learning?',
+    'What is your main aim for joining the mentorship program?',
+    'What is your motivation to join the Everything Data mentorship program?',
+    'How best would you describe your skill level in the track you are applying for?',
+    'Have you completed the everything data aptitude test for your track?',
+    'Total score', 'Graduated'
+]
+
 transform_kwargs = {
     "hours_map":hours_mapping_dict, 
     "aims_map":aims_mapping_dict, 
@@ -41,16 +74,138 @@ category_columns = [
     'age_range', 'country', 'experience', 'track', 'referral', 'skill_level', 'aim', 'hours_available'
 ]
 
+# Number of worksheet rows held in memory at once by the streaming extract.
+default_chunk_size = 10000
+
+# Leading bytes that identify each upload format; anything else is read as CSV.
+format_signatures = [
+    (b'PK\x03\x04', 'excel'),
+    (b'\xd0\xcf\x11\xe0', 'excel'),
+    (b'PAR1', 'parquet'),
+    (b'ARROW1', 'arrow'),
+    (b'\xff\xff\xff\xff', 'arrow_stream'),
+]
+
+# Student-level tables written by the bulk load path: prepared frame method,
+# target table and the unique key used to resolve conflicts on merge.
+bulk_tables = {
+    'student': ('_prepare_bulk_students', 'core_student', ['student_id']),
+    'motivation': ('_prepare_motivation', 'core_motivation', ['student_id', 'aim_id']),
+    'registration': ('_prepare_bulk_registrations', 'core_registration', ['student_id']),
+    'outcomes': ('_prepare_student_outcomes', 'core_outcomes', ['student_id']),
+}
+
 
 class Extract:
     def __init__(self) -> None:
         pass
         
-    def merge_frames(self, data_path):
+    def detect_format(self, data_path):
+        """Identify an upload as excel, parquet, arrow, arrow_stream or csv from its first bytes."""
+        if isinstance(data_path, (str, os.PathLike)):
+            with open(data_path, "rb") as file:
+                head = file.read(8)
+        else:
+            data_path.seek(0)
+            head = data_path.read(8)
+            data_path.seek(0)
+        for signature, name in format_signatures:
+            if head.startswith(signature):
+                return name
+        return 'csv'
+
+    def _project(self, columns):
+        """
+        Pick the export's columns, in `standard_columns_list` order, by their
+        source header or standard name (ignoring case). Files that do not carry
+        all of them are read whole, as workbooks are.
+        """
+        lookup = {str(col).strip().lower(): col for col in columns}
+        picked = []
+        for source, standard in zip(source_columns_list, standard_columns_list):
+            col = lookup.get(source.lower(), lookup.get(standard))
+            if col is None:
+                logger.warning(f"Column '{source}' not found; reading every column of the file.")
+                return None
+            picked.append(col)
+        return picked
+
+    def _lower_columns(self, frame):
+        # Arrow keeps the file's timestamp unit; workbooks always give nanoseconds
+        timestamps = frame.select_dtypes(include=['datetime64']).columns
+        frame = frame.astype({col: 'datetime64[ns]' for col in timestamps})
+        return frame.set_axis([str(col).lower() for col in frame.columns], axis=1)
+
+    def _csv_options(self, data_path):
+        if hasattr(data_path, "seek"):
+            data_path.seek(0)
+        header = pd.read_csv(data_path, nrows=0).columns
+        if hasattr(data_path, "seek"):
+            data_path.seek(0)
+        columns = self._project(header)
+        # The first export column is the submission timestamp
+        return {"usecols": columns, "parse_dates": [columns[0] if columns else header[0]]}
+
+    def _read_columnar(self, data_path, file_format):
+        """Read a CSV, Parquet or Arrow upload into one frame shaped like `merge_frames` output."""
+        if hasattr(data_path, "seek"):
+            data_path.seek(0)
+        if file_format == 'csv':
+            frame = pd.read_csv(data_path, engine="pyarrow", **self._csv_options(data_path))
+        elif file_format == 'parquet':
+            columns = self._project(pq.ParquetFile(data_path).schema_arrow.names)
+            if hasattr(data_path, "seek"):
+                data_path.seek(0)
+            frame = pq.read_table(data_path, columns=columns).to_pandas()
+        elif file_format == 'arrow':
+            table = feather.read_table(data_path)
+            frame = table.select(self._project(table.column_names) or table.column_names).to_pandas()
+        else:
+            table = ipc.open_stream(data_path).read_all()
+            frame = table.select(self._project(table.column_names) or table.column_names).to_pandas()
+        logger.info(f"Read {len(frame.index)} rows from {file_format} file.")
+        return self._lower_columns(frame)
+
+    def _iter_columnar(self, data_path, file_format, chunk_size):
+        if hasattr(data_path, "seek"):
+            data_path.seek(0)
+        if file_format == 'csv':
+            with pd.read_csv(data_path, chunksize=chunk_size, **self._csv_options(data_path)) as reader:
+                for chunk in reader:
+                    yield self._lower_columns(chunk)
+            return
+
+        if file_format == 'parquet':
+            parquet_file = pq.ParquetFile(data_path)
+            columns = self._project(parquet_file.schema_arrow.names)
+            batches = parquet_file.iter_batches(batch_size=chunk_size, columns=columns)
+        else:
+            reader = ipc.open_file(data_path) if file_format == 'arrow' else ipc.open_stream(data_path)
+            columns = self._project(reader.schema.names) or reader.schema.names
+            if file_format == 'arrow':
+                batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+            else:
+                batches = reader
+            batches = (batch.select(columns) for batch in batches)
+
+        for batch in batches:
+            # Arrow batches follow the file's layout, so re-slice them to chunk_size
+            for start in range(0, batch.num_rows, chunk_size):
+                yield self._lower_columns(batch.slice(start, chunk_size).to_pandas())
+
+    def merge_frames(self, data_path, workers=None):
+        file_format = self.detect_format(data_path)
+        if file_format != 'excel':
+            try:
+                return self._read_columnar(data_path, file_format)
+            except Exception as e:
+                logger.error(f"Cannot read {file_format} file due to {str(e)}")
+                return None
+
         logger.info("Standardising column names")
 
         try: 
-            frames = self._extract(data_path)
+            frames = self._extract(data_path, workers)
             if type(frames) == list and len(frames) > 0: 
                 frame_cols = [frame.columns for frame in frames]
                 prime_frame_cols = frame_cols[0]
@@ -76,150 +231,305 @@ class Extract:
             logger.error(f"Column name standardisation failed due to {str(e)}")
 
 
-    def _extract(self, data_path):
+    def _extract(self, data_path, workers=None):
         logger.info("Uploading data")
         try:
             xls_file = pd.ExcelFile(data_path)
             sheets = xls_file.sheet_names
             names = ", ".join(str(name) for name in xls_file.sheet_names)
             logger.info(f"Successfully uploaded {len(sheets)} named {names} from file.")
-            frames = [xls_file.parse(sheet) for sheet in sheets]
+            if workers and workers > 1 and len(sheets) > 1:
+                frames = self._parse_parallel(data_path, sheets, workers)
+            else:
+                frames = [xls_file.parse(sheet) for sheet in sheets]
             return frames
         except Exception as e: 
             logger.error("Cannot upload sheets from file")
 
+    def _parse_parallel(self, data_path, sheets, workers):
+        """
+        Parse sheets in a process pool. Results come back in sheet order so
+        `merge_frames` standardises and concatenates them exactly as before.
+        Workers are spawned rather than forked, so they share no database
+        connection, lock or thread state with the process that starts them,
+        and open the workbook by path; an upload held in memory is written to
+        a temporary file once instead of being pickled to every worker.
+        """
+        if not isinstance(data_path, (str, os.PathLike)):
+            data_path.seek(0)
+            with tempfile.NamedTemporaryFile(suffix=".xlsx") as spooled:
+                shutil.copyfileobj(data_path, spooled)
+                spooled.flush()
+                return self._parse_parallel(spooled.name, sheets, workers)
+
+        logger.info(f"Parsing {len(sheets)} sheets with {workers} worker processes.")
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(sheets)), mp_context=context) as executor:
+            return list(executor.map(parse_sheet, repeat(os.fspath(data_path)), sheets))
+
+    def fingerprint(self, data_path, block_size=1 << 20):
+        """Return the SHA-256 hex digest of the uploaded file's bytes."""
+        digest = hashlib.sha256()
+        if isinstance(data_path, (str, os.PathLike)):
+            with open(data_path, "rb") as file:
+                for block in iter(lambda: file.read(block_size), b""):
+                    digest.update(block)
+        else:
+            data_path.seek(0)
+            for block in iter(lambda: data_path.read(block_size), b""):
+                digest.update(block)
+            data_path.seek(0)
+        return digest.hexdigest()
+
+    def iter_chunks(self, data_path, chunk_size=default_chunk_size):
+        """
+        Stream the workbook sheet by sheet in frames of at most `chunk_size` rows.
+        Headers are lower-cased to the first sheet's column names, as in
+        `merge_frames`, so every chunk can go straight into Transform.
+        CSV, Parquet and Arrow uploads are streamed in the same chunks.
+        """
+        file_format = self.detect_format(data_path)
+        if file_format != 'excel':
+            yield from self._iter_columnar(data_path, file_format, chunk_size)
+            return
+
+        if hasattr(data_path, "seek"):
+            data_path.seek(0)
+
+        workbook = load_workbook(data_path, read_only=True, data_only=True)
+        prime_cols_lower = None
+
+        try:
+            for sheet in workbook.worksheets:
+                sheet.reset_dimensions()
+                rows = sheet.iter_rows(values_only=True)
+                header = list(next(rows, None) or [])
+                while header and header[-1] is None:
+                    header.pop()
+                if not header:
+                    continue
+                width = len(header)
+
+                if prime_cols_lower is None:
+                    prime_cols_lower = [str(col).lower() for col in header]
+                if width != len(prime_cols_lower):
+                    logger.warning(f"Skipping sheet '{sheet.title}': columns do not match the first sheet.")
+                    continue
+
+                buffer = []
+                for row in rows:
+                    row = row[:width] + (None,) * (width - len(row))
+                    if all(value is None for value in row):
+                        continue
+                    buffer.append(row)
+                    if len(buffer) == chunk_size:
+                        yield pd.DataFrame.from_records(buffer, columns=prime_cols_lower)
+                        buffer = []
+                if buffer:
+                    yield pd.DataFrame.from_records(buffer, columns=prime_cols_lower)
+
+                logger.info(f"Streamed sheet '{sheet.title}' from file.")
+        finally:
+            workbook.close()
+
 
 class Transform:
-    def __init__(self, hours_map, standard_cols, aims_map) -> None:
+    def __init__(self, hours_map, standard_cols, aims_map, profiler=None) -> None:
         self.frame = None
         self.hours_map = hours_map
         self.standard_cols = standard_cols
         self.aims_map = aims_map
+        self.profiler = profiler or Profiler()
 
     def clean_data(self, frame):
-        short_names_df = self._map_short_column_names(frame)
-        std_cols_df = self._standardise_columns(short_names_df)
-        split_skills_df = self._split_skill_level(std_cols_df)
-        mapped_aims_df = self._map_aim_categories(split_skills_df)
-        if isinstance(mapped_aims_df, pd.DataFrame):
-            mapped_aims_df.columns = mapped_aims_df.columns.str.strip()
-            return mapped_aims_df
+        # Copy-on-write lets each step derive a new frame without copying the
+        # columns it leaves untouched; it is scoped here so the rest of the
+        # process keeps pandas' default semantics
+        with pd.option_context("mode.copy_on_write", True):
+            short_names_df = self._profiled(self._map_short_column_names, frame)
+            std_cols_df = self._profiled(self._standardise_columns, short_names_df)
+            split_skills_df = self._profiled(self._split_skill_level, std_cols_df)
+            mapped_aims_df = self._profiled(self._map_aim_categories, split_skills_df)
+            compact_df = self._profiled(self._compact_columns, mapped_aims_df)
+            if isinstance(compact_df, pd.DataFrame):
+                compact_df.columns = compact_df.columns.str.strip()
+                return compact_df
     
+    def _profiled(self, step, frame):
+        rows_in = len(frame.index) if isinstance(frame, pd.DataFrame) else None
+        with self.profiler.step(f"transform.{step.__name__.lstrip('_')}", rows_in) as record:
+            result = step(frame)
+            if isinstance(result, pd.DataFrame):
+                record["rows_out"] = len(result.index)
+        return result
+
     def _map_short_column_names(self, frame):
         logger.info("Shortening standardised column names")
         if len(frame.columns) == len(self.standard_cols):
             try:
-                copy = frame.copy()
-                columns = copy.columns
-                map_dict = {col: columns[num] for num, col in enumerate(self.standard_cols)}
-                copy.columns = [*map_dict.keys()]
+                short_names = frame.set_axis(self.standard_cols, axis=1)
                 logger.info("Successfully shortened standardised column names.")
-                return copy
+                return short_names
             except Exception as e:
                 logger.error(f"An error has occured attempting to shorten the standardised column names: {str(e)}")
 
+    def _on_distinct(self, series, func):
+        """
+        Apply a vectorised operation to the distinct values of a column only and
+        return the result for every row as a categorical, without materialising
+        a value per row. `func` may return a Series or a DataFrame.
+        """
+        codes, uniques = pd.factorize(series, use_na_sentinel=False)
+        uniques = pd.Series(uniques)
+        if isinstance(uniques.dtype, pd.CategoricalDtype):
+            uniques = uniques.astype(uniques.cat.categories.dtype)
+        result = func(uniques)
+        if isinstance(result, pd.DataFrame):
+            return pd.DataFrame(
+                {col: self._categorical(result[col], codes) for col in result.columns}, index=series.index
+            )
+        return pd.Series(self._categorical(result, codes), index=series.index, name=series.name)
+
+    def _categorical(self, distinct, codes):
+        # Categories keep the order values first appear in, as pd.unique would
+        distinct_codes, categories = pd.factorize(distinct)
+        return pd.Categorical.from_codes(distinct_codes[codes], categories)
+
     def _standardise_columns(self, frame): 
         logger.info("Standardising column values.")
         try: 
-            copy = frame.copy()
-            copy['referral'] = copy['referral'].apply(lambda row: row.replace(
-                'through a geeks for geeks webinar', 'Geeks for Geeks')
-            )
-            copy['motivation'] = copy['motivation'].str.lower()
-            copy['experience'] = copy['experience'].apply(
-                lambda row: row.replace('six', '6')
-            )
-            copy['age_range'] =  copy['age_range'].apply(
-                lambda row: row.replace('years', '')
-            )
-            copy['hours_available'] = copy['hours_available'].apply(
-                lambda row: self.hours_map.get(row, row)
+            standardised = frame.assign(
+                referral=self._on_distinct(frame['referral'], lambda col: col.str.replace(
+                    'through a geeks for geeks webinar', 'Geeks for Geeks', regex=False
+                )),
+                motivation=frame['motivation'].astype('string[pyarrow]').str.lower(),
+                experience=self._on_distinct(
+                    frame['experience'], lambda col: col.str.replace('six', '6', regex=False)
+                ),
+                age_range=self._on_distinct(
+                    frame['age_range'], lambda col: col.str.replace('years', '', regex=False)
+                ),
+                hours_available=self._on_distinct(
+                    frame['hours_available'], lambda col: col.map(self.hours_map).fillna(col)
+                ),
+                track=self._on_distinct(frame['track'], lambda col: col.str.lower()),
             )
-            copy['track'] = copy['track'].str.lower()
-            if 'timestamp' in copy.columns:
-                copy['registration_date'] = copy['timestamp'].dt.date
-                copy['registration_time'] = copy['timestamp'].dt.time
-                copy = copy.drop(columns=['timestamp'])
+            if 'timestamp' in standardised.columns:
+                timestamp = standardised.pop('timestamp')
+                standardised['registration_date'] = self._on_distinct(
+                    timestamp.dt.normalize(), lambda col: col.dt.date
+                )
+                # Times of day repeat far more often than timestamps do
+                standardised['registration_time'] = self._on_distinct(
+                    timestamp - timestamp.dt.normalize(), lambda col: (pd.Timestamp(0) + col).dt.time
+                )
 
             logger.info("Successfuly standardised column values.")
-            return copy
+            return standardised
     
         except Exception as e:
             logger.error(f"Failed to standardise column values due to the following error: {str(e)}")
 
+    def _skill_parts(self, skill_levels):
+        parts = skill_levels.str.split('-', expand=True)
+        return pd.DataFrame({
+            'skill_level': parts[0].str.strip().str.lower(),
+            'skill_description': parts[1].str.lower().str.strip(),
+        })
+
     def _split_skill_level(self, frame):
         logger.info("Splitting the 'skill level' column into category and description.")
         try: 
-            copy = frame.copy()
-            skill_level = copy['skill_level']
-            split_skill_level = skill_level.str.split('-')
-            skill_label = split_skill_level.map(
-                lambda x: x[0].strip()
-            )
-            skill_description = split_skill_level.map(
-                lambda x: x[1].lower().strip()
-            )
-            copy.drop(columns=['skill_level'], inplace=True)
-            copy['skill_level'] = skill_label.str.lower()
-            copy['skill_description'] = skill_description
+            split_skill_level = self._on_distinct(frame['skill_level'], self._skill_parts)
             new_standard_cols = ["registration_date", "registration_time"] + self.standard_cols[1:]
             new_standard_cols.insert(new_standard_cols.index("skill_level") + 1, "skill_description")
-            copy = copy[new_standard_cols]
+            split = frame.assign(
+                skill_level=split_skill_level['skill_level'],
+                skill_description=split_skill_level['skill_description'],
+            )[new_standard_cols]
 
             logger.info("Successfully split the 'skill level' column.")
-            return copy
+            return split
         
         except Exception as e:
             logger.error(f"An error has occured attempting to split the 'skill level' column: {str(e)}")
 
+    def _aim_keys(self, aims):
+        # The aim is keyed by its first word, or its second when it starts with 'Learn'
+        words = aims.str.partition(" ")
+        second_word = words[2].str.partition(" ")[0]
+        return second_word.where(words[0] == 'Learn', words[0]).str.lower()
+
     def _map_aim_categories(self, frame):
         logger.info("Mapping 'aim' column categories to standardised values")
 
         try:
-            copy = frame.copy()
-            extract_aim = lambda x:  x.split(" ")[1] if x.split(" ")[0] == 'Learn' else x.split(" ")[0]
-            map_aims_func = lambda x: self.aims_map[extract_aim(x).lower()]
-            copy['aim'] = copy['aim'].apply(lambda x: map_aims_func(x))
+            aim_key = self._on_distinct(frame['aim'], self._aim_keys)
+            aims = self._on_distinct(aim_key, lambda keys: keys.map(self.aims_map))
+
+            # Rows with an unknown aim are left missing and quarantined by validation
+            unknown = aim_key[aims.isna()].unique()
+            if len(unknown):
+                logger.warning(f"Unknown 'aim' categories: {', '.join(str(key) for key in unknown)}")
 
             logger.info("Successfully mapped 'aim' column categories" )
-            return copy
+            return frame.assign(aim=aims)
         except Exception as e:
             logger.error(f"Failed to map 'aim' column categories: {str(e)}")
-            
+
+    def _compact_columns(self, frame):
+        """
+        Store the remaining text columns compactly: ids and free-text motivations
+        as Arrow-backed strings, every other repeated value as a category.
+        """
+        try:
+            compact = {}
+            for col in frame.columns:
+                if col in ('id', 'motivation'):
+                    compact[col] = frame[col].astype('string[pyarrow]')
+                elif frame[col].dtype == object:
+                    compact[col] = self._on_distinct(frame[col], lambda values: values)
+            return frame.assign(**compact)
+        except Exception as e:
+            logger.error(f"Failed to compact column types: {str(e)}")
+
 class Load: 
-    def __init__(self) -> None:
+    def __init__(self, progress=None, profiler=None) -> None:
         self.frame = None
+        self.cat_maps = None
+        self.progress = progress
+        self.profiler = profiler or Profiler()
+
+    def _report(self, stage, key, rows):
+        # Called with committed row counts so observers see durable progress
+        if self.progress is not None:
+            self.progress(stage, key, rows)
+
+    def _report_tables(self, table_stats):
+        for name, counts in table_stats.items():
+            self._report("load", name, sum(counts.values()))
         
     def _index_to_map(self, col):
         index = col.to_dict()
         index_map = {v: k for k, v in index.items()}
         return index_map
     
-    def _prepare_cat_frame(self, cat):
-        copy = self.frame.copy()
-        frame = pd.DataFrame()
+    def _category_ids(self, values, cat_map):
+        """
+        Map a column to dimension ids. Categorical columns are mapped once per
+        category and expanded with their codes instead of looking up every row.
+        """
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            return values.map(cat_map)
+        ids = pd.array([cat_map.get(value) for value in values.cat.categories], dtype='Int64')
+        return pd.Series(ids.take(values.cat.codes.to_numpy(), allow_fill=True), index=values.index)
 
-        if cat == "skill_level":
-            cols = [col for col in copy.columns if "skill" in col]
-            frame = copy[cols].drop_duplicates(
-                subset=cols
-            )
-        else: 
-            frame = pd.DataFrame(copy[cat].unique())
-            frame.rename(columns={0: cat}, inplace=True)
-
-        frame[cat] = frame[cat].astype('category')
-        frame.index = pd.Index(range(1, len(frame.index) + 1))
-        return frame
-    
     def _prepare_students(self):
         copy = self.frame.copy()
         students = copy[['id', 'gender'] + self.cat_frames].copy()
 
         for col in self.cat_frames:
-            cat_df = self._prepare_cat_frame(col)
-            map_dict = {getattr(row, col): row.Index for row in cat_df.itertuples()}
-            students[f'{col}_id'] = students[col].map(map_dict)
+            students[f'{col}_id'] = self._category_ids(students[col], self.cat_maps[col])
 
         students.drop(columns=self.cat_frames, inplace=True)
         return students
@@ -230,8 +540,7 @@ class Load:
         motivation.rename(columns={'id': 'student_id'}, inplace=True)
 
         # Map Aim names to actual DB IDs
-        aim_map = {obj.aim: obj.id for obj in Aim.objects.all()}
-        motivation['aim_id'] = motivation['aim'].map(aim_map)
+        motivation['aim_id'] = self._category_ids(motivation['aim'], self.cat_maps['aim'])
         motivation.drop(columns=['aim'], inplace=True)
 
         return motivation
@@ -250,36 +559,74 @@ class Load:
         outcomes.rename(columns={'id':'student_id'}, inplace=True)
         return outcomes
     
-    def _load_cat_frame(self, frame_dict: dict):
-        key = list(frame_dict.keys())[0]
-        frame = frame_dict[key]
+    def _prepare_bulk_students(self):
+        students = self._prepare_students().rename(columns={'id': 'student_id'})
+        self._validate_foreign_keys(students)
+        student_cols = [field.column for field in Student._meta.concrete_fields]
+        return students[[col for col in students.columns if col in student_cols]]
 
-        if not isinstance(frame, pd.DataFrame):
-            raise ValueError(f"Expected DataFrame for {key}, got {type(frame)}")
+    def _prepare_bulk_registrations(self):
+        return self._prepare_registrations().rename(
+            columns={'registration_date': 'date', 'registration_time': 'time'}
+        )
 
-        ModelName = connector._snake_to_pascal(key)
-        Model = globals()[ModelName]  # assumes model names match cat_frame title case
+    def _bulk_upsert(self, table, frame, conflict_cols):
+        """
+        Stage a prepared frame with COPY and merge it into `table` with a single
+        INSERT ... ON CONFLICT statement. Rows whose values already match the
+        table are left untouched. Returns inserted/updated/unchanged counts.
+        """
+        frame = frame.drop_duplicates(subset=conflict_cols, keep='last')
+        stage = f"_stage_{table}"
+        cols = list(frame.columns)
+        col_list = ", ".join(cols)
+        update_cols = [col for col in cols if col not in conflict_cols]
+        set_clause = ", ".join(f"{col} = EXCLUDED.{col}" for col in update_cols)
+        changed = " OR ".join(f"{table}.{col} IS DISTINCT FROM EXCLUDED.{col}" for col in update_cols)
+        rows = frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None)
 
-        for row in frame.itertuples(index=True, name='Row'):
-            idx = row.Index
-            if key not in row._fields:
-                raise ValueError(f"Column '{key}' not found in row fields: {row._fields}")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE {stage} AS "
+                f"SELECT {col_list} FROM {table} WITH NO DATA"
+            )
+            with cursor.copy(f"COPY {stage} ({col_list}) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(row)
+            cursor.execute(
+                f"INSERT INTO {table} ({col_list}) SELECT {col_list} FROM {stage} "
+                f"ON CONFLICT ({', '.join(conflict_cols)}) DO UPDATE SET {set_clause} "
+                f"WHERE {changed} RETURNING (xmax = 0)"
+            )
+            written = [inserted for (inserted,) in cursor.fetchall()]
+            cursor.execute(f"DROP TABLE {stage}")
 
-            prime_raw = getattr(row, key)
-            prime_value = countries.by_name(prime_raw) if ModelName == "Country" else prime_raw
+        inserted = sum(written)
+        updated = len(written) - inserted
+        return {
+            "inserted": inserted,
+            "updated": updated,
+            "unchanged": len(frame.index) - inserted - updated,
+        }
 
-            lookup = {"id": idx}
-            defaults = {key: prime_value}
+    def _bulk_load_table(self, name):
+        prepare, table, conflict_cols = bulk_tables[name]
+        with self.profiler.step(f"load.{name}", len(self.frame.index)) as record:
+            frame = getattr(self, prepare)()
+            stats = self._bulk_upsert(table, frame, conflict_cols)
+            record["rows_out"] = stats["inserted"] + stats["updated"]
+        logger.info(f"Bulk loaded '{table}': {stats}")
+        return stats
 
-            # Add other columns
-            for col_name in row._fields[1:]:
-                if col_name != key:
-                    defaults[col_name] = getattr(row, col_name)
+    def _bulk_load(self):
+        """Load every student-level table with a fixed number of statements per table."""
+        return {name: self._bulk_load_table(name) for name in bulk_tables}
 
-            Model.objects.update_or_create(
-                **lookup,
-                defaults=defaults
-            )
+    def _row_load_table(self, name):
+        rows = len(self.frame.index)
+        with self.profiler.step(f"load.{name}", rows) as record:
+            getattr(self, f"_load_{name}")()
+            record["rows_out"] = rows
 
     def _load_student(self):
         # Load Students
@@ -368,17 +715,310 @@ class Load:
                         f"Foreign key values {missing_keys} for field '{fk_field}' are missing in {Model.__name__} table."
                     )
     
-    def load_data(self, frame, cat_frames):
+    def _row_hashes(self, frame):
+        """Hash every cleaned row, keyed by student id."""
+        hashes = pd.util.hash_pandas_object(frame, index=False).to_numpy().view('int64')
+        return pd.Series(hashes, index=frame['id'].to_numpy())
+
+    def _filter_changed(self):
+        """
+        Drop rows whose cleaned values hash the same as at the last load, leaving
+        only new and changed students in `self.frame`. Returns the counts and the
+        hashes to record once the changed rows are written.
+        """
+        frame = self.frame.drop_duplicates(subset=['id'], keep='last')
+        hashes = self._row_hashes(frame)
+        existing = dict(
+            StudentFingerprint.objects.filter(student_id__in=list(hashes.index))
+            .values_list('student_id', 'row_hash')
+        )
+        previous = pd.Series(existing, dtype='Int64').reindex(hashes.index)
+        is_new = previous.isna()
+        is_changed = ~is_new & (previous != hashes)
+        keep = (is_new | is_changed).to_numpy()
+
+        self.frame = frame[keep]
+        counts = {
+            "new": int(is_new.sum()),
+            "changed": int(is_changed.sum()),
+            "unchanged": int((~keep).sum()),
+        }
+        return counts, hashes[keep]
+
+    def _record_fingerprints(self, hashes):
+        with self.profiler.step("load.fingerprints", len(hashes)) as record:
+            fingerprints = pd.DataFrame({'student_id': hashes.index, 'row_hash': hashes.to_numpy()})
+            counts = self._bulk_upsert(StudentFingerprint._meta.db_table, fingerprints, ['student_id'])
+            record["rows_out"] = counts["inserted"] + counts["updated"]
+
+    def load_tables(self, hashes, bulk=False, checkpoint=None):
+        """
+        Load the selected rows into each student-level table, one transaction
+        per table, then record their fingerprints. With a `checkpoint`, tables
+        it lists as loaded are skipped and each table is recorded as it commits,
+        so a failed load resumes at the table that failed.
+        Returns the per-table row counts of bulk loads.
+        """
+        done = checkpoint.tables() if checkpoint is not None else {}
+        stats = {}
+        for name in bulk_tables:
+            if name in done:
+                logger.info(f"Skipping '{name}', loaded by an earlier attempt")
+                stats[name] = done[name]
+                continue
+            with transaction.atomic():
+                if bulk:
+                    stats[name] = self._bulk_load_table(name)
+                else:
+                    self._row_load_table(name)
+            if bulk:
+                self._report_tables({name: stats[name]})
+            else:
+                self._report("load", name, len(self.frame.index))
+            if checkpoint is not None:
+                checkpoint.record_table(name, stats.get(name))
+
+        # Fingerprints go last: until they are written, a delta run selects the same rows again
+        if "fingerprints" not in done:
+            with transaction.atomic():
+                self._record_fingerprints(hashes)
+            if checkpoint is not None:
+                checkpoint.record_table("fingerprints")
+        return stats
+
+    def load_dimensions(self, frame, cat_frames):
+        """
+        Add any new values in `frame` to the dimension tables and return the
+        value->id map for each category column.
+        """
         self.frame = frame
         self.cat_frames = cat_frames
-        cat_frames = [{name: self._prepare_cat_frame(name)} for name in self.cat_frames]
-        
+        with self.profiler.step("load.dimensions", len(frame.index)):
+            self.cat_maps = registry.resolve(frame, cat_frames)
+        return self.cat_maps
+
+    def select_rows(self, frame, delta=False):
+        """
+        Return the rows of `frame` to write, their row hashes and, with `delta`,
+        the new/changed/unchanged student counts.
+        """
+        self.frame = frame
+        with self.profiler.step("load.select_rows", len(frame.index)) as record:
+            if delta:
+                counts, hashes = self._filter_changed()
+            else:
+                counts = None
+                self.frame = frame.drop_duplicates(subset=['id'], keep='last')
+                hashes = self._row_hashes(self.frame)
+            record["rows_out"] = len(self.frame.index)
+        return self.frame, hashes, counts
+
+    def load_partition(self, frame, hashes, cat_frames, cat_maps):
+        """
+        Bulk load one slice of an upload whose dimensions are already loaded,
+        atomically with its fingerprints. Returns the per-table row counts.
+        The caller bumps the data version and schedules the view refresh once
+        its last slice is loaded.
+        """
+        self.frame = frame
+        self.cat_frames = cat_frames
+        self.cat_maps = cat_maps
+
         with transaction.atomic():
-        # Load categorical frames (AgeRange, Country, Experience, etc.)
-            for frame_dict in cat_frames:
-                self._load_cat_frame(frame_dict)
-
-        self._load_student()
-        self._load_motivation()
-        self._load_registration()
-        self._load_outcomes()
\ No newline at end of file
+            stats = self._bulk_load()
+            self._record_fingerprints(hashes)
+        self._report_tables(stats)
+        return stats
+
+    def load_data(self, frame, cat_frames, bulk=False, delta=False, checkpoint=None):
+        """
+        Load a cleaned frame. Dimension tables are always built from the whole
+        frame; with `delta`, only students whose cleaned row changed since the
+        last load are written to the student-level tables, each in its own
+        transaction (see `load_tables`). The data version that keys cached
+        dataset results is bumped once the tables are committed, and the views
+        of materialized datasets are refreshed in the background.
+        Returns a dict with the delta counts under "students" and, for bulk
+        loads, the per-table row counts under "tables".
+        """
+        stats = {}
+        self.load_dimensions(frame, cat_frames)
+        rows, hashes, counts = self.select_rows(frame, delta)
+        if checkpoint is not None:
+            counts = checkpoint.remember("students", counts)
+        if counts is not None:
+            stats["students"] = counts
+
+        tables = self.load_tables(hashes, bulk=bulk, checkpoint=checkpoint)
+        # Cached dataset results and materialized views built from the old rows are stale from here on
+        bump_data_version()
+        schedule_refresh()
+        if bulk:
+            stats["tables"] = tables
+        return stats
+
+    def load_chunks(self, chunks, cat_frames, delta=False):
+        """
+        Load an iterable of cleaned chunks without holding the whole upload.
+        Each chunk adds its new dimension values and bulk loads its student-level
+        rows in one transaction; dimension ids are stable, so the result is the
+        same as a full `load_data` run. Chunks are not checkpointed: if one
+        fails, those before it stay loaded and a rerun starts from the first
+        chunk, with `delta` skipping the students already written.
+        """
+        stats = {"tables": {name: {"inserted": 0, "updated": 0, "unchanged": 0} for name in bulk_tables}}
+        if delta:
+            stats["students"] = {"new": 0, "changed": 0, "unchanged": 0}
+
+        loaded = False
+        try:
+            for chunk in chunks:
+                cat_maps = self.load_dimensions(chunk, cat_frames)
+                rows, hashes, counts = self.select_rows(chunk, delta)
+                if counts is not None:
+                    self._add_counts(stats["students"], counts)
+                for name, table_counts in self.load_partition(rows, hashes, cat_frames, cat_maps).items():
+                    self._add_counts(stats["tables"][name], table_counts)
+                loaded = True
+        finally:
+            # Once per run, after the last chunk, or after the chunks that committed before a failure
+            if loaded:
+                bump_data_version()
+                schedule_refresh()
+        return stats
+
+    def _add_counts(self, totals, counts):
+        for key, value in counts.items():
+            totals[key] += value
+
+
+def run_pipeline(source, file_name, bulk=False, stream=False, chunk_size=default_chunk_size,
+                 workers=None, delta=True, progress=None, resume=True):
+    """
+    Run Extract, Transform and Load over one uploaded file and return a summary.
+    `progress`, if given, is called as progress(stage, key, rows) with the rows
+    each step has completed; counts for the same stage and key add up.
+    The summary's "profile" lists the time, rows, peak memory and SQL
+    statements of every step; it is also kept as an EtlRun.
+    Cleaned rows that fail validation are kept as QuarantinedRows instead of
+    being loaded and counted per reason under "quarantined".
+    Unless streaming, each stage and student-level table is checkpointed (see
+    pipeline.checkpoints) and, with `resume`, a run of a file whose last run
+    failed continues from its last completed stage or table. The summary's
+    "resumed" lists what was skipped.
+    """
+    profiler = Profiler(trace_memory=settings.ETL_PROFILE_MEMORY)
+    start = time.perf_counter()
+    try:
+        summary = _run_stages(source, file_name, profiler, bulk, stream, chunk_size, workers, delta, progress, resume)
+    finally:
+        profiler.close()
+
+    if not summary.get("skipped"):
+        summary["profile"] = profiler.report()
+        record_run(file_name, time.perf_counter() - start, summary["profile"])
+    return summary
+
+
+def _run_stages(source, file_name, profiler, bulk, stream, chunk_size, workers, delta, progress, resume):
+    extractor = Extract()
+    transformer = Transform(**transform_kwargs, profiler=profiler)
+    loader = Load(progress=progress, profiler=profiler)
+    report = progress or (lambda stage, key, rows: None)
+
+    with profiler.step("extract.fingerprint"):
+        sha256 = extractor.fingerprint(source)
+        seen = delta and Upload.objects.filter(sha256=sha256).exists()
+    if seen:
+        logger.info(f"File '{file_name}' matches a previous upload; nothing to load.")
+        return {
+            "message": f"File '{file_name}' is identical to a previous upload and was not reprocessed.",
+            "skipped": True,
+        }
+
+    quarantine = Quarantine(file_name, sha256)
+
+    def validate(frame):
+        with profiler.step("validate", len(frame.index)) as record:
+            valid = quarantine.split(frame)
+            record["rows_out"] = len(valid.index)
+        return valid
+
+    checkpoint = None
+    try:
+        if stream:
+            def clean_chunks():
+                chunks = extractor.iter_chunks(source, chunk_size)
+                while True:
+                    with profiler.step("extract") as record:
+                        chunk = next(chunks, None)
+                        record["rows_out"] = None if chunk is None else len(chunk.index)
+                    if chunk is None:
+                        return
+                    clean_chunk = transformer.clean_data(chunk)
+                    if clean_chunk is None:
+                        raise ValueError("Could not clean a chunk of the extracted data.")
+                    report("extract", "rows", len(chunk.index))
+                    report("transform", "rows", len(clean_chunk.index))
+                    yield validate(clean_chunk)
+
+            logger.info("Streaming data...")
+            load_stats = loader.load_chunks(clean_chunks(), category_columns, delta=delta)
+        else:
+            options = {"bulk": bulk, "delta": delta}
+            checkpoint = Checkpoint(sha256, options)
+            if not resume:
+                checkpoint.reset(sha256, options)
+            resumed = checkpoint.completed
+            if resumed:
+                logger.info(f"Resuming '{file_name}' after {', '.join(resumed)}")
+
+            if checkpoint.has_frame("transform"):
+                clean_data = checkpoint.load_frame("transform")
+            else:
+                if checkpoint.has_frame("extract"):
+                    raw_data = checkpoint.load_frame("extract")
+                else:
+                    logger.info("Extracting data...")
+                    with profiler.step("extract") as record:
+                        raw_data = extractor.merge_frames(source, workers=workers)
+                        if raw_data is not None:
+                            record["rows_out"] = len(raw_data.index)
+                    if raw_data is None:
+                        raise ValueError("Could not extract any sheets from the file.")
+                    checkpoint.save_frame("extract", raw_data)
+                report("extract", "rows", len(raw_data.index))
+
+                logger.info("Cleaning data...")
+                clean_data = transformer.clean_data(raw_data)
+                if clean_data is None:
+                    raise ValueError("Could not clean the extracted data.")
+                checkpoint.save_frame("transform", clean_data)
+            report("transform", "rows", len(clean_data.index))
+            clean_data = validate(clean_data)
+
+            logger.info("Loading data...")
+            load_stats = loader.load_data(clean_data, category_columns, bulk=bulk, delta=delta, checkpoint=checkpoint)
+
+        # The quarantine report is replaced only once the run has loaded
+        with transaction.atomic():
+            Upload.objects.get_or_create(sha256=sha256, defaults={"file_name": file_name})
+            quarantine.save()
+        if checkpoint is not None:
+            checkpoint.clear()
+
+        logger.info(f"ETL pipeline completed successfully for file '{file_name}'")
+        summary = {
+            "message": f"File '{file_name}' has been loaded to the database successfully."
+        }
+        if "students" in load_stats:
+            summary["students"] = load_stats["students"]
+        if "tables" in load_stats:
+            summary["rows"] = load_stats["tables"]
+        summary["quarantined"] = quarantine.summary()
+        if checkpoint is not None and resumed:
+            summary["resumed"] = resumed
+        return summary
+    finally:
+        if checkpoint is not None:
+            checkpoint.release()
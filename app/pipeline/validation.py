@@ -0,0 +1,144 @@
+"""
+Row-level validation of cleaned uploads.
+Every rule is checked across whole columns, on the distinct values of
+categorical columns where it can be, so validating costs a few vectorised
+passes however many rows fail. Rows that break a rule are written to the
+QuarantinedRow table with their reasons and left out of the load; the rest of
+the upload loads as usual.
+"""
+import logging
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+
+from .country_codes import resolve_countries
+from .models import QuarantinedRow
+
+
+logger = logging.getLogger(__name__)
+
+# Every cleaned column maps to a NOT NULL database column
+required_columns = [
+    'registration_date', 'registration_time', 'id', 'age_range', 'gender', 'country', 'referral',
+    'experience', 'track', 'hours_available', 'motivation', 'skill_level', 'skill_description',
+    'completed_aptitude', 'aptitude_score', 'graduated',
+]
+yes_no_columns = ['completed_aptitude', 'graduated']
+aptitude_score_range = (0, 100)
+
+
+def _isin(column, values):
+    """Row mask of `column` taking one of `values`, checked per category for categoricals."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        codes = column.cat.categories.isin(values).nonzero()[0]
+        return pd.Series(column.cat.codes.isin(codes).to_numpy(), index=column.index)
+    return column.isin(values)
+
+
+def _distinct(column):
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return pd.Series(column.cat.categories)
+    return pd.Series(column.dropna().unique())
+
+
+def _missing(column):
+    """Row mask of missing or blank values."""
+    distinct = _distinct(column)
+    if distinct.dtype == object or pd.api.types.is_string_dtype(distinct.dtype):
+        blanks = distinct[distinct.astype(str).str.strip() == ""]
+        return column.isna() | _isin(column, blanks)
+    return column.isna()
+
+
+def _unresolved_countries(column):
+    distinct = _distinct(column).astype(object)
+    codes, _ = resolve_countries(distinct)
+    return column.notna() & _isin(column, distinct[codes.isna().to_numpy()])
+
+
+def row_errors(frame):
+    """
+    Check every row of a cleaned frame. Returns a dict of reason -> row mask,
+    holding only the rules that at least one row broke.
+    """
+    checks = {f"missing {col}": _missing(frame[col]) for col in required_columns}
+    # Transform leaves aims whose first word it does not recognise missing
+    checks["missing or unknown aim"] = frame['aim'].isna()
+    checks["unknown country"] = _unresolved_countries(frame['country'])
+    for col in yes_no_columns:
+        checks[f"{col} is not Yes or No"] = frame[col].notna() & ~_isin(frame[col], ['Yes', 'No'])
+    low, high = aptitude_score_range
+    score = pd.to_numeric(frame['aptitude_score'], errors='coerce')
+    checks[f"aptitude_score outside {low}-{high}"] = (
+        frame['aptitude_score'].notna() & ~score.between(low, high)
+    )
+    return {reason: mask for reason, mask in checks.items() if mask.any()}
+
+
+class Quarantine:
+    """
+    Splits the valid rows of one upload from the invalid ones and keeps the
+    invalid rows until `save` writes them. Saving replaces the rows quarantined
+    by an earlier run of the same file, in the caller's transaction, so a
+    rerun or resumed run does not list them twice and a run that fails or is
+    skipped leaves the last report in place.
+    """
+
+    def __init__(self, file_name, sha256):
+        self.file_name = file_name
+        self.sha256 = sha256
+        self.rows = 0
+        self.reasons = Counter()
+        self.pending = []
+
+    def split(self, frame):
+        """Set aside the rows of `frame` that fail validation and return the others."""
+        errors = row_errors(frame)
+        if not errors:
+            return frame
+
+        # Uploads merged from several sheets can repeat index labels, so combine positionally
+        names = list(errors)
+        bad = np.column_stack([errors[name].fillna(False).to_numpy(dtype=bool) for name in names])
+        failed = bad.any(axis=1)
+        rejected = frame[failed]
+        bad = bad[failed]
+        reasons = [[name for name, broken in zip(names, row) if broken] for row in bad]
+        counts = dict(zip(names, bad.sum(axis=0).tolist()))
+        values = rejected.astype(object).where(rejected.notna(), None)
+
+        self.pending.extend(
+            QuarantinedRow(
+                file_name=self.file_name,
+                sha256=self.sha256,
+                student_id=row['id'] or "",
+                reasons=row_reasons,
+                row=row,
+            )
+            for row, row_reasons in zip(values.to_dict('records'), reasons)
+        )
+        self.rows += len(rejected.index)
+        self.reasons.update(counts)
+        logger.warning(f"Quarantined {len(rejected.index)} rows of '{self.file_name}': {counts}")
+        valid = frame[~failed]
+        # Values only the quarantined rows had must not reach the dimension tables
+        return valid.assign(**{
+            col: valid[col].cat.remove_unused_categories()
+            for col, dtype in valid.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)
+        })
+
+    def save(self):
+        """
+        Replace the file's earlier quarantined rows with this run's. Call it in
+        the transaction that commits the load.
+        """
+        with transaction.atomic():
+            QuarantinedRow.objects.filter(sha256=self.sha256).delete()
+            QuarantinedRow.objects.bulk_create(self.pending, batch_size=1000)
+        self.pending = []
+
+    def summary(self):
+        """Rows quarantined so far and how many broke each rule."""
+        return {"rows": self.rows, "reasons": dict(self.reasons)}
@@ -0,0 +1,145 @@
+"""
+Continuous ingestion from a drop folder.
+Files copied into ETL_WATCH_DIR are loaded once they stop changing: a file is
+ready when its size and modification time are the same on two polls and it
+has not been modified for ETL_WATCH_SETTLE_SECONDS. Each ready file is one
+micro-batch, bulk loaded with delta detection so only new and changed students
+are written, and is then moved to processed/ or, with a note of the error,
+failed/. At most ETL_WATCH_MAX_BATCHES batches run at once. A file that
+cannot be moved out after its batch is left where it is and not loaded again
+while it stays there.
+"""
+import os
+import time
+import logging
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .utils import run_pipeline
+
+
+logger = logging.getLogger(__name__)
+
+processed_dir = "processed"
+failed_dir = "failed"
+# Partial downloads, editor lock files and hidden files are never loaded
+ignored_prefixes = (".", "~$")
+ignored_suffixes = (".tmp", ".part", ".crdownload")
+
+
+class DropFolder:
+    """Tracks the files in a drop folder and hands out the ones that are ready."""
+
+    def __init__(self, directory, settle_seconds=None):
+        self.directory = directory
+        self.settle_seconds = settings.ETL_WATCH_SETTLE_SECONDS if settle_seconds is None else settle_seconds
+        self.sizes = {}
+        self.in_flight = set()
+        # Files whose batch ended but which could not be moved out of the folder
+        self.stuck = set()
+        for name in (processed_dir, failed_dir):
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+    def _candidates(self):
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or entry.name.startswith(ignored_prefixes):
+                    continue
+                if entry.name.endswith(ignored_suffixes):
+                    continue
+                yield entry
+
+    def poll(self):
+        """Return the paths that became ready since the last poll, oldest first."""
+        now = time.time()
+        current = {}
+        ready = []
+        for entry in self._candidates():
+            stat = entry.stat()
+            current[entry.path] = (stat.st_size, stat.st_mtime_ns)
+            unchanged = self.sizes.get(entry.path) == current[entry.path]
+            settled = now - stat.st_mtime >= self.settle_seconds
+            if unchanged and settled and entry.path not in self.in_flight:
+                ready.append((stat.st_mtime, entry.path))
+        self.sizes = current
+        # A stuck file that has since been removed may be dropped in again
+        self.stuck.intersection_update(current)
+        paths = [path for _, path in sorted(ready) if path not in self.stuck]
+        self.in_flight.update(paths)
+        return paths
+
+    def _move(self, path, folder):
+        stamp = timezone.now().strftime("%Y%m%dT%H%M%S%f")
+        target = os.path.join(self.directory, folder, f"{stamp}-{os.path.basename(path)}")
+        os.replace(path, target)
+        return target
+
+    def process(self, path):
+        """
+        Load one ready file and move it out of the drop folder. Returns the
+        pipeline summary, or None if the file failed.
+        """
+        name = os.path.basename(path)
+        start = time.perf_counter()
+        try:
+            try:
+                summary = run_pipeline(path, name, bulk=True, delta=True)
+            except Exception as e:
+                logger.error(f"Could not load dropped file '{name}': {e}", exc_info=True)
+                target = self._move(path, failed_dir)
+                with open(f"{target}.error", "w") as note:
+                    note.write(f"{e}\n")
+                return None
+            self._move(path, processed_dir)
+        except Exception:
+            if os.path.exists(path):
+                self.stuck.add(path)
+            raise
+        finally:
+            # Only forget the file once it has left the folder, so no poll picks it up twice
+            self.in_flight.discard(path)
+
+        logger.info(f"Loaded dropped file '{name}' in {time.perf_counter() - start:.2f}s: "
+                    f"{summary.get('students', summary['message'])}")
+        return summary
+
+
+def watch(directory, interval, max_batches, settle_seconds=None, once=False):
+    """
+    Poll `directory` every `interval` seconds and load ready files on up to
+    `max_batches` threads. With `once`, load what is ready and return.
+    """
+    folder = DropFolder(directory, settle_seconds)
+    logger.info(f"Watching '{directory}' for uploads")
+
+    def run(path):
+        try:
+            return folder.process(path)
+        finally:
+            # Pool threads outlive batches, so release their connections here
+            connections.close_all()
+
+    def report(path, batch):
+        # Failures inside a batch are logged by process; this catches the ones it could not handle
+        error = None if batch.cancelled() else batch.exception()
+        if error is not None:
+            logger.error(f"Batch for dropped file '{path}' failed: {error}", exc_info=error)
+
+    with ThreadPoolExecutor(max_workers=max_batches, thread_name_prefix="etl-watch") as executor:
+        # A file must be seen twice to count as settled
+        folder.poll()
+        while True:
+            time.sleep(interval)
+            batches = []
+            for path in folder.poll():
+                batch = executor.submit(run, path)
+                batch.add_done_callback(partial(report, path))
+                batches.append(batch)
+            if once:
+                for batch in batches:
+                    batch.result()
+                return
@@ -15,6 +15,9 @@ from psycopg import OperationalError as PsycopgError
 from django.db import connections, DEFAULT_DB_ALIAS
 from django.db.migrations.executor import MigrationExecutor
 
+from datasets.cache import dataset_frame
+from datasets.models import Dataset
+
 
 logger = logging.getLogger(__file__)
 
@@ -82,17 +85,12 @@ class VisualReportGenerator:
         frames = {}
         if not self.__django_migrations_pending():
             try: 
-                datasets = pd.read_sql(
-                """
-                SELECT name, category, description, query
-                FROM datasets_dataset
-                """, self.engine
-                )
-                for row in datasets.itertuples():
+                for dataset in Dataset.objects.all():
                     try:
-                        frames[row.name] = pd.read_sql(str(row.query), self.engine)
+                        # Served from the dataset result cache until the next ETL load
+                        frames[dataset.name] = dataset_frame(dataset)
                     except Exception as e:
-                        logger.exception("Query failed for dataset %s", row.name)
+                        logger.exception("Query failed for dataset %s", dataset.name)
                 return frames
             except Exception as e:
                 logger.exception("database not available, waiting 5 seconds...")